@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import threading
+from typing import Callable, Iterator, Optional
+
+from kubernetes import client, config
+
+logger = logging.getLogger(__name__)
+
+SERVICE_ACCOUNT_NAMESPACE_PATH = (
+    "/var/run/secrets/kubernetes.io/serviceaccount/namespace"
+)
+
+_api_client: Optional[client.ApiClient] = None
+_api_client_lock = threading.Lock()
+
+
+def _load_configuration(
+    connection_pool_maxsize: Optional[int] = None,
+) -> client.Configuration:
+    """Loads the kube config (or the in-cluster config) into a fresh
+    Configuration object, without touching the process-wide default."""
+    configuration = client.Configuration()
+    try:
+        config.load_kube_config(client_configuration=configuration)
+    except config.ConfigException:
+        config.load_incluster_config(client_configuration=configuration)
+
+    if connection_pool_maxsize is not None:
+        configuration.connection_pool_maxsize = connection_pool_maxsize
+
+    return configuration
+
+
+def get_api_client(
+    connection_pool_maxsize: Optional[int] = None,
+) -> client.ApiClient:
+    """
+    Returns the process-wide ApiClient, creating it on first use.
+
+    The client keeps a urllib3 connection pool with HTTP keep-alive, so
+    every request after the first one reuses an already established TLS
+    connection to the API server instead of paying for a new handshake
+    (or for a new kubectl process).
+
+    Args:
+        connection_pool_maxsize (int, optional): Size of the connection pool.
+            Only honoured when the client is created, so callers that submit
+            concurrently should pass their worker count on the first call.
+
+    Returns:
+        client.ApiClient: The shared API client.
+    """
+    global _api_client
+
+    if _api_client is None:
+        with _api_client_lock:
+            if _api_client is None:
+                _api_client = client.ApiClient(
+                    _load_configuration(connection_pool_maxsize)
+                )
+    return _api_client
+
+
+def get_batch_api() -> client.BatchV1Api:
+    return client.BatchV1Api(get_api_client())
+
+
+def get_core_api() -> client.CoreV1Api:
+    return client.CoreV1Api(get_api_client())
+
+
+def get_current_namespace() -> str:
+    """
+    Returns the namespace kubectl would use: the namespace of the active
+    kube config context, the service account namespace when running
+    in-cluster, or "default".
+    """
+    try:
+        _, active_context = config.list_kube_config_contexts()
+        namespace = active_context.get("context", {}).get("namespace")
+        if namespace:
+            return namespace
+    except config.ConfigException:
+        if os.path.exists(SERVICE_ACCOUNT_NAMESPACE_PATH):
+            with open(SERVICE_ACCOUNT_NAMESPACE_PATH) as f:
+                return f.read().strip()
+
+    return "default"
+
+
+def read_json_response(response) -> dict:
+    """Decodes a response obtained with ``_preload_content=False``.
+
+    Skipping the client's model deserialization keeps the objects as plain
+    dicts, in the same shape ``kubectl get -o json`` produces.
+    """
+    return json.loads(response.data)
+
+
+def list_pages(
+    list_fn: Callable, *args, limit: int = 500, **kwargs
+) -> Iterator[dict]:
+    """
+    Yields the pages of a list call as plain dicts, following the
+    limit/continue protocol until the last page.
+
+    Every page of a continued list is served from the same snapshot, so the
+    ``metadata.resourceVersion`` of any page is a valid starting point for a
+    watch.
+    """
+    _continue = None
+    while True:
+        response = list_fn(
+            *args,
+            limit=limit,
+            _continue=_continue,
+            _preload_content=False,
+            **kwargs,
+        )
+        page = read_json_response(response)
+        yield page
+        _continue = page.get("metadata", {}).get("continue")
+        if not _continue:
+            break
+
+
+def list_items(
+    list_fn: Callable, *args, limit: int = 500, **kwargs
+) -> Iterator[dict]:
+    """
+    Yields the items of a list call as plain dicts, one page at a time.
+
+    Pages of at most ``limit`` items are requested with the limit/continue
+    protocol, so memory use is bounded by the page size rather than by the
+    number of objects in the namespace. Selectors are passed through, e.g.
+    ``list_items(get_batch_api().list_namespaced_job, namespace,
+    label_selector="eidf/user=jane")``.
+
+    Args:
+        list_fn (Callable): A list method of a typed API, such as
+            BatchV1Api.list_namespaced_job.
+        limit (int): Maximum number of items per page. Defaults to 500.
+        *args, **kwargs: Passed to ``list_fn``.
+
+    Yields:
+        dict: The listed objects.
+    """
+    for page in list_pages(list_fn, *args, limit=limit, **kwargs):
+        yield from page.get("items") or []
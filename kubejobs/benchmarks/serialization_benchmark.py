@@ -0,0 +1,89 @@
+import json
+import logging
+import timeit
+
+import fire
+import yaml
+from rich.console import Console
+from rich.table import Table
+
+from kubejobs.jobs import GPU_PRODUCT, KubernetesJob, KueueQueue
+from kubejobs.serialization import to_json, to_yaml
+
+
+class PurePythonDumper(yaml.SafeDumper):
+    def ignore_aliases(self, data):
+        return True
+
+
+def build_job() -> KubernetesJob:
+    return KubernetesJob(
+        name="benchmark",
+        image="nvcr.io/nvidia/cuda:12.0.0-cudnn8-devel-ubuntu22.04",
+        kueue_queue_name=KueueQueue.INFORMATICS,
+        command=["/bin/bash", "-c", "--"],
+        args=["python train.py --lr 1e-3 --batch-size 256"],
+        gpu_type="nvidia.com/gpu",
+        gpu_product=GPU_PRODUCT.NVIDIA_A100_SXM4_80GB,
+        gpu_limit=1,
+        env_vars={f"VAR_{idx}": f"value-{idx}" for idx in range(10)},
+        volume_mounts={
+            "data": {"pvc": "data-pvc", "mountPath": "/data"},
+            "nfs": {"mountPath": "/nfs", "server": "10.24.1.255", "path": "/"},
+        },
+    )
+
+
+def run_benchmark(number: int = 2000):
+    """
+    Measures the per-manifest cost of each manifest serialization backend.
+
+    Args:
+        number (int): Number of manifests serialized per backend.
+    """
+    logging.getLogger("kubejobs.jobs").setLevel(logging.WARNING)
+    job = build_job()
+    manifest = job.generate_dict()
+
+    backends = {
+        "generate_dict": job.generate_dict,
+        "json (stdlib)": lambda: json.dumps(job.generate_dict()),
+        "generate_json": job.generate_json,
+        "yaml (pure Python)": lambda: yaml.dump(
+            job.generate_dict(), Dumper=PurePythonDumper
+        ),
+        "generate_yaml": job.generate_yaml,
+        "yaml.dump + safe_load round trip (old run path)": lambda: yaml.safe_load(
+            yaml.dump(job.generate_dict())
+        ),
+    }
+
+    table = Table(title=f"Manifest serialization, {number} manifests each")
+    table.add_column("Backend", style="cyan")
+    table.add_column("µs / manifest", justify="right", style="magenta")
+    table.add_column("Output bytes", justify="right")
+
+    sizes = {
+        "generate_json": len(to_json(manifest)),
+        "json (stdlib)": len(json.dumps(manifest)),
+        "generate_yaml": len(to_yaml(manifest)),
+        "yaml (pure Python)": len(
+            yaml.dump(manifest, Dumper=PurePythonDumper)
+        ),
+    }
+    for name, fn in backends.items():
+        seconds = timeit.timeit(fn, number=number)
+        table.add_row(
+            name,
+            f"{seconds / number * 1e6:.1f}",
+            str(sizes.get(name, "-")),
+        )
+
+    Console().print(table)
+    Console().print(
+        f"libyaml available: {yaml.__with_libyaml__}",
+    )
+
+
+if __name__ == "__main__":
+    fire.Fire(run_benchmark)
@@ -0,0 +1,233 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Tuple
+
+from kubernetes import client, config
+
+from kubejobs.api import (
+    get_api_client,
+    get_core_api,
+    get_current_namespace,
+    list_items,
+)
+from kubejobs.quantity import GIGABYTE, parse_quantity
+
+logger = logging.getLogger(__name__)
+
+GPU_RESOURCE = "nvidia.com/gpu"
+GPU_PRODUCT_LABEL = "nvidia.com/gpu.product"
+KUEUE_GROUP = "kueue.x-k8s.io"
+KUEUE_VERSION = "v1beta1"
+
+# How long discovered capacity is reused before the nodes are listed again
+DEFAULT_CAPACITY_TTL = 300.0
+# Seconds to wait for the API server, so that an unreachable cluster only
+# delays the fallback to the static defaults
+REQUEST_TIMEOUT = 10
+
+
+@dataclass(frozen=True)
+class NodeShape:
+    """Allocatable resources of a single node."""
+
+    cpu: float
+    memory_gb: float
+    gpus: int
+
+
+@dataclass
+class ClusterCapacity:
+    """
+    Allocatable GPUs per GPU product, and the largest node shape of each
+    product, as reported by the schedulable, ready nodes of the cluster.
+    """
+
+    gpus: Dict[str, int] = field(default_factory=dict)
+    node_shapes: Dict[str, NodeShape] = field(default_factory=dict)
+    fetched_at: float = field(default_factory=time.monotonic)
+
+
+def _is_schedulable(node: dict) -> bool:
+    if (node.get("spec") or {}).get("unschedulable"):
+        return False
+    return any(
+        condition.get("type") == "Ready" and condition.get("status") == "True"
+        for condition in (node.get("status") or {}).get("conditions") or []
+    )
+
+
+def capacity_from_nodes(nodes: Iterable[dict]) -> ClusterCapacity:
+    """Builds a ClusterCapacity from node objects, ignoring cordoned and not
+    ready nodes and nodes without a GPU product label."""
+    capacity = ClusterCapacity()
+    for node in nodes:
+        product = (node["metadata"].get("labels") or {}).get(GPU_PRODUCT_LABEL)
+        if product is None or not _is_schedulable(node):
+            continue
+
+        allocatable = (node.get("status") or {}).get("allocatable") or {}
+        shape = NodeShape(
+            cpu=parse_quantity(allocatable.get("cpu", "0")),
+            memory_gb=parse_quantity(allocatable.get("memory", "0"))
+            / GIGABYTE,
+            gpus=int(parse_quantity(allocatable.get(GPU_RESOURCE, "0"))),
+        )
+        capacity.gpus[product] = capacity.gpus.get(product, 0) + shape.gpus
+
+        largest = capacity.node_shapes.get(product)
+        if largest is None or shape.gpus > largest.gpus:
+            capacity.node_shapes[product] = shape
+
+    return capacity
+
+
+def fetch_cluster_capacity() -> ClusterCapacity:
+    """Lists the nodes of the cluster and builds their capacity. Needs
+    permission to list nodes."""
+    return capacity_from_nodes(
+        list_items(get_core_api().list_node, _request_timeout=REQUEST_TIMEOUT)
+    )
+
+
+_capacity: Optional[ClusterCapacity] = None
+_capacity_checked_at: Optional[float] = None
+_capacity_lock = threading.Lock()
+
+
+def get_cluster_capacity(
+    ttl: float = DEFAULT_CAPACITY_TTL,
+    refresh: bool = False,
+    fetch: bool = True,
+) -> Optional[ClusterCapacity]:
+    """
+    Returns the cluster capacity, listing the nodes at most once per ``ttl``
+    seconds. With ``fetch`` False, never lists them and only returns a
+    capacity discovered earlier in the process, if any.
+
+    Returns:
+        ClusterCapacity | None: The capacity, or None when the nodes cannot
+            be listed (no cluster configured, or no permission to list
+            nodes). Failures are cached for ``ttl`` seconds too, so callers
+            can fall back to static defaults without retrying on every call.
+    """
+    global _capacity, _capacity_checked_at
+
+    with _capacity_lock:
+        now = time.monotonic()
+        if (
+            not refresh
+            and _capacity_checked_at is not None
+            and now - _capacity_checked_at < ttl
+        ):
+            return _capacity
+        if not fetch:
+            return None
+
+        try:
+            _capacity = fetch_cluster_capacity()
+        except (client.ApiException, config.ConfigException) as e:
+            logger.debug(f"Could not discover the cluster capacity: {e}")
+            _capacity = None
+        except Exception as e:
+            logger.debug(f"Could not reach the cluster: {e!r}")
+            _capacity = None
+        _capacity_checked_at = now
+        return _capacity
+
+
+def gpu_capacity(
+    fallback: Dict[str, int], ttl: float = DEFAULT_CAPACITY_TTL
+) -> Dict[str, int]:
+    """Returns the allocatable GPUs per product, or ``fallback`` when they
+    cannot be discovered."""
+    capacity = get_cluster_capacity(ttl)
+    if capacity is None or not capacity.gpus:
+        return dict(fallback)
+    return dict(capacity.gpus)
+
+
+def node_shape(
+    gpu_product: Optional[str],
+    fallback: NodeShape,
+    ttl: float = DEFAULT_CAPACITY_TTL,
+    fetch: bool = True,
+) -> NodeShape:
+    """Returns the largest node shape offering ``gpu_product``, or
+    ``fallback`` when it cannot be discovered. With ``fetch`` False, only a
+    capacity already discovered is used, see get_cluster_capacity."""
+    if gpu_product is None:
+        return fallback
+    capacity = get_cluster_capacity(ttl, fetch=fetch)
+    if capacity is None or gpu_product not in capacity.node_shapes:
+        return fallback
+    return capacity.node_shapes[gpu_product]
+
+
+_queue_quotas: Dict[Tuple[str, str, str], Tuple[float, Optional[int]]] = {}
+
+
+def _fetch_queue_gpu_quota(
+    local_queue: str, namespace: str, resource: str
+) -> Optional[int]:
+    custom_api = client.CustomObjectsApi(get_api_client())
+    queue = custom_api.get_namespaced_custom_object(
+        KUEUE_GROUP,
+        KUEUE_VERSION,
+        namespace,
+        "localqueues",
+        local_queue,
+        _request_timeout=REQUEST_TIMEOUT,
+    )
+    cluster_queue = custom_api.get_cluster_custom_object(
+        KUEUE_GROUP,
+        KUEUE_VERSION,
+        "clusterqueues",
+        queue["spec"]["clusterQueue"],
+        _request_timeout=REQUEST_TIMEOUT,
+    )
+    return sum(
+        int(parse_quantity(quota["nominalQuota"]))
+        for group in cluster_queue["spec"].get("resourceGroups", [])
+        for flavor in group.get("flavors", [])
+        for quota in flavor.get("resources", [])
+        if quota.get("name") == resource
+    )
+
+
+def queue_gpu_quota(
+    local_queue: str,
+    namespace: Optional[str] = None,
+    resource: str = GPU_RESOURCE,
+    ttl: float = DEFAULT_CAPACITY_TTL,
+) -> Optional[int]:
+    """
+    Returns the nominal GPU quota of the Kueue ClusterQueue a LocalQueue
+    submits to, summed over its resource flavors. Cached for ``ttl``
+    seconds.
+
+    Returns:
+        int | None: The quota, or None when the queues cannot be read.
+    """
+    namespace = namespace or get_current_namespace()
+    key = (local_queue, namespace, resource)
+
+    with _capacity_lock:
+        now = time.monotonic()
+        cached = _queue_quotas.get(key)
+        if cached is not None and now - cached[0] < ttl:
+            return cached[1]
+
+        try:
+            quota = _fetch_queue_gpu_quota(local_queue, namespace, resource)
+        except (client.ApiException, config.ConfigException, KeyError) as e:
+            logger.debug(
+                f"Could not read the quota of queue {local_queue}: {e}"
+            )
+            quota = None
+        except Exception as e:
+            logger.debug(f"Could not reach the cluster: {e!r}")
+            quota = None
+        _queue_quotas[key] = (now, quota)
+        return quota
@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Set, Union
+
+from kubejobs.informer import JOBS, PODS, PVCS, object_key
+from kubejobs.pvc_usage import ACTIVE_POD_PHASES, claim_names
+
+logger = logging.getLogger(__name__)
+
+# Job conditions after which a job's pods no longer run
+FINISHED_CONDITIONS = ("Complete", "Failed")
+# Seconds a job bound in this process may take to appear in the informer's
+# cache before resync treats it as gone and drops its lease
+UNSEEN_JOB_GRACE = 300.0
+
+
+def job_finished(job: dict) -> bool:
+    return any(
+        condition.get("type") in FINISHED_CONDITIONS
+        and condition.get("status") == "True"
+        for condition in (job.get("status") or {}).get("conditions") or []
+    )
+
+
+class PVCPool:
+    """
+    Hands out the PVCs of a namespace whose name contains ``pvc_prefix``,
+    one experiment per PVC, through leases kept in memory.
+
+    A PVC is leased from the moment it is acquired, before its job exists,
+    so two launches can never get the same ReadWriteOnce claim. The lease
+    is bound to the job once it is submitted and released from the watch
+    events of an informer: when a pod of the job succeeds, or the job
+    finishes or is deleted. A failed pod does not release it, since the
+    job may retry it on the same claim.
+
+    The pool is updated from events instead of scanning the pods on every
+    allocation: free PVCs are kept in insertion order, so acquiring and
+    releasing are O(1), and released PVCs are handed out last, spreading
+    the experiments over all of them. PVCs mounted by active pods outside
+    the pool's leases are not handed out either.
+
+    Args:
+        informer (ClusterInformer): Informer following the pods, jobs and
+            PVCs of the namespace.
+        pvc_prefix (str): Only PVCs whose name contains it are used.
+        state_path (str | Path, optional): JSON file the leases are saved
+            to on every change and restored from, so a restarted launcher
+            does not hand out the PVCs of jobs that are still running.
+            Defaults to None, keeping the leases in memory only.
+        unseen_job_grace (float): Seconds a job bound by this pool may be
+            missing from the informer's cache, while its watch event is on
+            the way, before resync drops its lease. Defaults to
+            UNSEEN_JOB_GRACE.
+
+    Example:
+
+    .. code-block:: python
+
+        pool = PVCPool(get_informer(), "gate", state_path="leases.json")
+        pvc = pool.acquire("exp-001")
+        job = submit_on(pvc)
+        pool.bind(pvc, job.name)
+    """
+
+    def __init__(
+        self,
+        informer,
+        pvc_prefix: str,
+        state_path: Optional[Union[str, Path]] = None,
+        unseen_job_grace: float = UNSEEN_JOB_GRACE,
+    ):
+        self.informer = informer
+        self.pvc_prefix = pvc_prefix
+        self.unseen_job_grace = unseen_job_grace
+        self.state_path = (
+            Path(state_path).expanduser() if state_path is not None else None
+        )
+        self.condition = threading.Condition()
+        self._claims: Set[str] = set()
+        # Claim -> active pods mounting it
+        self._mounts: Dict[str, Set[str]] = {}
+        # Claim -> {"holder", "job", "acquired_at"}
+        self._leases: Dict[str, dict] = {}
+        # Job name -> claim, for the bound leases
+        self._jobs: Dict[str, str] = {}
+        # Job name -> time.monotonic() of its binding, for the jobs bound in
+        # this process that the informer has not reported yet
+        self._unseen: Dict[str, float] = {}
+        # Claims neither leased nor mounted, in the order they are handed out
+        self._free: "OrderedDict[str, None]" = OrderedDict()
+        # Claims leased or mounted
+        self._busy: Set[str] = set()
+
+        if self.state_path is not None and self.state_path.exists():
+            self._leases = json.loads(self.state_path.read_text())
+        informer.add_event_handler(self._on_event)
+        self.resync()
+
+    def _update(self, claim: str):
+        # Moves a claim between the free and busy sets after a change
+        busy = claim in self._leases or bool(self._mounts.get(claim))
+        if busy or claim not in self._claims:
+            self._free.pop(claim, None)
+        elif claim not in self._free:
+            self._free[claim] = None
+            self.condition.notify_all()
+        if busy:
+            self._busy.add(claim)
+        elif claim in self._busy:
+            self._busy.discard(claim)
+            self.condition.notify_all()
+
+    def _save(self):
+        if self.state_path is None:
+            return
+        temporary = self.state_path.with_name(self.state_path.name + ".tmp")
+        temporary.write_text(json.dumps(self._leases))
+        os.replace(temporary, self.state_path)
+
+    def resync(self):
+        """
+        Rebuilds the pool from the informer's caches, and drops the leases
+        whose job finished or no longer exists, or that were never bound
+        to a job. Only needed after missing events, or when restoring
+        leases.
+
+        A job bound in this process that the informer has not reported yet
+        keeps its lease for ``unseen_job_grace`` seconds after binding, as
+        its watch event usually arrives after the binding.
+        """
+        with self.condition:
+            self._claims = {
+                pvc["metadata"]["name"]
+                for pvc in self.informer.pvcs.list()
+                if self.pvc_prefix in pvc["metadata"]["name"]
+            }
+            self._mounts = {}
+            for pod in self.informer.pods.list():
+                self._track_pod(pod, deleted=False)
+            namespace = self.informer.namespace
+            now = time.monotonic()
+            for claim, lease in list(self._leases.items()):
+                job = lease["job"] and self.informer.jobs.get(
+                    lease["job"], namespace
+                )
+                if job:
+                    self._unseen.pop(lease["job"], None)
+                elif (
+                    lease["job"] in self._unseen
+                    and now - self._unseen[lease["job"]]
+                    < self.unseen_job_grace
+                ):
+                    # Submitted by this process, not reported yet
+                    continue
+                if lease["job"] is None or not job or job_finished(job):
+                    if lease["job"] is None and claim in self._busy:
+                        # Being submitted in this process
+                        continue
+                    self._unseen.pop(lease["job"], None)
+                    del self._leases[claim]
+            self._jobs = {
+                lease["job"]: claim
+                for claim, lease in self._leases.items()
+                if lease["job"] is not None
+            }
+            self._free = OrderedDict()
+            self._busy = set()
+            for claim in sorted(self._claims | set(self._leases)):
+                self._update(claim)
+            self._save()
+
+    def _track_pod(self, pod: dict, deleted: bool):
+        active = (
+            not deleted
+            and (pod.get("status") or {}).get("phase") in ACTIVE_POD_PHASES
+        )
+        key = object_key(pod)
+        for claim in claim_names(pod):
+            if self.pvc_prefix not in claim:
+                continue
+            pods = self._mounts.setdefault(claim, set())
+            if active:
+                pods.add(key)
+            else:
+                pods.discard(key)
+
+    def _release_job(self, job_name: str):
+        self._unseen.pop(job_name, None)
+        claim = self._jobs.pop(job_name, None)
+        if claim is not None:
+            del self._leases[claim]
+            self._update(claim)
+            self._save()
+
+    def _on_event(self, kind: str, event_type: str, obj: dict):
+        name = obj["metadata"]["name"]
+        with self.condition:
+            if kind == PVCS:
+                if self.pvc_prefix not in name:
+                    return
+                if event_type == "DELETED":
+                    self._claims.discard(name)
+                else:
+                    self._claims.add(name)
+                self._update(name)
+            elif kind == PODS:
+                self._track_pod(obj, deleted=event_type == "DELETED")
+                job_name = (obj["metadata"].get("labels") or {}).get(
+                    "job-name"
+                )
+                phase = (obj.get("status") or {}).get("phase")
+                if job_name and phase == "Succeeded":
+                    self._release_job(job_name)
+                for claim in claim_names(obj):
+                    if self.pvc_prefix in claim:
+                        self._update(claim)
+            elif kind == JOBS:
+                if event_type == "DELETED" or job_finished(obj):
+                    self._release_job(name)
+                else:
+                    self._unseen.pop(name, None)
+
+    @property
+    def leases(self) -> Dict[str, dict]:
+        """The leased claims, mapped to their holder, job and the time they
+        were acquired."""
+        with self.condition:
+            return {
+                claim: dict(lease) for claim, lease in self._leases.items()
+            }
+
+    @property
+    def busy(self) -> int:
+        """Number of claims leased or mounted by an active pod."""
+        with self.condition:
+            return len(self._busy)
+
+    def acquire(
+        self,
+        holder: str,
+        max_busy: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional[str]:
+        """
+        Leases a free claim to ``holder``, waiting for one if needed.
+
+        Args:
+            holder (str): Who the claim is leased to, e.g. an experiment.
+            max_busy (int, optional): Only lease a claim while fewer claims
+                are busy. Defaults to no limit.
+            timeout (float, optional): Seconds to wait at most. Defaults to
+                waiting until a claim is free.
+
+        Returns:
+            Optional[str]: The claim, or None if none was free in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while not self._free or (
+                max_busy is not None and len(self._busy) >= max_busy
+            ):
+                remaining = (
+                    None if deadline is None else deadline - time.monotonic()
+                )
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            claim, _ = self._free.popitem(last=False)
+            self._leases[claim] = {
+                "holder": holder,
+                "job": None,
+                "acquired_at": time.time(),
+            }
+            self._update(claim)
+            self._save()
+            return claim
+
+    def bind(self, claim: str, job_name: str):
+        """Binds the lease of a claim to the job submitted on it, which
+        releases it when the job finishes."""
+        with self.condition:
+            self._leases[claim]["job"] = job_name
+            self._jobs[job_name] = claim
+            self._save()
+            # The job may have finished before it was bound, or not have
+            # been reported by the informer yet
+            job = self.informer.jobs.get(job_name, self.informer.namespace)
+            if job is None:
+                self._unseen[job_name] = time.monotonic()
+            elif job_finished(job):
+                self._release_job(job_name)
+
+    def release(self, claim: str):
+        """Releases the lease of a claim, e.g. when its submission
+        failed."""
+        with self.condition:
+            lease = self._leases.pop(claim, None)
+            if lease is not None:
+                self._jobs.pop(lease["job"], None)
+                self._unseen.pop(lease["job"], None)
+                self._update(claim)
+                self._save()
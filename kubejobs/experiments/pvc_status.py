@@ -1,10 +1,12 @@
 import re
-import subprocess
 from dataclasses import dataclass
 from typing import List, Optional
 
 from rich import print
 
+from kubejobs.informer import get_informer
+from kubejobs.pvc_usage import PVCUsageIndex
+
 
 @dataclass
 class PVCStatus:
@@ -12,10 +14,9 @@ class PVCStatus:
     in_use: List[str]
 
 
-import json
-
-
-def get_pvc_status(unique_identifier: Optional[str] = None) -> PVCStatus:
+def get_pvc_status(
+    unique_identifier: Optional[str] = None, namespace: Optional[str] = None
+) -> PVCStatus:
     """
     This function returns a PVCStatus object containing the status of Persistent Volume Claims (PVCs) in a Kubernetes cluster.
     The PVCStatus has two attributes: 'available' and 'in-use', each containing a list of PVCs in the respective status.
@@ -33,39 +34,10 @@ def get_pvc_status(unique_identifier: Optional[str] = None) -> PVCStatus:
                 return name, int(index)
         return pvc, 0
 
-    # Function to run a subprocess and return the stdout as a list
-    def run_subprocess(command):
-        result = subprocess.run(command, capture_output=True, text=True)
-        return result.stdout.split()
-
-    # Function to run a subprocess and return the stdout as a JSON object
-    def run_subprocess_json(command):
-        result = subprocess.run(command, capture_output=True, text=True)
-        return json.loads(result.stdout)
-
-    # Get all PVCs and Pods
-    pvcs = run_subprocess(
-        ["kubectl", "get", "pvc", "-o", "jsonpath={.items[*].metadata.name}"]
-    )
-    pods = run_subprocess_json(["kubectl", "get", "pods", "-o", "json"])
-
-    # Create a dictionary to store PVC usage status
-    pvc_usage = {pvc: False for pvc in pvcs}
-
-    # Check each pod for PVC usage
-    for pod in pods["items"]:
-        if pod["status"]["phase"].lower() not in [
-            "running",
-            "containercreating",
-            "pending",
-        ]:
-            continue
-        for volume in pod["spec"].get("volumes", []):
-            pvc = volume.get("persistentVolumeClaim")
-            if pvc:
-                pvc_name = pvc["claimName"]
-                if pvc_name in pvc_usage:
-                    pvc_usage[pvc_name] = True
+    # PVCs and pods are read from the shared informer, which keeps them
+    # up to date from a watch instead of listing them on every call
+    index = PVCUsageIndex.from_informer(get_informer(namespace))
+    pvc_usage = {pvc: index.in_use(pvc) for pvc in index.claims}
 
     # Create a dictionary to store PVCs by usage status
     pvc_status = {"available": [], "in-use": []}
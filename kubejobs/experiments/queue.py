@@ -0,0 +1,336 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from kubejobs.api import get_batch_api, get_current_namespace, list_items
+from kubejobs.informer import JOBS
+
+PENDING = "pending"
+SUBMITTED = "submitted"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+STATES = (PENDING, SUBMITTED, RUNNING, SUCCEEDED, FAILED)
+
+# Labels put on the jobs of a queue, to find them with one list on resume
+SWEEP_LABEL = "kubejobs/sweep"
+EXPERIMENT_LABEL = "kubejobs/experiment"
+ATTEMPT_LABEL = "kubejobs/attempt"
+
+_LABEL_VALUE = re.compile(r"^[A-Za-z0-9]([A-Za-z0-9_.-]{0,61}[A-Za-z0-9])?$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    sweep TEXT NOT NULL,
+    name TEXT NOT NULL,
+    label TEXT NOT NULL,
+    command TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempt INTEGER NOT NULL DEFAULT 0,
+    job_name TEXT,
+    job_uid TEXT,
+    pvc TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (sweep, name)
+);
+CREATE INDEX IF NOT EXISTS experiments_state ON experiments (sweep, state);
+CREATE INDEX IF NOT EXISTS experiments_label ON experiments (sweep, label);
+"""
+
+
+def label_value(name: str) -> str:
+    """Returns ``name`` if it is a valid label value, else a stable hash of
+    it that is one."""
+    if _LABEL_VALUE.match(name):
+        return name
+    return hashlib.sha1(name.encode()).hexdigest()[:40]
+
+
+def job_state(job: dict) -> str:
+    """Maps the status of a job to an experiment state."""
+    status = job.get("status") or {}
+    for condition in status.get("conditions") or []:
+        if condition.get("status") != "True":
+            continue
+        if condition.get("type") == "Complete":
+            return SUCCEEDED
+        if condition.get("type") == "Failed":
+            return FAILED
+    if status.get("active"):
+        return RUNNING
+    return SUBMITTED
+
+
+class ExperimentQueue:
+    """
+    A durable queue of the experiments of a sweep, kept in a local SQLite
+    database, recording the state of every experiment and the job running
+    it.
+
+    The jobs of the sweep are labelled with SWEEP_LABEL, EXPERIMENT_LABEL
+    and ATTEMPT_LABEL, so after a restart ``reconcile`` brings every
+    experiment up to date with a single labelled list of jobs, including jobs
+    created just before the launcher died and never recorded. Resuming
+    therefore never submits an experiment twice.
+
+    Args:
+        path (str | Path): SQLite database file, created if missing.
+        sweep (str, optional): Name of the sweep, used as the SWEEP_LABEL
+            value. Defaults to the file name without its extension.
+
+    Example:
+
+    .. code-block:: python
+
+        queue = ExperimentQueue("sweep.db")
+        queue.reconcile()
+        for name, command in queue.stream(iter_commands_input(sys.stdin)):
+            ...
+    """
+
+    def __init__(self, path: Union[str, Path], sweep: Optional[str] = None):
+        self.path = Path(path).expanduser()
+        self.sweep = label_value(sweep or self.path.stem)
+        self._connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # With WAL, commits survive a crash of the launcher without an fsync
+        # each, so experiments can be recorded one at a time
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, parameters: Iterable = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._connection.execute(sql, tuple(parameters))
+
+    def _executemany(self, sql: str, rows: Iterable[Tuple]) -> int:
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            return self._connection.executemany(sql, rows).rowcount
+
+    def add(self, experiments: Iterable[Tuple[str, str]]) -> int:
+        """
+        Adds (name, command) pairs as pending experiments, in one
+        transaction. Experiments already in the queue are left as they are,
+        so adding the same commands again is harmless.
+
+        Returns:
+            int: Number of experiments added.
+        """
+        now = time.time()
+        return self._executemany(
+            "INSERT OR IGNORE INTO experiments "
+            "(sweep, name, label, command, state, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (self.sweep, name, label_value(name), command, PENDING, now)
+                for name, command in experiments
+            ),
+        )
+
+    def labels(self, name: str) -> Dict[str, str]:
+        """The labels to put on the job of an experiment."""
+        (attempt,) = self._execute(
+            "SELECT attempt FROM experiments WHERE sweep = ? AND name = ?",
+            (self.sweep, name),
+        ).fetchone()
+        return {
+            SWEEP_LABEL: self.sweep,
+            EXPERIMENT_LABEL: label_value(name),
+            ATTEMPT_LABEL: str(attempt),
+        }
+
+    def pending(self, batch_size: int = 1000) -> Iterator[Tuple[str, str]]:
+        """Yields the (name, command) of the pending experiments, in the
+        order they were added, reading ``batch_size`` rows at a time."""
+        last_rowid = -1
+        while True:
+            rows = self._execute(
+                "SELECT rowid, name, command FROM experiments "
+                "WHERE sweep = ? AND state = ? AND rowid > ? "
+                "ORDER BY rowid LIMIT ?",
+                (self.sweep, PENDING, last_rowid, batch_size),
+            ).fetchall()
+            for last_rowid, name, command in rows:
+                yield name, command
+            if len(rows) < batch_size:
+                return
+
+    def stream(
+        self, experiments: Iterable[Tuple[str, str]], batch_size: int = 1000
+    ) -> Iterator[Tuple[str, str]]:
+        """
+        Yields the experiments to launch: first those already pending, read
+        ``batch_size`` at a time, then those of ``experiments`` that were not
+        in the queue yet. Each of these is recorded and yielded as soon as it
+        is read, so a slowly produced input is launched as it comes. Memory
+        use does not grow with the size of the sweep.
+        """
+        yield from self.pending(batch_size)
+        for name, command in experiments:
+            if self._execute(
+                "INSERT OR IGNORE INTO experiments "
+                "(sweep, name, label, command, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self.sweep,
+                    name,
+                    label_value(name),
+                    command,
+                    PENDING,
+                    time.time(),
+                ),
+            ).rowcount:
+                yield name, command
+
+    def mark_submitted(
+        self, name: str, job_name: str, job_uid: str, pvc: Optional[str]
+    ):
+        # Job events may already have moved the experiment further along
+        self._execute(
+            "UPDATE experiments SET "
+            "state = CASE WHEN state = ? THEN ? ELSE state END, "
+            "job_name = ?, job_uid = ?, pvc = ?, error = NULL, updated_at = ? "
+            "WHERE sweep = ? AND name = ?",
+            (
+                PENDING,
+                SUBMITTED,
+                job_name,
+                job_uid,
+                pvc,
+                time.time(),
+                self.sweep,
+                name,
+            ),
+        )
+
+    def mark_failed(self, name: str, error: str):
+        self._execute(
+            "UPDATE experiments SET state = ?, error = ?, updated_at = ? "
+            "WHERE sweep = ? AND name = ?",
+            (FAILED, error, time.time(), self.sweep, name),
+        )
+
+    def _job_row(self, job: dict) -> Optional[Tuple]:
+        metadata = job["metadata"]
+        labels = metadata.get("labels") or {}
+        if labels.get(SWEEP_LABEL) != self.sweep:
+            return None
+        return (
+            job_state(job),
+            metadata["name"],
+            metadata.get("uid"),
+            time.time(),
+            self.sweep,
+            labels.get(EXPERIMENT_LABEL),
+            labels.get(ATTEMPT_LABEL),
+        )
+
+    _UPDATE_FROM_JOB = (
+        "UPDATE experiments SET state = ?, job_name = ?, job_uid = ?, "
+        "error = NULL, updated_at = ? "
+        "WHERE sweep = ? AND label = ? AND attempt = CAST(? AS INTEGER)"
+    )
+
+    def update_from_job(self, job: dict):
+        """Records the state of a job, if it runs the current attempt of an
+        experiment of this sweep."""
+        row = self._job_row(job)
+        if row is not None:
+            self._execute(self._UPDATE_FROM_JOB, row)
+
+    def reconcile(self, namespace: Optional[str] = None) -> Dict[str, int]:
+        """
+        Brings the queue up to date with the jobs of the sweep, listed once
+        by label.
+
+        Jobs of the current attempt of an experiment are adopted even if
+        they were never recorded, e.g. when the launcher died right after
+        creating them. Experiments recorded as submitted or running whose
+        job no longer exists are marked failed.
+
+        Returns:
+            Dict[str, int]: Number of experiments per state afterwards.
+        """
+        namespace = namespace or get_current_namespace()
+        jobs = list_items(
+            get_batch_api().list_namespaced_job,
+            namespace,
+            label_selector=f"{SWEEP_LABEL}={self.sweep}",
+        )
+        # The newest job of each attempt of each experiment
+        newest: Dict[Tuple[str, str], dict] = {}
+        for job in jobs:
+            labels = job["metadata"].get("labels") or {}
+            key = (labels.get(EXPERIMENT_LABEL), labels.get(ATTEMPT_LABEL))
+            created = job["metadata"].get("creationTimestamp") or ""
+            if key not in newest or created >= (
+                newest[key]["metadata"].get("creationTimestamp") or ""
+            ):
+                newest[key] = job
+
+        now = time.time()
+        updates, lost = [], []
+        for name, label, attempt, state in self._execute(
+            "SELECT name, label, attempt, state FROM experiments "
+            "WHERE sweep = ?",
+            (self.sweep,),
+        ).fetchall():
+            job = newest.get((label, str(attempt)))
+            if job is not None:
+                updates.append(self._job_row(job))
+            elif state in (SUBMITTED, RUNNING):
+                lost.append((FAILED, now, self.sweep, name))
+
+        self._executemany(self._UPDATE_FROM_JOB, updates)
+        self._executemany(
+            "UPDATE experiments SET state = ?, updated_at = ?, "
+            "error = 'job not found on the cluster' "
+            "WHERE sweep = ? AND name = ?",
+            lost,
+        )
+        return self.counts()
+
+    def follow(self, informer):
+        """Keeps the states up to date from the job events of an
+        informer."""
+
+        def on_event(kind: str, event_type: str, job: dict):
+            if kind == JOBS and event_type != "DELETED":
+                self.update_from_job(job)
+
+        informer.add_event_handler(on_event)
+
+    def requeue(self, states: Iterable[str] = (FAILED,)) -> int:
+        """Sets the experiments in ``states`` back to pending, e.g. to retry
+        the failed ones. Returns the number of experiments requeued."""
+        states = list(states)
+        # A new attempt, so the jobs of the previous one are ignored
+        return self._execute(
+            "UPDATE experiments SET state = ?, attempt = attempt + 1, "
+            "job_name = NULL, job_uid = NULL, error = NULL, updated_at = ? "
+            f"WHERE sweep = ? AND state IN ({', '.join('?' * len(states))})",
+            (PENDING, time.time(), self.sweep, *states),
+        ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(
+            self._execute(
+                "SELECT state, COUNT(*) FROM experiments "
+                "WHERE sweep = ? GROUP BY state",
+                (self.sweep,),
+            ).fetchall()
+        )
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -1,17 +1,25 @@
+import importlib
+import io
+import itertools
 import json
 import logging
 import os
 import random
 import sys
-import time
-from collections import defaultdict
-from typing import Any, Dict, List, Optional, Union
+import threading
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import fire
 from rich.logging import RichHandler
 
-from kubejobs.experiments.pvc_status import PVCStatus, get_pvc_status
+from kubejobs.capacity import gpu_capacity
+from kubejobs.experiments.queue import ExperimentQueue
+from kubejobs.experiments.scheduler import ExperimentScheduler
+from kubejobs.informer import get_informer
 from kubejobs.jobs import KubernetesJob, KueueQueue, create_pvc
+from kubejobs.submission import SubmittedObject
 from kubejobs.useful_single_liners.count_gpu_usage_general import (
     GPU_DETAIL_DICT,
     count_gpu_usage,
@@ -24,9 +32,13 @@ handler.setFormatter(logging.Formatter("%(message)s"))
 logger.addHandler(handler)
 
 
-def get_gpu_type_to_use(gpu_types_to_use: List[str]) -> Optional[str]:
-    available_gpus = count_gpu_usage().get(
-        "Informatics Allowance Available", {}
+def get_gpu_type_to_use(
+    gpu_types_to_use: List[str], max_staleness: float = 10.0
+) -> Optional[str]:
+    # The usage is kept up to date from pod events; max_staleness bounds how
+    # long an already computed result is reused between launches
+    available_gpus = count_gpu_usage(max_staleness=max_staleness).get(
+        "Informatics Allowance Free", {}
     )
     available_gpu_types = [
         gpu_type
@@ -44,76 +56,208 @@ def setup_pvcs(num_pvcs: int, pvc_storage: str, pvc_access_modes: str) -> None:
         )
 
 
-def parse_commands_input(input_data: str) -> Dict[str, Any]:
+def _named_commands(items: Iterable) -> Iterator[Tuple[str, str]]:
+    # Commands are named exp-001, exp-002, ... by position, unless they come
+    # as (name, command) pairs or {"name": ..., "command": ...} objects
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            yield f"exp-{i+1:03d}", item
+        elif isinstance(item, dict):
+            yield item.get("name") or f"exp-{i+1:03d}", item["command"]
+        else:
+            name, command = item
+            yield name, command
+
+
+def _json_items(item) -> Iterator:
+    # An object without a "command" maps names to commands
+    if isinstance(item, dict) and "command" not in item:
+        yield from item.items()
+    else:
+        yield item
+
+
+def _json_lines(head, lines: Iterator[str]) -> Iterator:
+    yield from _json_items(head)
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            item = None
+        if not isinstance(item, (str, dict)):
+            # Not JSON Lines after all, e.g. a plain command list whose
+            # first line is a JSON string: one command per line from here
+            yield line.rstrip("\r\n")
+            yield from (rest.rstrip("\r\n") for rest in lines if rest.strip())
+            return
+        yield from _json_items(item)
+
+
+def iter_commands_input(lines: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Lazily reads (name, command) pairs from lines of input, e.g. sys.stdin,
+    so experiments can be launched while the input is still being produced.
+
+    The format is detected from the first non-blank line:
+
+    - JSON Lines: every line is a JSON string (a command), an object with
+      a "command" and optionally a "name", or an object of named commands.
+      From the first line that is none of these on, the input is read as
+      one command per line.
+    - A JSON list of commands or object of named commands, spanning the
+      whole input, as accepted by parse_commands_input. Only this format is
+      read in full before the first experiment is yielded.
+    - Anything else: one command per line.
+    """
+    lines = iter(lines)
+    first = next((line for line in lines if line.strip()), None)
+    if first is None:
+        return
+
     try:
-        # Attempt to parse the input as JSON
-        data = json.loads(input_data)
-        if isinstance(data, dict):
-            # If it's a dictionary, use it as-is
-            return data
-        elif isinstance(data, list):
-            # If it's a list, generate a dictionary with auto-generated names
-            return {f"exp-{i+1:03d}": cmd for i, cmd in enumerate(data)}
+        head = json.loads(first)
     except json.JSONDecodeError:
-        # If JSON parsing fails, treat the input as a newline-separated list of commands
-        return {
-            f"exp-{i+1:03d}": cmd
-            for i, cmd in enumerate(input_data.strip().split("\n"))
-        }
+        head = None
+        if first.lstrip()[:1] in ("[", "{"):
+            # A JSON document spread over several lines
+            rest = "".join(lines)
+            try:
+                head = json.loads(first + rest)
+            except json.JSONDecodeError:
+                lines = iter(rest.splitlines())
+            else:
+                lines = iter(())
+
+    if isinstance(head, (str, dict)):
+        yield from _named_commands(_json_lines(head, lines))
+    elif isinstance(head, list):
+        yield from _named_commands(
+            itertools.chain(head, json.loads("".join(lines) or "[]"))
+        )
+    else:
+        yield from _named_commands(
+            line.rstrip("\r\n")
+            for line in itertools.chain([first], lines)
+            if line.strip()
+        )
+
+
+def iter_sweep_spec(spec: str) -> Iterator[Tuple[str, str]]:
+    """
+    Runs a generator of experiments given as "package.module:callable", e.g.
+    "my_sweeps:learning_rates". The callable is called without arguments and
+    may produce commands, (name, command) pairs or objects with a "command"
+    and a "name", which are consumed lazily, e.g. the experiments of a
+    kubejobs.sweeps sweep:
+
+    .. code-block:: python
+
+        def learning_rates():
+            lrs = Random(32, lr=LogUniform(1e-5, 1e-2))
+            sweep = Grid(seed=[0, 1, 2]) * lrs
+            return sweep.experiments("python train.py {flags}", prefix="lr")
+    """
+    module_name, _, attribute = spec.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(
+            f"Sweep specs look like 'package.module:callable', got {spec!r}"
+        )
+    factory = getattr(importlib.import_module(module_name), attribute)
+    return _named_commands(factory())
+
+
+def parse_commands_input(input_data: str) -> Dict[str, Any]:
+    """Reads all the experiments of an input at once, see
+    iter_commands_input."""
+    return dict(iter_commands_input(io.StringIO(input_data)))
 
 
 def launch_jobs(
     pvc_prefix: str,
-    experiments: Dict[str, str],
+    experiments: Union[Dict[str, str], Iterable[Tuple[str, str]]],
     num_pvcs: int,
     max_concurrent_jobs: int,
     pvc_storage: str,
     pvc_access_modes: str,
     gpu_types_to_use: List[str],
     env_vars: Optional[Dict[str, str]] = None,
-) -> None:
-    pvc_usage = defaultdict(int)
+    submit_workers: int = 8,
+    queue: Optional[ExperimentQueue] = None,
+    lease_path: Optional[str] = None,
+) -> Dict[str, int]:
     setup_pvcs(num_pvcs, pvc_storage, pvc_access_modes)
-    pvc_status = get_pvc_status(pvc_prefix)
+    informer = get_informer()
+    if queue is not None:
+        # Submissions are recorded as they happen, and job states from events
+        queue.follow(informer)
 
-    for exp_name, command in experiments.items():
-        while len(pvc_status.in_use) >= max_concurrent_jobs:
-            logger.info(
-                "Maximum number of concurrent jobs reached, waiting..."
-            )
-            time.sleep(5)
-            pvc_status = get_pvc_status(pvc_prefix)
-
-        pvc_name = min(pvc_status.available, key=lambda p: pvc_usage[p])
-        pvc_usage[pvc_name] += 1
-        gpu_type = get_gpu_type_to_use(gpu_types_to_use)
-
-        job = KubernetesJob(
-            name=exp_name.lower(),
-            image="ghcr.io/antreasantoniou/gate:latest",
-            kueue_queue_name=KueueQueue.INFORMATICS,
-            command=["/bin/bash", "-c", "--"],
-            args=[command],
-            gpu_type="nvidia.com/gpu",
-            gpu_product=gpu_type,
-            gpu_limit=1,
-            backoff_limit=4,
-            volume_mounts={
-                "gate-disk": {"pvc": pvc_name, "mountPath": "/data/"}
-            },
-            env_vars=env_vars,
-            job_deadlineseconds=None,
-        )
+    # PVCs are leased until their job finishes, the next experiment is
+    # launched as soon as a watch event frees one, and up to submit_workers
+    # jobs are submitted at once
+    scheduler = ExperimentScheduler(
+        informer,
+        pvc_prefix=pvc_prefix,
+        max_concurrent_jobs=max_concurrent_jobs,
+        submit_workers=submit_workers,
+        lease_path=lease_path,
+    )
 
-        try:
-            job_success = job.run() == 0
+    def submitter(exp_name: str, command: str):
+        def submit(pvc_name: str) -> SubmittedObject:
+            gpu_type = get_gpu_type_to_use(gpu_types_to_use)
+            job = KubernetesJob(
+                name=exp_name.lower(),
+                image="ghcr.io/antreasantoniou/gate:latest",
+                kueue_queue_name=KueueQueue.INFORMATICS,
+                command=["/bin/bash", "-c", "--"],
+                args=[command],
+                gpu_type="nvidia.com/gpu",
+                gpu_product=gpu_type,
+                gpu_limit=1,
+                backoff_limit=4,
+                volume_mounts={
+                    "gate-disk": {"pvc": pvc_name, "mountPath": "/data/"}
+                },
+                env_vars=env_vars,
+                job_deadlineseconds=None,
+                labels=queue.labels(exp_name) if queue is not None else None,
+            )
+            submitted = job.submit()
+            if queue is not None:
+                queue.mark_submitted(
+                    exp_name, submitted.name, submitted.uid, pvc_name
+                )
             logger.info(
-                f"Launched job '{exp_name}' on '{gpu_type}' with PVC '{pvc_name}'. Success: {job_success}"
+                f"Launched job '{exp_name}' on '{gpu_type}' with PVC '{pvc_name}' as {submitted.name}."
             )
-        except Exception as e:
-            logger.error(f"Job '{exp_name}' failed with error: {e}")
+            return submitted
+
+        return submit
 
-        time.sleep(2)
+    outcomes = {"submitted": 0, "failed": 0}
+    outcomes_lock = threading.Lock()
+
+    def record_outcome(exp_name: str, future: Future):
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Job '{exp_name}' failed with error: {error}")
+            if queue is not None:
+                queue.mark_failed(exp_name, str(error))
+        with outcomes_lock:
+            outcomes["failed" if error is not None else "submitted"] += 1
+
+    # Experiments are consumed one at a time, and scheduling blocks while
+    # all PVCs are busy, so only the experiments in flight are held
+    if isinstance(experiments, dict):
+        experiments = experiments.items()
+    for exp_name, command in experiments:
+        future = scheduler.schedule(exp_name, submitter(exp_name, command))
+        future.add_done_callback(partial(record_outcome, exp_name))
+
+    scheduler.close()
+    return outcomes
 
 
 def main(
@@ -123,14 +267,63 @@ def main(
     pvc_access_modes: str = "ReadWriteOnce",
     env_vars: Optional[Dict[str, str]] = None,
     pvc_prefix: str = "gate",
+    submit_workers: int = 8,
+    queue_path: Optional[str] = None,
+    resume: bool = False,
+    sweep: Optional[str] = None,
+    commands_from: Optional[str] = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    lease_path: Optional[str] = None,
 ) -> None:
-    input_data = sys.stdin.read() if not sys.stdin.isatty() else None
-    if not input_data:
+    """
+    Launches the experiments whose commands are streamed from stdin, see
+    iter_commands_input, or produced by the ``commands_from`` generator, see
+    iter_sweep_spec. The first experiment is launched as soon as it is read.
+
+    With ``queue_path``, experiments and their jobs are recorded in a SQLite
+    queue: rerunning with the same commands, or with ``resume`` and no
+    commands, reconciles the queue with the cluster through one labelled list
+    of jobs and only launches the experiments that were never submitted.
+    ``sweep`` names the queue's jobs and defaults to the queue file name.
+
+    To split the experiments between ``shard_count`` launchers, each given
+    its own ``shard_index`` and queue, every launcher only runs every
+    ``shard_count``-th experiment of the input, starting at ``shard_index``.
+
+    With ``lease_path``, the PVC leases are saved to that JSON file, so a
+    restarted launcher does not reuse the PVCs of jobs still running.
+    """
+    if resume and queue_path is None:
+        logger.error("--resume needs the --queue_path of the sweep.")
+        sys.exit(1)
+    if commands_from is not None:
+        # Sweep modules are looked up from the current directory too
+        sys.path.insert(0, os.getcwd())
+        experiments = iter_sweep_spec(commands_from)
+    elif not sys.stdin.isatty():
+        experiments = iter_commands_input(sys.stdin)
+    elif resume:
+        experiments = iter(())
+    else:
         logger.error("No commands provided to run.")
         sys.exit(1)
+    if not 0 <= shard_index < shard_count:
+        logger.error(f"--shard_index must be in [0, {shard_count}).")
+        sys.exit(1)
+    if shard_count > 1:
+        experiments = itertools.islice(
+            experiments, shard_index, None, shard_count
+        )
 
-    experiments = parse_commands_input(input_data)
-    gpu_types_to_use = set(list(GPU_DETAIL_DICT.keys()))
+    if queue_path is not None:
+        queue = ExperimentQueue(queue_path, sweep=sweep)
+        logger.info(f"Queue {queue.path}: {queue.reconcile()}")
+        # Pending experiments first, then the new ones as they are read
+        experiments = queue.stream(experiments)
+    else:
+        queue = None
+    gpu_types_to_use = set(gpu_capacity(fallback=GPU_DETAIL_DICT).keys())
     gpu_types_to_use = [
         gpu_type for gpu_type in gpu_types_to_use if "MIG" not in gpu_type
     ]
@@ -158,7 +351,7 @@ def main(
         "MODEL_DIR": os.getenv("MODEL_DIR"),
     }
 
-    launch_jobs(
+    outcomes = launch_jobs(
         experiments=experiments,
         num_pvcs=num_pvcs,
         max_concurrent_jobs=max_concurrent_jobs,
@@ -167,6 +360,12 @@ def main(
         gpu_types_to_use=gpu_types_to_use,
         env_vars=env_vars or ENV_VARS,
         pvc_prefix=pvc_prefix,
+        submit_workers=submit_workers,
+        queue=queue,
+        lease_path=lease_path,
+    )
+    logger.info(
+        f"Submitted {outcomes['submitted']} jobs, {outcomes['failed']} failed."
     )
 
 
@@ -0,0 +1,117 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+from kubejobs.experiments.pvc_pool import PVCPool
+from kubejobs.submission import SubmittedObject
+
+logger = logging.getLogger(__name__)
+
+
+class ExperimentScheduler:
+    """
+    Launches experiments, each on its own PVC, as soon as a PVC is free and
+    fewer than ``max_concurrent_jobs`` PVCs are busy.
+
+    PVCs are leased from a PVCPool kept up to date by the watch events of an
+    informer: a PVC is leased as soon as an experiment is scheduled on it,
+    before its job or pod exists, and released when the job finishes or is
+    deleted, at which point the next experiment is dispatched right away.
+    Submissions run concurrently in a pool of ``submit_workers`` threads.
+
+    Args:
+        informer (ClusterInformer): Informer following the pods, jobs and
+            PVCs of the namespace the jobs are submitted to.
+        pvc_prefix (str): Only PVCs whose name contains it are used.
+        max_concurrent_jobs (int): Maximum number of busy PVCs.
+        submit_workers (int): Maximum number of submissions in flight.
+            Defaults to 8.
+        resync_interval (float): Seconds after which the pool is rebuilt
+            from the informer's caches while waiting, in case an event was
+            missed. Defaults to 60.
+        lease_path (str | Path, optional): JSON file the PVC leases are
+            persisted to, see PVCPool. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        informer,
+        pvc_prefix: str,
+        max_concurrent_jobs: int,
+        submit_workers: int = 8,
+        resync_interval: float = 60.0,
+        lease_path: Optional[Union[str, Path]] = None,
+    ):
+        self.informer = informer
+        self.pvc_prefix = pvc_prefix
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.resync_interval = resync_interval
+        self.pool = PVCPool(informer, pvc_prefix, state_path=lease_path)
+        self._executor = ThreadPoolExecutor(
+            max_workers=submit_workers, thread_name_prefix="kubejobs-launcher"
+        )
+
+    @property
+    def reserved(self) -> Dict[str, str]:
+        """The PVCs leased by the scheduler, keyed by experiment name
+        while submitting and by job name afterwards."""
+        return {
+            lease["job"] or lease["holder"]: claim
+            for claim, lease in self.pool.leases.items()
+        }
+
+    def acquire_pvc(self, experiment: str) -> str:
+        """Blocks until a PVC can be used and leases it to
+        ``experiment``."""
+        pvc = self.pool.acquire(
+            experiment, max_busy=self.max_concurrent_jobs, timeout=0
+        )
+        if pvc is None:
+            logger.info(
+                "Maximum number of concurrent jobs reached, waiting..."
+            )
+        while pvc is None:
+            pvc = self.pool.acquire(
+                experiment,
+                max_busy=self.max_concurrent_jobs,
+                timeout=self.resync_interval,
+            )
+            if pvc is None:
+                self.pool.resync()
+        return pvc
+
+    def _submit(
+        self,
+        experiment: str,
+        pvc: str,
+        submit: Callable[[str], SubmittedObject],
+    ) -> SubmittedObject:
+        try:
+            submitted = submit(pvc)
+        except BaseException:
+            self.pool.release(pvc)
+            raise
+        self.pool.bind(pvc, submitted.name)
+        return submitted
+
+    def schedule(
+        self, experiment: str, submit: Callable[[str], SubmittedObject]
+    ) -> Future:
+        """
+        Waits for a PVC, then submits an experiment in the background.
+
+        Args:
+            experiment (str): Name of the experiment.
+            submit (Callable[[str], SubmittedObject]): Creates the job of the
+                experiment on the given PVC and returns it.
+
+        Returns:
+            Future: Resolves to the SubmittedObject of the job, or raises the
+                error of the submission, whose PVC is then released.
+        """
+        pvc = self.acquire_pvc(experiment)
+        return self._executor.submit(self._submit, experiment, pvc, submit)
+
+    def close(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,266 @@
+import gzip
+import json
+import logging
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+import fire
+import pandas as pd
+import yaml
+
+from kubejobs.jobs import KubernetesJobTemplate
+from kubejobs.serialization import YAML_LOADER, to_json, to_yaml
+from kubejobs.submission import (
+    SubmittedObject,
+    results_to_frame,
+    submit_indexed_job,
+    submit_manifest,
+    submit_manifests,
+)
+
+logger = logging.getLogger(__name__)
+
+YAML_SUFFIXES = {".yaml", ".yml"}
+JSON_LINES_SUFFIXES = {".jsonl", ".ndjson"}
+
+
+def _infer_format(path: Path) -> str:
+    suffixes = [suffix.lower() for suffix in path.suffixes]
+    if suffixes and suffixes[-1] == ".gz":
+        suffixes = suffixes[:-1]
+    if suffixes and suffixes[-1] in YAML_SUFFIXES:
+        return "yaml"
+    if suffixes and suffixes[-1] in JSON_LINES_SUFFIXES:
+        return "jsonl"
+    raise ValueError(
+        f"Cannot infer the manifest format of {path}, pass format='yaml' "
+        "or format='jsonl'"
+    )
+
+
+def _open_text(path: Path, mode: str, compress: Optional[bool]) -> IO[str]:
+    if compress is None:
+        compress = path.suffix.lower() == ".gz"
+    if compress:
+        return gzip.open(path, f"{mode}t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _as_manifests(obj) -> Iterator[dict]:
+    """Accepts manifests as dicts or as KubernetesJob / KubernetesPod
+    objects. The ConfigMap of a sweep comes before its Indexed Job, so the
+    file can also be applied in order with kubectl."""
+    if isinstance(obj, dict):
+        yield obj
+        return
+    if getattr(obj, "sweep_commands", None) is not None:
+        yield obj.generate_sweep_config_map()
+    yield obj.generate_dict()
+
+
+def _config_map_volumes(manifest: dict) -> Iterator[str]:
+    """Names of the ConfigMaps mounted by a Job."""
+    template_spec = manifest.get("spec", {}).get("template", {}).get("spec")
+    for volume in (template_spec or {}).get("volumes") or []:
+        if "configMap" in volume:
+            yield volume["configMap"]["name"]
+
+
+class _MountingJob(dict):
+    """A Job manifest queued for submission together with the ConfigMap it
+    mounts, which is released with it once submitted."""
+
+    def __init__(self, manifest: dict, config_map: dict):
+        super().__init__(manifest)
+        self.config_map = config_map
+
+
+def export_manifests(
+    manifests: Iterable,
+    path: Union[str, Path],
+    format: Optional[str] = None,
+    compress: Optional[bool] = None,
+) -> int:
+    """
+    Streams manifests to a multi-document YAML or a JSON Lines file.
+
+    Manifests are serialized and written one at a time, so memory use stays
+    constant however many are exported.
+
+    Args:
+        manifests (Iterable): Manifest dicts, or objects with a generate_dict()
+            method such as KubernetesJob and KubernetesPod. Consumed lazily.
+            Sweep jobs are written with their ConfigMap, see
+            replay_manifest_file.
+        path (str | Path): Output file.
+        format (str, optional): "yaml" or "jsonl". Inferred from the file
+            suffix (.yaml, .yml, .jsonl, .ndjson) when not given.
+        compress (bool, optional): Gzip the output. Defaults to True when the
+            path ends in .gz.
+
+    Returns:
+        int: The number of manifests written.
+    """
+    path = Path(path)
+    format = format or _infer_format(path)
+    if format not in ("yaml", "jsonl"):
+        raise ValueError(f"format must be 'yaml' or 'jsonl', not {format!r}")
+
+    count = 0
+    with _open_text(path, "w", compress) as f:
+        for obj in manifests:
+            for manifest in _as_manifests(obj):
+                if format == "yaml":
+                    f.write("---\n")
+                    f.write(to_yaml(manifest))
+                else:
+                    f.write(to_json(manifest))
+                    f.write("\n")
+                count += 1
+
+    logger.info(f"Exported {count} manifests to {path}")
+    return count
+
+
+def export_commands(
+    commands: Iterable[str],
+    path: Union[str, Path],
+    template: KubernetesJobTemplate,
+    name: Optional[str] = None,
+    format: Optional[str] = None,
+    compress: Optional[bool] = None,
+) -> int:
+    """
+    Streams one Job manifest per command to a file, rendered from a template.
+
+    Args:
+        commands (Iterable[str]): The commands, consumed lazily.
+        path (str | Path): Output file.
+        template (KubernetesJobTemplate): Template the jobs are rendered from.
+        name (str, optional): Name prefix of the jobs. Defaults to the
+            template's name.
+        format (str, optional): "yaml" or "jsonl", see export_manifests.
+        compress (bool, optional): Gzip the output, see export_manifests.
+
+    Returns:
+        int: The number of manifests written.
+    """
+    return export_manifests(
+        (
+            manifest
+            for _, manifest in template.render_commands(commands, name=name)
+        ),
+        path,
+        format=format,
+        compress=compress,
+    )
+
+
+def iter_manifests(
+    path: Union[str, Path],
+    format: Optional[str] = None,
+    compress: Optional[bool] = None,
+) -> Iterator[dict]:
+    """
+    Lazily reads the manifests of a file written by export_manifests.
+
+    Args:
+        path (str | Path): Input file.
+        format (str, optional): "yaml" or "jsonl", inferred from the suffix
+            when not given.
+        compress (bool, optional): Whether the file is gzipped. Defaults to
+            True when the path ends in .gz.
+
+    Yields:
+        dict: One manifest per document or line.
+    """
+    path = Path(path)
+    format = format or _infer_format(path)
+
+    with _open_text(path, "r", compress) as f:
+        if format == "yaml":
+            for manifest in yaml.load_all(f, Loader=YAML_LOADER):
+                if manifest is not None:
+                    yield manifest
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def replay_manifest_file(
+    path: str,
+    format: Optional[str] = None,
+    compress: Optional[bool] = None,
+    max_workers: int = 16,
+    rate_limit: Optional[float] = 20.0,
+    max_retries: int = 5,
+) -> pd.DataFrame:
+    """
+    Submits every Job, Pod or ConfigMap manifest of an exported file in bulk.
+
+    The file is streamed, so only the manifests in flight are held in memory,
+    along with the ConfigMaps read but not yet submitted. A ConfigMap is
+    held until the Job mounting it, e.g. the Indexed Job of a sweep, is read
+    and then created together with it, as by KubernetesJob.submit; those no
+    Job mounts are held to the end of the file and created last.
+
+    Args:
+        path (str): File written by export_manifests or export_commands.
+        format (str, optional): "yaml" or "jsonl", inferred when not given.
+        compress (bool, optional): Whether the file is gzipped, inferred
+            when not given.
+        max_workers (int): Number of concurrent submissions. Defaults to 16.
+        rate_limit (float, optional): Maximum requests per second, or None
+            for no limit. Defaults to 20.
+        max_retries (int): Retries per manifest on HTTP 429 and 503.
+            Defaults to 5.
+
+    Returns:
+        pd.DataFrame: One row per manifest, labelled by its name or
+            generateName, with the created name, UID, latency and error.
+    """
+
+    def manifests() -> Iterator[Tuple[Optional[str], dict]]:
+        # ConfigMaps not yet handed to the Job mounting them
+        config_maps: Dict[str, dict] = {}
+        mounted = set()
+        for manifest in iter_manifests(path, format=format, compress=compress):
+            metadata = manifest["metadata"]
+            if manifest.get("kind") == "ConfigMap":
+                config_maps[metadata["name"]] = manifest
+                continue
+            if manifest.get("kind") == "Job":
+                names = list(_config_map_volumes(manifest))
+                mounted.update(names)
+                for name in names:
+                    # A later Job mounting the same ConfigMap reuses the one
+                    # created with the first
+                    if name in config_maps:
+                        manifest = _MountingJob(
+                            manifest, config_maps.pop(name)
+                        )
+                        break
+            label = metadata.get("name") or metadata.get("generateName")
+            yield label, manifest
+        for name, config_map in config_maps.items():
+            if name not in mounted:
+                yield name, config_map
+
+    def submit(manifest: dict) -> SubmittedObject:
+        if isinstance(manifest, _MountingJob):
+            return submit_indexed_job(dict(manifest), manifest.config_map)
+        return submit_manifest(manifest)
+
+    results = submit_manifests(
+        manifests(),
+        submit_fn=submit,
+        max_workers=max_workers,
+        rate_limit=rate_limit,
+        max_retries=max_retries,
+    )
+    return results_to_frame(results)
+
+
+if __name__ == "__main__":
+    fire.Fire(replay_manifest_file)
@@ -1,75 +1,31 @@
-import json
-import subprocess
+import gzip
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, List, Optional
 
 import fire
-import numpy as np
-import pandas as pd
 import rich
-import streamlit as st
+from kubernetes import client
 from tqdm import tqdm
+from urllib3.exceptions import HTTPError
 
+from kubejobs.api import (
+    get_api_client,
+    get_core_api,
+    list_pages,
+    read_json_response,
+)
 
-def exponential_moving_average_efficient(data, N):
-    """
-    Compute the Exponential Moving Average (EMA) for a list of values.
-
-    Args:
-        data (list): The list of data points.
-        span (int): The span N for the EMA calculation.
-
-    Returns:
-        float: The EMA of the data.
-    """
-    # Convert list to numpy array for vectorized operations
-    data_array = np.array(data)
-
-    # Calculate the smoothing factor alpha
-    alpha = 2 / (N + 1)
-
-    # Initialize the EMA array
-    ema = np.zeros_like(data_array)
-    ema[0] = data_array[0]
-
-    # Calculate the EMA
-    for i in range(1, len(data_array)):
-        ema[i] = (alpha * data_array[i]) + ((1 - alpha) * ema[i - 1])
-
-    return ema[-1]
-
-
-def convert_to_gigabytes(value: str) -> float:
-    """
-    Convert the given storage/memory value to base Gigabytes (GB).
-
-    Args:
-        value (str): Input storage/memory value with units. E.g., '20G', '20Gi', '2000M', '2000Mi'
-
-    Returns:
-        float: The value converted to Gigabytes (GB).
-    """
-    # Define conversion factors
-    factor_gb = {
-        "G": 1,
-        "Gi": 1 / 1.073741824,
-        "M": 1 / 1024,
-        "Mi": 1 / (1024 * 1.073741824),
-    }
-
-    # Find the numeric and unit parts of the input
-    numeric_part = "".join(filter(str.isdigit, value))
-    unit_part = "".join(filter(str.isalpha, value))
-
-    # Convert to Gigabytes (GB)
-    if unit_part in factor_gb.keys():
-        return float(numeric_part) * factor_gb[unit_part]
-    elif value == "N/A":
-        return -1
-    else:
-        return -1
+# Logs are copied to disk in chunks of this many bytes
+LOG_CHUNK_SIZE = 64 * 1024
+FAILED_PHASE_SELECTOR = "status.phase=Failed"
+JOB_NAME_LABEL = "job-name"
+# Jobs whose failed pods are deleted by one deletecollection request, so
+# that the label selector stays short
+JOBS_PER_DELETE = 50
 
 
 def parse_iso_time(time_str: str) -> datetime:
@@ -85,76 +41,239 @@ def time_diff_to_human_readable(start: datetime, end: datetime) -> str:
     return f"{diff.days}d {hours}h {minutes}m {seconds}s"
 
 
-def run_command(command: str) -> str:
-    result = subprocess.run(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        shell=True,
-    )
-    # Add decoding and error handling
-    stdout = result.stdout.decode("utf-8", errors="ignore")
-    stderr = result.stderr.decode("utf-8", errors="ignore")
-    return stdout, stderr
+def _pod_log_paths(pod: dict, log_dir: Path, compress: bool) -> Dict:
+    """Maps each container of a pod to its log file: ``<pod>.log`` for
+    single-container pods, ``<pod>.<container>.log`` otherwise."""
+    pod_name = pod["metadata"]["name"]
+    containers = [c["name"] for c in pod["spec"].get("containers", [])]
+    suffix = ".log.gz" if compress else ".log"
+    if len(containers) <= 1:
+        return {None: log_dir / f"{pod_name}{suffix}"}
+    return {
+        container: log_dir / f"{pod_name}.{container}{suffix}"
+        for container in containers
+    }
+
+
+def stream_pod_log(
+    pod_name: str,
+    namespace: str,
+    log_path: Path,
+    container: Optional[str] = None,
+    tail_lines: Optional[int] = None,
+    limit_bytes: Optional[int] = None,
+    compress: bool = False,
+) -> int:
+    """
+    Streams the log of a pod container to a file, in chunks of
+    LOG_CHUNK_SIZE bytes, so a log is never held in memory as a whole.
 
+    The log is written to a ``.part`` file that is only renamed to
+    ``log_path`` once complete, so an interrupted download is never
+    mistaken for a full log.
 
-def ssh_into_pod_and_run_command(
-    pod_name: str, namespace: str, command: str
-) -> str:
-    ssh_command = f"kubectl exec -n {namespace} {pod_name} -- {command}"
-    stdout, stderr = run_command(ssh_command)
-    if stderr:
-        print(f"Error executing command in pod {pod_name}: {stderr}")
-    return stdout
+    Args:
+        pod_name (str): Name of the pod.
+        namespace (str): Namespace of the pod.
+        log_path (Path): Destination file.
+        container (str, optional): Container to read, required for pods with
+            several containers.
+        tail_lines (int, optional): Only keep the last lines of the log.
+        limit_bytes (int, optional): Stop after this many bytes of log.
+        compress (bool): Gzip the file. Defaults to False.
+
+    Returns:
+        int: The number of (uncompressed) log bytes written.
+    """
+    response = get_core_api().read_namespaced_pod_log(
+        pod_name,
+        namespace,
+        container=container,
+        tail_lines=tail_lines,
+        limit_bytes=limit_bytes,
+        _preload_content=False,
+    )
+    part_path = log_path.with_name(log_path.name + ".part")
+    written = 0
+    try:
+        with (gzip.open if compress else open)(part_path, "wb") as file:
+            for chunk in response.stream(LOG_CHUNK_SIZE):
+                file.write(chunk)
+                written += len(chunk)
+    except BaseException:
+        if part_path.exists():
+            part_path.unlink()
+        raise
+    finally:
+        response.release_conn()
+
+    part_path.replace(log_path)
+    return written
 
 
 def fetch_logs_of_failed_jobs(
-    namespace: str, matching_string: str, log_dir: str | Path = "logs"
+    namespace: str,
+    matching_string: str,
+    log_dir: str | Path = "logs",
+    max_workers: int = 16,
+    tail_lines: Optional[int] = None,
+    limit_bytes: Optional[int] = None,
+    compress: bool = False,
+    delete: bool = True,
 ):
     """
     Fetches logs of failed jobs in a specified namespace and deletes the job afterwards.
 
+    Only failed pods that belong to a job are listed, using a field selector
+    on the pod phase and a selector on the job-name label. Their logs are
+    streamed to disk from a bounded pool of worker threads, then the pods
+    whose logs were saved are deleted: with one deletecollection request
+    per batch of jobs whose failed pods were all saved, and one at a time
+    for the other jobs. Pods whose logs could not be saved are kept so they
+    can be retried.
+
     Args:
         namespace (str): The namespace to check for failed jobs.
         matching_string (str): A string to filter pods by. Only pods containing this string in their name would be considered.
+        log_dir (str | Path): Directory the logs are written to. Defaults to "logs".
+        max_workers (int): Number of concurrent log downloads and deletes. Defaults to 16.
+        tail_lines (int, optional): Only save the last lines of each log.
+        limit_bytes (int, optional): Save at most this many bytes of each log.
+        compress (bool): Gzip the logs (written as .log.gz). Defaults to False.
+        delete (bool): Delete the pods whose logs were saved. Defaults to True.
     """
-    get_pods_cmd = f"kubectl get pods -n {namespace} -o json"
-    pods_output, _ = run_command(get_pods_cmd)
-    pod_data = json.loads(pods_output.strip())
-
     if isinstance(log_dir, str):
         log_dir = Path(log_dir)
+    log_dir.mkdir(parents=True, exist_ok=True)
 
-    for pod in pod_data["items"]:
+    # Size the shared connection pool for the worker threads
+    core_api = client.CoreV1Api(
+        get_api_client(connection_pool_maxsize=max_workers)
+    )
+    start_time = time.perf_counter()
+
+    # Every failed pod of a job, from one snapshot of the namespace, so
+    # their deletion can be restricted to that snapshot
+    listed_pods, resource_version = [], None
+    for page in list_pages(
+        core_api.list_namespaced_pod,
+        namespace,
+        field_selector=FAILED_PHASE_SELECTOR,
+        label_selector=JOB_NAME_LABEL,
+    ):
+        resource_version = resource_version or page["metadata"].get(
+            "resourceVersion"
+        )
+        listed_pods.extend(page.get("items") or [])
+    failed_pods = [
+        pod
+        for pod in listed_pods
+        if matching_string in pod["metadata"]["name"]
+    ]
+
+    def harvest(pod: dict) -> bool:
         pod_name = pod["metadata"]["name"]
-
-        # If the pod's name doesn't contain the matching_string, skip this iteration
-        if matching_string not in pod_name:
-            continue
-
-        status = pod["status"]["phase"]
-        labels = pod["metadata"].get("labels", {})
-
-        if "job-name" in labels and status.lower() == "failed":
-            try:
-                log_command = f"kubectl logs {pod_name} -n {namespace}"
-                log_output, _ = run_command(log_command)
-                log_path = log_dir / f"{pod_name}.log"
-
-                with open(log_path, "w") as file:
-                    file.write(log_output)
-
-                print(f"Log saved for failed pod {pod_name}")
-
-                delete_pod_command = (
-                    f"kubectl delete pod {pod_name} -n {namespace}"
+        try:
+            for container, log_path in _pod_log_paths(
+                pod, log_dir, compress
+            ).items():
+                stream_pod_log(
+                    pod_name,
+                    namespace,
+                    log_path,
+                    container=container,
+                    tail_lines=tail_lines,
+                    limit_bytes=limit_bytes,
+                    compress=compress,
                 )
-                _, _ = run_command(delete_pod_command)
-                print(f"{pod_name} deleted.")
-            except subprocess.CalledProcessError as e:
-                print(f"Error: {e}")
-                print(f"Stdout output: {e.stdout}")
-                print(f"Stderr output: {e.stderr}")
+        except (client.ApiException, HTTPError, OSError) as e:
+            rich.print(f"[red]Error saving log of pod {pod_name}: {e}[/red]")
+            return False
+        return True
+
+    def delete_pod(pod_name: str) -> bool:
+        try:
+            core_api.delete_namespaced_pod(
+                pod_name, namespace, _preload_content=False
+            )
+        except client.ApiException as e:
+            if e.status == 404:  # Already gone
+                return True
+            rich.print(
+                f"[red]Failed to delete pod {pod_name}: {e.status} {e.reason}[/red]"
+            )
+            return False
+        return True
+
+    def delete_failed_pods_of_jobs(jobs: List[str]) -> Optional[int]:
+        # Only the pods that had failed in the listed snapshot are selected,
+        # so pods failing since then keep their logs
+        try:
+            response = core_api.delete_collection_namespaced_pod(
+                namespace,
+                label_selector=f"{JOB_NAME_LABEL} in ({','.join(jobs)})",
+                field_selector=FAILED_PHASE_SELECTOR,
+                resource_version=resource_version,
+                resource_version_match="Exact",
+                _preload_content=False,
+            )
+        except client.ApiException as e:
+            # e.g. 410 once the snapshot has been compacted away
+            rich.print(
+                f"[yellow]Could not delete the failed pods of {len(jobs)} "
+                f"jobs at once ({e.status} {e.reason}), deleting them one "
+                "by one[/yellow]"
+            )
+            return None
+        return len(read_json_response(response).get("items") or [])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        harvested = [
+            pod
+            for pod, saved in zip(
+                failed_pods,
+                tqdm(
+                    executor.map(harvest, failed_pods),
+                    total=len(failed_pods),
+                    desc="Saving logs",
+                ),
+            )
+            if saved
+        ]
+
+        deleted = 0
+        if delete:
+            # Jobs whose failed pods all had their logs saved have them
+            # deleted in bulk; the others have their saved pods deleted one
+            # at a time, keeping the rest
+            harvested_names = {pod["metadata"]["name"] for pod in harvested}
+            pods_by_job = defaultdict(set)
+            for pod in listed_pods:
+                job = pod["metadata"]["labels"][JOB_NAME_LABEL]
+                pods_by_job[job].add(pod["metadata"]["name"])
+            whole_jobs = sorted(
+                job
+                for job, names in pods_by_job.items()
+                if names <= harvested_names
+            )
+            single_pods = harvested_names.difference(
+                *(pods_by_job[job] for job in whole_jobs)
+            )
+            for index in range(0, len(whole_jobs), JOBS_PER_DELETE):
+                jobs = whole_jobs[index : index + JOBS_PER_DELETE]
+                count = delete_failed_pods_of_jobs(jobs)
+                if count is None:
+                    single_pods.update(*(pods_by_job[job] for job in jobs))
+                else:
+                    deleted += count
+            deleted += sum(executor.map(delete_pod, sorted(single_pods)))
+
+    elapsed = time.perf_counter() - start_time
+    rich.print(
+        f"Saved logs of {len(harvested)}/{len(failed_pods)} failed pods to {log_dir}"
+        + (f", deleted {deleted} pods" if delete else "")
+        + f" in {elapsed:.1f}s"
+    )
 
 
 if __name__ == "__main__":
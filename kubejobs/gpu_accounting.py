@@ -0,0 +1,223 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from kubejobs.api import get_core_api, get_current_namespace, list_items
+from kubejobs.informer import PODS, get_informer, object_key
+
+GPU_RESOURCE = "nvidia.com/gpu"
+GPU_PRODUCT_LABEL = "nvidia.com/gpu.product"
+USER_LABEL = "eidf/user"
+UNKNOWN = "Unknown"
+
+# Columns of the frame returned by gpu_usage_frame
+POD_COLUMNS = ("pod", "namespace", "user", "product", "phase", "node")
+
+
+def _container_gpus(container: dict, resource: str) -> int:
+    resources = container.get("resources") or {}
+    # Extended resources such as GPUs cannot be overcommitted, so the request
+    # always equals the limit and either one may be set
+    quantity = (resources.get("limits") or {}).get(resource) or (
+        resources.get("requests") or {}
+    ).get(resource)
+    return int(quantity) if quantity else 0
+
+
+def pod_gpu_request(pod: dict, resource: str = GPU_RESOURCE) -> int:
+    """
+    Returns the number of GPUs the scheduler reserves for a pod.
+
+    Init containers run one at a time before the app containers, so the
+    effective request is the larger of the sum over the containers and the
+    largest init container request, as computed by the scheduler.
+    """
+    spec = pod.get("spec") or {}
+    containers = sum(
+        _container_gpus(container, resource)
+        for container in spec.get("containers") or []
+    )
+    init_containers = max(
+        (
+            _container_gpus(container, resource)
+            for container in spec.get("initContainers") or []
+        ),
+        default=0,
+    )
+    return max(containers, init_containers)
+
+
+def pod_gpu_product(pod: dict) -> str:
+    """Returns the GPU product a pod asked for through its node selector."""
+    node_selector = (pod.get("spec") or {}).get("nodeSelector") or {}
+    return node_selector.get(GPU_PRODUCT_LABEL, UNKNOWN)
+
+
+def gpu_usage_frame(
+    pods: Iterable[dict], resource: str = GPU_RESOURCE
+) -> pd.DataFrame:
+    """
+    Builds a columnar table of the GPUs requested by each pod, in one pass
+    over the pods.
+
+    Args:
+        pods (Iterable[dict]): Pod objects, e.g. from list_items or an
+            informer. Consumed lazily.
+        resource (str): Extended resource counted as GPUs. Defaults to
+            "nvidia.com/gpu".
+
+    Returns:
+        pd.DataFrame: One row per pod requesting GPUs, with the pod name, the
+            namespace, user (eidf/user label), product, phase and node as
+            categoricals and the GPU count as int64.
+    """
+    columns = {column: [] for column in POD_COLUMNS}
+    gpus = []
+    for pod in pods:
+        count = pod_gpu_request(pod, resource)
+        if not count:
+            continue
+        metadata = pod["metadata"]
+        columns["pod"].append(metadata["name"])
+        columns["namespace"].append(metadata.get("namespace", ""))
+        columns["user"].append(
+            (metadata.get("labels") or {}).get(USER_LABEL, UNKNOWN)
+        )
+        columns["product"].append(pod_gpu_product(pod))
+        columns["phase"].append(
+            (pod.get("status") or {}).get("phase", UNKNOWN)
+        )
+        columns["node"].append((pod.get("spec") or {}).get("nodeName") or "")
+        gpus.append(count)
+
+    # Pod names are unique, the other columns repeat a few values each
+    frame = pd.DataFrame(
+        {
+            column: values if column == "pod" else pd.Categorical(values)
+            for column, values in columns.items()
+        }
+    )
+    frame["gpus"] = np.asarray(gpus, dtype=np.int64)
+    return frame
+
+
+def fetch_gpu_usage_frame(
+    namespace: Optional[str] = None, resource: str = GPU_RESOURCE
+) -> pd.DataFrame:
+    """Builds gpu_usage_frame from a single paged list of the pods of a
+    namespace, defaulting to the current kube config namespace."""
+    namespace = namespace or get_current_namespace()
+    return gpu_usage_frame(
+        list_items(get_core_api().list_namespaced_pod, namespace), resource
+    )
+
+
+def aggregate_gpu_usage(
+    frame: pd.DataFrame,
+    by: Sequence[str] = ("user", "product", "phase"),
+    phases: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """
+    Sums the GPUs of a gpu_usage_frame per group.
+
+    Args:
+        frame (pd.DataFrame): Output of gpu_usage_frame.
+        by (Sequence[str]): Columns to group by. Defaults to user, product
+            and phase.
+        phases (Sequence[str], optional): Only count pods in these phases,
+            e.g. ("Pending", "Running").
+
+    Returns:
+        pd.DataFrame: The groups with their total "gpus" and "pods" counts,
+            largest first.
+    """
+    if phases is not None:
+        frame = frame[frame["phase"].isin(phases)]
+    return (
+        frame.groupby(list(by), observed=True)
+        .agg(gpus=("gpus", "sum"), pods=("pod", "size"))
+        .reset_index()
+        .sort_values("gpus", ascending=False, ignore_index=True)
+    )
+
+
+class GPUUsageView:
+    """
+    Running totals of the GPUs requested per pod phase and GPU product,
+    kept up to date from the pod events of a ClusterInformer.
+
+    Every event only adjusts the totals by the difference it makes for one
+    pod, so reading the usage costs nothing however often it is done.
+
+    Args:
+        informer (ClusterInformer): Informer following the pods.
+        resource (str): Extended resource counted as GPUs. Defaults to
+            "nvidia.com/gpu".
+    """
+
+    def __init__(self, informer, resource: str = GPU_RESOURCE):
+        self.resource = resource
+        self._pods: Dict[str, Tuple[str, str, int]] = {}
+        self._totals: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+        # The snapshot is taken under the lock, so events delivered while it
+        # is applied wait for it and are applied on top of it
+        informer.add_event_handler(self._on_event)
+        with self._lock:
+            for pod in informer.pods.list():
+                self._update(pod)
+
+    def _on_event(self, kind: str, event_type: str, pod: dict):
+        if kind != PODS:
+            return
+        with self._lock:
+            if event_type == "DELETED":
+                self._remove(object_key(pod))
+            else:
+                self._update(pod)
+
+    def _remove(self, key: str):
+        previous = self._pods.pop(key, None)
+        if previous is not None:
+            phase, product, gpus = previous
+            self._totals[phase, product] -= gpus
+            if not self._totals[phase, product]:
+                del self._totals[phase, product]
+
+    def _update(self, pod: dict):
+        key = object_key(pod)
+        self._remove(key)
+        gpus = pod_gpu_request(pod, self.resource)
+        if gpus:
+            phase = (pod.get("status") or {}).get("phase", UNKNOWN)
+            product = pod_gpu_product(pod)
+            self._pods[key] = (phase, product, gpus)
+            self._totals[phase, product] += gpus
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        """Returns the GPUs requested per phase, then per GPU product."""
+        usage = defaultdict(dict)
+        with self._lock:
+            for (phase, product), gpus in self._totals.items():
+                usage[phase][product] = gpus
+        return dict(usage)
+
+
+_views: Dict[str, GPUUsageView] = {}
+_views_lock = threading.Lock()
+
+
+def get_gpu_usage_view(namespace: Optional[str] = None) -> GPUUsageView:
+    """Returns the process-wide GPUUsageView of a namespace, built on the
+    shared informer of kubejobs.informer."""
+    namespace = namespace or get_current_namespace()
+    with _views_lock:
+        view = _views.get(namespace)
+        if view is None:
+            view = GPUUsageView(get_informer(namespace, resources=(PODS,)))
+            _views[namespace] = view
+        return view
@@ -0,0 +1,147 @@
+import threading
+import time
+import warnings
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+from kubejobs.gpu_sampling import GPUSample
+
+# Order of the metrics in the arrays of a GPUSeries
+METRICS = ("memory_total", "memory_used", "utilization")
+
+
+class GPUSeries:
+    """
+    The metrics of one GPU of one pod: an exponential moving average updated
+    in O(1) per sample, and the last ``history`` samples in a ring buffer.
+
+    While fewer than ``span`` samples have been seen, the smoothing factor is
+    that of a span equal to the number of samples, so the first sample is
+    taken as is instead of being averaged with zeros.
+    """
+
+    __slots__ = ("alpha", "ema", "values", "timestamps", "count", "_next")
+
+    def __init__(self, span: int = 25, history: int = 256):
+        self.alpha = 2 / (span + 1)
+        self.ema = np.full(len(METRICS), np.nan)
+        self.values = np.full((history, len(METRICS)), np.nan)
+        self.timestamps = np.full(history, np.nan)
+        self.count = 0
+        self._next = 0
+
+    def update(self, values: np.ndarray, timestamp: float):
+        self.count += 1
+        alpha = max(self.alpha, 2 / (self.count + 1))
+        # Missing readings (NaN) leave the average unchanged, and the first
+        # reading of a metric initialises it
+        self.ema = np.where(
+            np.isnan(self.ema),
+            values,
+            np.where(
+                np.isnan(values),
+                self.ema,
+                self.ema + alpha * (values - self.ema),
+            ),
+        )
+        self.values[self._next] = values
+        self.timestamps[self._next] = timestamp
+        self._next = (self._next + 1) % len(self.timestamps)
+
+    def recent(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the buffered timestamps and values, oldest first."""
+        size = min(self.count, len(self.timestamps))
+        order = np.arange(self._next - size, self._next) % len(self.timestamps)
+        return self.timestamps[order], self.values[order]
+
+
+class GPUMetricsStore:
+    """
+    Holds a GPUSeries per (pod, GPU index), so metrics of different pods and
+    GPUs are never mixed, and memory is bounded by the number of live GPUs
+    times ``history``.
+
+    Args:
+        span (int): Span of the exponential moving averages, in samples.
+            Defaults to 25.
+        history (int): Number of samples kept per GPU. Defaults to 256.
+
+    Example:
+
+    .. code-block:: python
+
+        store = GPUMetricsStore()
+        store.update("train-0", "informatics", samples.rounds[-1])
+        store.pod_ema("train-0", "informatics")["utilization"]
+    """
+
+    def __init__(self, span: int = 25, history: int = 256):
+        self.span = span
+        self.history = history
+        # (namespace, pod) -> GPU index -> series
+        self._pods: Dict[Tuple[str, str], Dict[int, GPUSeries]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(gpus) for gpus in self._pods.values())
+
+    def update(
+        self,
+        pod: str,
+        namespace: str,
+        samples: Iterable[GPUSample],
+        timestamp: Optional[float] = None,
+    ):
+        """Adds one round of readings of the GPUs of a pod."""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            gpus = self._pods.setdefault((namespace, pod), {})
+            for sample in samples:
+                series = gpus.get(sample.index)
+                if series is None:
+                    series = gpus[sample.index] = GPUSeries(
+                        self.span, self.history
+                    )
+                series.update(
+                    np.array(
+                        [
+                            sample.memory_total,
+                            sample.memory_used,
+                            sample.utilization,
+                        ]
+                    ),
+                    timestamp,
+                )
+
+    def series(
+        self, pod: str, namespace: str, index: int
+    ) -> Optional[GPUSeries]:
+        with self._lock:
+            return self._pods.get((namespace, pod), {}).get(index)
+
+    def pod_ema(self, pod: str, namespace: str) -> Dict[str, float]:
+        """
+        Returns the moving averages of a pod, averaged over its GPUs, keyed
+        by metric name. Metrics without readings are NaN.
+        """
+        with self._lock:
+            emas = [
+                series.ema
+                for series in self._pods.get((namespace, pod), {}).values()
+            ]
+        if not emas:
+            return {metric: np.nan for metric in METRICS}
+        with warnings.catch_warnings():
+            # GPUs of a pod may all lack a metric, e.g. MIG devices
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            means = np.nanmean(np.vstack(emas), axis=0)
+        return dict(zip(METRICS, means.tolist()))
+
+    def retain(self, pods: Set[Tuple[str, str]]):
+        """Drops the series of the pods not in ``pods``, given as
+        (pod name, namespace) pairs, e.g. once they are deleted."""
+        with self._lock:
+            for namespace, pod in list(self._pods):
+                if (pod, namespace) not in pods:
+                    del self._pods[namespace, pod]
@@ -0,0 +1,301 @@
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from kubernetes import client
+from kubernetes.stream import stream
+from kubernetes.stream.ws_client import ERROR_CHANNEL
+
+from kubejobs.api import get_api_client
+
+logger = logging.getLogger(__name__)
+
+# Seconds allowed to open the exec websocket of a pod
+CONNECT_TIMEOUT = 10
+
+NVIDIA_SMI_QUERY = (
+    "nvidia-smi --query-gpu=index,memory.total,memory.used,utilization.gpu "
+    "--format=csv,noheader,nounits"
+)
+# Printed after each round of nvidia-smi output
+ROUND_SEPARATOR = "---"
+
+
+@dataclass
+class GPUSample:
+    """One nvidia-smi reading of one GPU, memory in MiB and utilization in
+    percent. Readings nvidia-smi reports as [N/A] (e.g. on MIG devices) are
+    NaN."""
+
+    index: int
+    memory_total: float
+    memory_used: float
+    utilization: float
+
+
+@dataclass
+class PodSamples:
+    """The rounds of GPU readings taken in one pod, or the error that
+    prevented them."""
+
+    pod: str
+    namespace: str
+    rounds: List[List[GPUSample]] = field(default_factory=list)
+    error: Optional[str] = None
+    latency: float = 0.0
+
+    @property
+    def gpu_count(self) -> int:
+        """Number of GPUs visible in the pod, from the last round."""
+        return len(self.rounds[-1]) if self.rounds else 0
+
+
+def sampling_command(samples: int = 1, interval: float = 1.0) -> List[str]:
+    """
+    Returns a command taking ``samples`` rounds of nvidia-smi readings,
+    ``interval`` seconds apart, in a single exec.
+
+    Only POSIX sh builtins are used besides nvidia-smi and sleep, so the
+    command works in minimal images.
+    """
+    script = (
+        f"i=0; while [ $i -lt {samples} ]; do "
+        f"{NVIDIA_SMI_QUERY} || exit $?; echo {ROUND_SEPARATOR}; "
+        f"i=$((i+1)); [ $i -lt {samples} ] && sleep {interval}; "
+        "done; exit 0"
+    )
+    return ["/bin/sh", "-c", script]
+
+
+def _to_float(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def parse_sampling_output(output: str) -> List[List[GPUSample]]:
+    """Parses the output of sampling_command into rounds of readings."""
+    rounds, current = [], []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line == ROUND_SEPARATOR:
+            rounds.append(current)
+            current = []
+            continue
+        index, memory_total, memory_used, utilization = (
+            value.strip() for value in line.split(",")
+        )
+        current.append(
+            GPUSample(
+                index=int(index),
+                memory_total=_to_float(memory_total),
+                memory_used=_to_float(memory_used),
+                utilization=_to_float(utilization),
+            )
+        )
+    if current:
+        rounds.append(current)
+    return rounds
+
+
+class CircuitBreaker:
+    """
+    Stops sampling pods that keep failing or timing out.
+
+    After ``failure_threshold`` consecutive failures a pod's circuit opens
+    and it is skipped for ``reset_timeout`` seconds. A single attempt is then
+    let through: a success closes the circuit, a failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 300):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures: Dict[str, int] = {}
+        self._opened_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> bool:
+        with self._lock:
+            opened_at = self._opened_at.get(key)
+            if opened_at is None:
+                return True
+            if time.monotonic() - opened_at >= self.reset_timeout:
+                # Half-open: let one attempt through, and keep the circuit
+                # open for the others until it reports back
+                self._opened_at[key] = time.monotonic()
+                return True
+            return False
+
+    def record_success(self, key: str):
+        with self._lock:
+            self._failures.pop(key, None)
+            self._opened_at.pop(key, None)
+
+    def record_failure(self, key: str):
+        with self._lock:
+            self._failures[key] = self._failures.get(key, 0) + 1
+            if self._failures[key] >= self.failure_threshold:
+                self._opened_at[key] = time.monotonic()
+
+    def is_open(self, key: str) -> bool:
+        with self._lock:
+            return key in self._opened_at
+
+
+class GPUSampler:
+    """
+    Samples nvidia-smi in many pods concurrently, through the API server's
+    websocket exec endpoint rather than one kubectl process per pod.
+
+    All rounds of readings of a pod are taken in a single exec. Pods are
+    sampled from a pool of ``max_workers`` threads that is kept across
+    refreshes, so a refresh takes about as long as the slowest pod rather
+    than the sum over all pods, and never longer than ``timeout`` plus the
+    time spent sampling.
+
+    Args:
+        max_workers (int): Maximum number of pods sampled at once.
+        timeout (float): Seconds allowed per pod, on top of the time the
+            requested rounds take. Pods that run over are reported with an
+            error and count as failures for the circuit breaker.
+        samples (int): Rounds of readings per pod. Defaults to 1.
+        interval (float): Seconds between rounds. Defaults to 1.
+        breaker (CircuitBreaker, optional): Skips pods that keep failing.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 32,
+        timeout: float = 15.0,
+        samples: int = 1,
+        interval: float = 1.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.samples = samples
+        self.interval = interval
+        self.breaker = breaker or CircuitBreaker()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="kubejobs-gpu-sampler"
+        )
+        self._local = threading.local()
+
+    @property
+    def budget(self) -> float:
+        """Seconds allowed for sampling one pod."""
+        return self.timeout + max(0, self.samples - 1) * self.interval
+
+    def _core_api(self) -> client.CoreV1Api:
+        # stream() swaps the transport of the ApiClient it is given for the
+        # duration of the call, so every thread needs its own client; the
+        # configuration (credentials, CA) is shared
+        core_api = getattr(self._local, "core_api", None)
+        if core_api is None:
+            core_api = client.CoreV1Api(
+                client.ApiClient(get_api_client().configuration)
+            )
+            self._local.core_api = core_api
+        return core_api
+
+    def _exec(self, pod: str, namespace: str) -> str:
+        deadline = time.monotonic() + self.budget
+        response = stream(
+            self._core_api().connect_get_namespaced_pod_exec,
+            pod,
+            namespace,
+            command=sampling_command(self.samples, self.interval),
+            stderr=True,
+            stdin=False,
+            stdout=True,
+            tty=False,
+            _preload_content=False,
+            _request_timeout=(CONNECT_TIMEOUT, self.budget),
+        )
+        try:
+            while response.is_open():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"no answer within {self.budget:.0f}s")
+                response.update(timeout=remaining)
+
+            stdout = response.read_stdout(timeout=0) or ""
+            status = response.read_channel(ERROR_CHANNEL, timeout=0)
+            if status and '"Success"' not in status:
+                stderr = response.read_stderr(timeout=0) or ""
+                raise RuntimeError(stderr.strip() or status)
+            return stdout
+        finally:
+            response.close()
+
+    def sample_pod(self, pod: str, namespace: str) -> PodSamples:
+        """Samples the GPUs of one pod, honouring the circuit breaker."""
+        key = f"{namespace}/{pod}"
+        result = PodSamples(pod=pod, namespace=namespace)
+        if not self.breaker.allow(key):
+            result.error = "skipped, pod keeps failing"
+            return result
+
+        start_time = time.monotonic()
+        try:
+            result.rounds = parse_sampling_output(self._exec(pod, namespace))
+        except Exception as e:
+            result.error = str(e) or repr(e)
+            self.breaker.record_failure(key)
+        else:
+            self.breaker.record_success(key)
+        result.latency = time.monotonic() - start_time
+        return result
+
+    def sample(
+        self, pods: Iterable[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], PodSamples]:
+        """
+        Samples many pods concurrently.
+
+        Args:
+            pods (Iterable[Tuple[str, str]]): (pod name, namespace) pairs.
+
+        Returns:
+            Dict[Tuple[str, str], PodSamples]: The samples of every pod, keyed
+                by (pod name, namespace). Pods not sampled when the time
+                budget runs out are reported as timed out, without waiting
+                for them; those still queued count as failures.
+        """
+        futures = {
+            self._executor.submit(self.sample_pod, pod, namespace): (
+                pod,
+                namespace,
+            )
+            for pod, namespace in pods
+        }
+        # Connecting to a pod is not covered by the per-pod deadline, so the
+        # whole batch gets an overall one: a budget per wave of workers, plus
+        # one to spare
+        waves = math.ceil(len(futures) / self.max_workers)
+        done, not_done = wait(futures, timeout=self.budget * (waves + 1))
+
+        results = {futures[future]: future.result() for future in done}
+        for future in not_done:
+            pod, namespace = futures[future]
+            # Pods still queued are not sampled after the fact, and count as
+            # failures; pods being sampled report their own outcome to the
+            # circuit breaker when they finish
+            if future.cancel():
+                self.breaker.record_failure(f"{namespace}/{pod}")
+            results[pod, namespace] = PodSamples(
+                pod=pod, namespace=namespace, error="timed out"
+            )
+        return results
+
+    def close(self):
+        # Every sample call cancels what it left queued, so no queued work
+        # remains; shutdown's cancel_futures would need Python 3.9
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,602 @@
+import atexit
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from kubejobs.gpu_accounting import (
+    UNKNOWN,
+    USER_LABEL,
+    pod_gpu_product,
+    pod_gpu_request,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Rows are written to <root>/<table>/date=YYYY-MM-DD/part-*.parquet
+PARTITIONING_FIELD = "date"
+DELETED = "Deleted"
+
+
+def _timestamp():
+    return pa.timestamp("us", tz="UTC")
+
+
+def _schemas() -> Dict[str, "pa.Schema"]:
+    return {
+        "pods": pa.schema(
+            [
+                ("snapshot_time", _timestamp()),
+                ("namespace", pa.string()),
+                ("name", pa.string()),
+                ("uid", pa.string()),
+                ("user", pa.string()),
+                ("job", pa.string()),
+                ("phase", pa.string()),
+                ("node", pa.string()),
+                ("gpu_product", pa.string()),
+                ("gpus", pa.int32()),
+                ("cpu_request", pa.string()),
+                ("memory_request", pa.string()),
+                ("created", _timestamp()),
+                ("started", _timestamp()),
+                ("row_hash", pa.uint64()),
+            ]
+        ),
+        "jobs": pa.schema(
+            [
+                ("snapshot_time", _timestamp()),
+                ("namespace", pa.string()),
+                ("name", pa.string()),
+                ("uid", pa.string()),
+                ("user", pa.string()),
+                ("gpu_product", pa.string()),
+                ("gpus", pa.int32()),
+                ("completions", pa.int32()),
+                ("active", pa.int32()),
+                ("succeeded", pa.int32()),
+                ("failed", pa.int32()),
+                ("condition", pa.string()),
+                ("created", _timestamp()),
+                ("started", _timestamp()),
+                ("completed", _timestamp()),
+                ("row_hash", pa.uint64()),
+            ]
+        ),
+        "gpu_samples": pa.schema(
+            [
+                ("snapshot_time", _timestamp()),
+                ("namespace", pa.string()),
+                ("pod", pa.string()),
+                ("gpu_index", pa.int16()),
+                ("memory_total", pa.float32()),
+                ("memory_used", pa.float32()),
+                ("utilization", pa.float32()),
+            ]
+        ),
+    }
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError(
+            "The snapshot history needs pyarrow, install it with "
+            "`pip install kubejobs[history]`"
+        )
+
+
+def _pod_record(pod: dict) -> dict:
+    metadata = pod["metadata"]
+    spec = pod.get("spec") or {}
+    status = pod.get("status") or {}
+    labels = metadata.get("labels") or {}
+    requests = (
+        (spec.get("containers") or [{}])[0].get("resources") or {}
+    ).get("requests") or {}
+    return {
+        "namespace": metadata.get("namespace", ""),
+        "name": metadata["name"],
+        "uid": metadata.get("uid", metadata["name"]),
+        "user": labels.get(USER_LABEL, UNKNOWN),
+        "job": labels.get("job-name"),
+        "phase": status.get("phase", UNKNOWN),
+        "node": spec.get("nodeName"),
+        "gpu_product": pod_gpu_product(pod),
+        "gpus": pod_gpu_request(pod),
+        "cpu_request": requests.get("cpu"),
+        "memory_request": requests.get("memory"),
+        "created": metadata.get("creationTimestamp"),
+        "started": status.get("startTime"),
+    }
+
+
+def _job_record(job: dict) -> dict:
+    metadata = job["metadata"]
+    spec = job.get("spec") or {}
+    status = job.get("status") or {}
+    template = spec.get("template") or {}
+    conditions = status.get("conditions") or []
+    return {
+        "namespace": metadata.get("namespace", ""),
+        "name": metadata["name"],
+        "uid": metadata.get("uid", metadata["name"]),
+        "user": (metadata.get("labels") or {}).get(USER_LABEL, UNKNOWN),
+        "gpu_product": pod_gpu_product(template),
+        "gpus": pod_gpu_request(template),
+        "completions": spec.get("completions"),
+        "active": status.get("active", 0),
+        "succeeded": status.get("succeeded", 0),
+        "failed": status.get("failed", 0),
+        "condition": conditions[-1]["type"] if conditions else None,
+        "created": metadata.get("creationTimestamp"),
+        "started": status.get("startTime"),
+        "completed": status.get("completionTime"),
+    }
+
+
+class HistoryWriter:
+    """
+    Appends snapshots of pods, jobs and GPU samples to a Parquet dataset,
+    partitioned by table and day.
+
+    Pod and job rows are only written when an object changed since its last
+    written row, which is detected by hashing the row without its snapshot
+    time, so a dashboard refreshing every few seconds writes a row per state
+    change rather than per refresh. The first snapshot of each day writes
+    every object again, so a day's partition and the one before it hold the
+    state of every object that day, and queries read no further back. Rows
+    are buffered and written at most every ``flush_interval`` seconds, on
+    close and at interpreter exit.
+
+    Args:
+        root (str | Path): Directory of the dataset.
+        flush_interval (float): Seconds between writes of buffered rows.
+            Defaults to 60.
+        state_days (int): Days of existing partitions read (a few columns)
+            to restore the last row of each object on start, so restarts do
+            not duplicate unchanged rows. Defaults to 7.
+
+    Example:
+
+    .. code-block:: python
+
+        writer = HistoryWriter("~/.kubejobs/history")
+        writer.write_pods(informer.pods.list(), complete=True)
+        read_history("~/.kubejobs/history", "pods", columns=["user", "gpus"])
+    """
+
+    def __init__(
+        self,
+        root: Union[str, Path],
+        flush_interval: float = 60.0,
+        state_days: int = 7,
+    ):
+        _require_pyarrow()
+        self.root = Path(root).expanduser()
+        self.flush_interval = flush_interval
+        self.state_days = state_days
+        self.schemas = _schemas()
+        self._buffers: Dict[str, List[pd.DataFrame]] = {
+            table: [] for table in self.schemas
+        }
+        # table -> uid -> (hash, day) of its last written row, for pods and
+        # jobs
+        self._last_rows: Dict[str, Dict[str, Tuple[int, str]]] = {}
+        self._last_flush = datetime.now(timezone.utc)
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _restore_state(self, table: str) -> Dict[str, Tuple[int, str]]:
+        start = datetime.now(timezone.utc) - timedelta(days=self.state_days)
+        frame = read_history(
+            self.root,
+            table,
+            columns=(
+                ["snapshot_time", "uid", "phase", "row_hash"]
+                if table == "pods"
+                else ["snapshot_time", "uid", "condition", "row_hash"]
+            ),
+            start=start,
+        )
+        if frame.empty:
+            return {}
+        last = frame.sort_values("snapshot_time").drop_duplicates(
+            "uid", keep="last"
+        )
+        status_column = "phase" if table == "pods" else "condition"
+        last = last[last[status_column] != DELETED]
+        return dict(
+            zip(
+                last["uid"],
+                zip(
+                    last["row_hash"].astype("uint64"),
+                    last["snapshot_time"].dt.strftime("%Y-%m-%d"),
+                ),
+            )
+        )
+
+    def _append(
+        self,
+        table: str,
+        records: List[dict],
+        snapshot_time: datetime,
+        complete: bool,
+    ) -> int:
+        schema = self.schemas[table]
+        frame = pd.DataFrame.from_records(
+            records,
+            columns=[
+                name
+                for name in schema.names
+                if name not in ("snapshot_time", "row_hash")
+            ],
+        )
+        # Fixed dtypes, so the same row always hashes to the same value
+        for column in schema.names:
+            if column not in frame:
+                continue
+            field_type = schema.field(column).type
+            if pa.types.is_timestamp(field_type):
+                frame[column] = pd.to_datetime(frame[column], utc=True)
+            elif pa.types.is_integer(field_type):
+                frame[column] = frame[column].astype("Int64")
+        frame["row_hash"] = pd.util.hash_pandas_object(
+            frame, index=False
+        ).to_numpy(dtype=np.uint64)
+
+        day = pd.Timestamp(snapshot_time).strftime("%Y-%m-%d")
+        with self._lock:
+            last_rows = self._last_rows.get(table)
+            if last_rows is None:
+                last_rows = self._last_rows[table] = self._restore_state(table)
+
+            # Rows that changed, or were last written on an earlier day. A
+            # boolean array, not a list: an empty list would select columns
+            changed = frame.loc[
+                np.array(
+                    [
+                        last_rows.get(uid) != (row_hash, day)
+                        for uid, row_hash in zip(
+                            frame["uid"], frame["row_hash"]
+                        )
+                    ],
+                    dtype=bool,
+                )
+            ]
+
+            last_rows.update(
+                (uid, (row_hash, day))
+                for uid, row_hash in zip(changed["uid"], changed["row_hash"])
+            )
+
+            if complete:
+                # Objects missing from a full snapshot were deleted
+                gone = set(last_rows) - set(frame["uid"])
+                if gone:
+                    changed = pd.concat(
+                        [changed, self._tombstones(table, gone)],
+                        ignore_index=True,
+                    )
+                    for uid in gone:
+                        del last_rows[uid]
+
+            changed = changed.assign(snapshot_time=snapshot_time)
+            self._buffers[table].append(changed)
+        self._maybe_flush()
+        return len(changed)
+
+    def _tombstones(self, table: str, uids: Iterable[str]) -> pd.DataFrame:
+        status_column = "phase" if table == "pods" else "condition"
+        return pd.DataFrame(
+            {"uid": list(uids), status_column: DELETED, "row_hash": 0}
+        ).astype({"row_hash": np.uint64})
+
+    def write_pods(
+        self,
+        pods: Iterable[dict],
+        snapshot_time: Optional[datetime] = None,
+        complete: bool = False,
+    ) -> int:
+        """
+        Records the pods that changed since their last recorded state.
+
+        Args:
+            pods (Iterable[dict]): Pod objects.
+            snapshot_time (datetime, optional): Defaults to now.
+            complete (bool): Whether ``pods`` are all the pods followed, in
+                which case previously seen pods missing from it are recorded
+                as deleted. Leave False for partial listings.
+
+        Returns:
+            int: Number of rows recorded.
+        """
+        return self._append(
+            "pods",
+            [_pod_record(pod) for pod in pods],
+            snapshot_time or datetime.now(timezone.utc),
+            complete,
+        )
+
+    def write_jobs(
+        self,
+        jobs: Iterable[dict],
+        snapshot_time: Optional[datetime] = None,
+        complete: bool = False,
+    ) -> int:
+        """Records the jobs that changed since their last recorded state, see
+        write_pods."""
+        return self._append(
+            "jobs",
+            [_job_record(job) for job in jobs],
+            snapshot_time or datetime.now(timezone.utc),
+            complete,
+        )
+
+    def write_gpu_samples(
+        self, samples: Iterable, snapshot_time: Optional[datetime] = None
+    ) -> int:
+        """Records the last round of readings of each PodSamples."""
+        snapshot_time = snapshot_time or datetime.now(timezone.utc)
+        records = [
+            {
+                "namespace": pod_samples.namespace,
+                "pod": pod_samples.pod,
+                "gpu_index": gpu.index,
+                "memory_total": gpu.memory_total,
+                "memory_used": gpu.memory_used,
+                "utilization": gpu.utilization,
+            }
+            for pod_samples in samples
+            if pod_samples.rounds
+            for gpu in pod_samples.rounds[-1]
+        ]
+        if records:
+            with self._lock:
+                self._buffers["gpu_samples"].append(
+                    pd.DataFrame.from_records(records).assign(
+                        snapshot_time=snapshot_time
+                    )
+                )
+            self._maybe_flush()
+        return len(records)
+
+    def _maybe_flush(self):
+        elapsed = datetime.now(timezone.utc) - self._last_flush
+        if elapsed.total_seconds() >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows, one file per table and day."""
+        with self._lock:
+            buffers = {
+                table: frames
+                for table, frames in self._buffers.items()
+                if frames
+            }
+            for table in buffers:
+                self._buffers[table] = []
+            self._last_flush = datetime.now(timezone.utc)
+
+        for table, frames in buffers.items():
+            frame = pd.concat(frames, ignore_index=True)
+            schema = self.schemas[table]
+            days = frame["snapshot_time"].dt.strftime("%Y-%m-%d")
+            for day, rows in frame.groupby(days):
+                directory = self.root / table / f"{PARTITIONING_FIELD}={day}"
+                directory.mkdir(parents=True, exist_ok=True)
+                arrow_table = pa.Table.from_pandas(
+                    rows.reindex(columns=schema.names),
+                    schema=schema,
+                    preserve_index=False,
+                )
+                path = directory / f"part-{uuid.uuid4().hex}.parquet"
+                pq.write_table(arrow_table, path, compression="zstd")
+                logger.debug(f"Wrote {len(rows)} {table} rows to {path}")
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.close)
+
+    def __enter__(self) -> "HistoryWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _as_utc(value: Union[str, datetime, pd.Timestamp]) -> pd.Timestamp:
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize("UTC")
+    return timestamp.tz_convert("UTC")
+
+
+def read_history(
+    root: Union[str, Path],
+    table: str,
+    columns: Optional[Sequence[str]] = None,
+    start: Optional[Union[str, datetime]] = None,
+    end: Optional[Union[str, datetime]] = None,
+    filter=None,
+) -> pd.DataFrame:
+    """
+    Loads rows of a history table, reading only the requested columns and
+    only the daily partitions overlapping the time range.
+
+    Args:
+        root (str | Path): Directory of the dataset.
+        table (str): "pods", "jobs" or "gpu_samples".
+        columns (Sequence[str], optional): Columns to load. Defaults to all.
+        start, end (str | datetime, optional): Range of snapshot times,
+            start inclusive and end exclusive. Naive times are UTC.
+        filter (pyarrow.compute.Expression, optional): Extra row filter,
+            e.g. ``pc.field("user") == "jane"``.
+
+    Returns:
+        pd.DataFrame: The matching rows.
+    """
+    _require_pyarrow()
+    schema = _schemas()[table]
+    directory = Path(root).expanduser() / table
+    columns = list(columns) if columns is not None else schema.names
+    if not directory.exists():
+        return pa.Table.from_pylist(
+            [], schema=pa.schema([schema.field(c) for c in columns])
+        ).to_pandas()
+
+    dataset = ds.dataset(
+        directory,
+        format="parquet",
+        schema=schema.append(pa.field(PARTITIONING_FIELD, pa.string())),
+        partitioning=ds.partitioning(
+            pa.schema([(PARTITIONING_FIELD, pa.string())]), flavor="hive"
+        ),
+    )
+
+    expression = None
+    conditions = []
+    if start is not None:
+        start = _as_utc(start)
+        conditions += [
+            ds.field(PARTITIONING_FIELD) >= start.strftime("%Y-%m-%d"),
+            ds.field("snapshot_time") >= pa.scalar(start, _timestamp()),
+        ]
+    if end is not None:
+        end = _as_utc(end)
+        conditions += [
+            ds.field(PARTITIONING_FIELD) <= end.strftime("%Y-%m-%d"),
+            ds.field("snapshot_time") < pa.scalar(end, _timestamp()),
+        ]
+    if filter is not None:
+        conditions.append(filter)
+    for condition in conditions:
+        expression = (
+            condition if expression is None else expression & condition
+        )
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def _state_intervals(frame: pd.DataFrame, end: pd.Timestamp) -> pd.DataFrame:
+    """Turns change rows into intervals during which each state held: from
+    a row's snapshot time to the next row of the same object, or ``end``."""
+    frame = frame.sort_values(["uid", "snapshot_time"], kind="stable")
+    following = frame.groupby("uid", sort=False)["snapshot_time"].shift(-1)
+    return frame.assign(
+        interval_start=frame["snapshot_time"],
+        interval_end=following.fillna(end),
+    )
+
+
+def gpu_hours(
+    root: Union[str, Path],
+    start: Union[str, datetime],
+    end: Optional[Union[str, datetime]] = None,
+    by: Sequence[str] = ("user",),
+    lookback: timedelta = timedelta(days=1),
+    max_gap: Optional[timedelta] = timedelta(hours=1),
+) -> pd.DataFrame:
+    """
+    Computes the GPU-hours of running pods between ``start`` and ``end``,
+    e.g. ``gpu_hours(root, start="2024-05-01", by=["user", "gpu_product"])``.
+
+    Pod states recorded up to ``lookback`` before the day of ``start`` are
+    read too, so pods already running at ``start`` are counted from it.
+    Since HistoryWriter records every pod again on its first snapshot of
+    each day, the default of a day covers all of them; only the partitions
+    from there to ``end`` are read.
+
+    Each state lasts until the pod's next row. The history cannot tell a
+    pod that kept running unchanged after its last row from a writer that
+    stopped, so last states count for at most ``max_gap`` past the latest
+    row of any pod, rather than up to ``end``; pass None to count them up
+    to ``end``.
+
+    Returns:
+        pd.DataFrame: The ``by`` columns and their "gpu_hours", largest first.
+    """
+    start = _as_utc(start)
+    end = _as_utc(end) if end is not None else pd.Timestamp.now(tz="UTC")
+    frame = read_history(
+        root,
+        "pods",
+        columns=["snapshot_time", "uid", "phase", "gpus", *by],
+        start=(start - lookback).floor("D"),
+        end=end,
+    )
+    last_state_end = end
+    if max_gap is not None and not frame.empty:
+        last_state_end = min(end, frame["snapshot_time"].max() + max_gap)
+    intervals = _state_intervals(frame, last_state_end)
+    intervals = intervals[
+        (intervals["phase"] == "Running") & (intervals["interval_end"] > start)
+    ]
+    overlap = intervals["interval_end"].clip(upper=end) - intervals[
+        "interval_start"
+    ].clip(lower=start)
+    intervals = intervals.assign(
+        gpu_hours=intervals["gpus"] * overlap.dt.total_seconds() / 3600
+    )
+    return (
+        intervals.groupby(list(by), observed=True)["gpu_hours"]
+        .sum()
+        .reset_index()
+        .sort_values("gpu_hours", ascending=False, ignore_index=True)
+    )
+
+
+def queue_times(
+    root: Union[str, Path],
+    start: Optional[Union[str, datetime]] = None,
+    end: Optional[Union[str, datetime]] = None,
+    by: Sequence[str] = ("gpu_product",),
+) -> pd.DataFrame:
+    """
+    Summarises how long jobs created between ``start`` and ``end`` waited
+    between their creation and their start (e.g. their Kueue admission).
+
+    Returns:
+        pd.DataFrame: The ``by`` columns with the "jobs" count and the
+            "median_seconds", "mean_seconds" and "p90_seconds" queue times.
+    """
+    # Jobs are recorded after their creation, so only the partitions from
+    # ``start`` on are read
+    frame = read_history(
+        root,
+        "jobs",
+        columns=["uid", "created", "started", *by],
+        start=start,
+        end=end,
+    )
+    frame = frame.dropna(subset=["created", "started"]).drop_duplicates(
+        "uid", keep="last"
+    )
+    if start is not None:
+        frame = frame[frame["created"] >= _as_utc(start)]
+    if end is not None:
+        frame = frame[frame["created"] < _as_utc(end)]
+    frame = frame.assign(
+        queue_seconds=(frame["started"] - frame["created"]).dt.total_seconds()
+    )
+    return (
+        frame.groupby(list(by), observed=True)["queue_seconds"]
+        .agg(
+            jobs="size",
+            median_seconds="median",
+            mean_seconds="mean",
+            p90_seconds=lambda seconds: seconds.quantile(0.9),
+        )
+        .reset_index()
+    )
@@ -0,0 +1,429 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from kubernetes import client
+from kubernetes.watch.watch import iter_resp_lines
+
+from kubejobs.api import (
+    get_batch_api,
+    get_core_api,
+    get_current_namespace,
+    list_pages,
+)
+from kubejobs.pvc_usage import claim_names
+
+logger = logging.getLogger(__name__)
+
+# Kinds of objects followed, as passed to event handlers
+PODS = "pods"
+JOBS = "jobs"
+PVCS = "pvcs"
+
+# (kind, event type, object) -> None, with event types ADDED, MODIFIED and
+# DELETED as in the watch API
+EventHandler = Callable[[str, str, dict], None]
+Indexer = Callable[[dict], Iterable[str]]
+
+
+def _label(name: str) -> Indexer:
+    def indexer(obj: dict) -> List[str]:
+        value = (obj["metadata"].get("labels") or {}).get(name)
+        return [value] if value is not None else []
+
+    return indexer
+
+
+def _node_name(pod: dict) -> List[str]:
+    node = (pod.get("spec") or {}).get("nodeName")
+    return [node] if node else []
+
+
+POD_INDEXERS: Dict[str, Indexer] = {
+    "user": _label("eidf/user"),
+    "job-name": _label("job-name"),
+    "node": _node_name,
+    "pvc": claim_names,
+}
+JOB_INDEXERS: Dict[str, Indexer] = {"user": _label("eidf/user")}
+PVC_INDEXERS: Dict[str, Indexer] = {"user": _label("eidf/user")}
+
+
+def object_key(obj: dict) -> str:
+    metadata = obj["metadata"]
+    return f"{metadata.get('namespace', '')}/{metadata['name']}"
+
+
+class Store:
+    """
+    A thread-safe in-memory store of Kubernetes objects (as plain dicts),
+    with secondary indexes maintained on every update.
+
+    Args:
+        indexers (Dict[str, Indexer]): Index name to a function returning the
+            values an object is indexed under, e.g. the claims a pod mounts.
+    """
+
+    def __init__(self, indexers: Optional[Dict[str, Indexer]] = None):
+        self.indexers = indexers or {}
+        self._items: Dict[str, dict] = {}
+        self._indexes: Dict[str, Dict[str, set]] = {
+            name: defaultdict(set) for name in self.indexers
+        }
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _unindex(self, key: str, obj: dict):
+        for name, indexer in self.indexers.items():
+            index = self._indexes[name]
+            for value in indexer(obj):
+                keys = index.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[value]
+
+    def _index(self, key: str, obj: dict):
+        for name, indexer in self.indexers.items():
+            for value in indexer(obj):
+                self._indexes[name][value].add(key)
+
+    def upsert(self, obj: dict) -> Optional[dict]:
+        """Adds or replaces an object, returning the previous version."""
+        key = object_key(obj)
+        with self._lock:
+            previous = self._items.get(key)
+            if previous is not None:
+                self._unindex(key, previous)
+            self._items[key] = obj
+            self._index(key, obj)
+        return previous
+
+    def delete(self, obj: dict) -> Optional[dict]:
+        """Removes an object, returning the stored version if any."""
+        key = object_key(obj)
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._unindex(key, previous)
+        return previous
+
+    def replace(self, objs: Iterable[dict]) -> List[Tuple[str, dict]]:
+        """
+        Replaces the whole content of the store, e.g. after a relist.
+
+        Returns:
+            List[Tuple[str, dict]]: The ADDED, MODIFIED and DELETED events
+                that turn the previous content into the new one.
+        """
+        events = []
+        with self._lock:
+            stale = dict(self._items)
+            for obj in objs:
+                previous = self.upsert(obj)
+                stale.pop(object_key(obj), None)
+                if previous is None:
+                    events.append(("ADDED", obj))
+                elif previous["metadata"].get("resourceVersion") != obj[
+                    "metadata"
+                ].get("resourceVersion"):
+                    events.append(("MODIFIED", obj))
+            for obj in stale.values():
+                self.delete(obj)
+                events.append(("DELETED", obj))
+        return events
+
+    def get(self, name: str, namespace: str) -> Optional[dict]:
+        with self._lock:
+            return self._items.get(f"{namespace}/{name}")
+
+    def list(self) -> List[dict]:
+        """Returns a snapshot of all objects. The objects are shared with the
+        store and must not be modified."""
+        with self._lock:
+            return list(self._items.values())
+
+    def by_index(self, index: str, value: str) -> List[dict]:
+        """Returns the objects indexed under ``value``, e.g.
+        ``pods.by_index("pvc", "gate-pvc-3")``."""
+        with self._lock:
+            return [
+                self._items[key] for key in self._indexes[index].get(value, ())
+            ]
+
+    def index_values(self, index: str) -> List[str]:
+        """Returns every value present in an index, e.g. all node names."""
+        with self._lock:
+            return list(self._indexes[index].keys())
+
+
+class Reflector(threading.Thread):
+    """
+    Keeps a Store in sync with one kind of object: lists it once, then
+    follows a watch from the list's resourceVersion. When the watch expires
+    (HTTP 410 Gone) or fails, the objects are listed again.
+
+    Args:
+        kind (str): Name of the kind, passed to the event handlers.
+        list_fn (Callable): Namespaced list method, e.g.
+            CoreV1Api.list_namespaced_pod.
+        namespace (str): Namespace to list and watch.
+        store (Store): Store to keep in sync.
+        handlers (List[EventHandler]): Called with every change.
+        label_selector (str, optional): Restricts the listed objects.
+        watch_timeout (int): Seconds after which the server closes a watch,
+            which is then resumed. Defaults to 300.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        list_fn: Callable,
+        namespace: str,
+        store: Store,
+        handlers: List[EventHandler],
+        label_selector: Optional[str] = None,
+        watch_timeout: int = 300,
+    ):
+        super().__init__(name=f"kubejobs-{kind}-reflector", daemon=True)
+        self.kind = kind
+        self.list_fn = list_fn
+        self.namespace = namespace
+        self.store = store
+        self.handlers = handlers
+        self.label_selector = label_selector
+        self.watch_timeout = watch_timeout
+        self.synced = threading.Event()
+        self._stop_event = threading.Event()
+        self._resource_version: Optional[str] = None
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _notify(self, event_type: str, obj: dict):
+        for handler in self.handlers:
+            try:
+                handler(self.kind, event_type, obj)
+            except Exception:
+                logger.exception(f"Event handler failed on {self.kind}")
+
+    def _list(self):
+        items = []
+        resource_version = None
+        for page in list_pages(
+            self.list_fn, self.namespace, label_selector=self.label_selector
+        ):
+            items.extend(page.get("items") or [])
+            resource_version = page["metadata"].get("resourceVersion")
+
+        for event_type, obj in self.store.replace(items):
+            self._notify(event_type, obj)
+        self._resource_version = resource_version
+        self.synced.set()
+
+    def _watch(self):
+        response = self.list_fn(
+            self.namespace,
+            label_selector=self.label_selector,
+            resource_version=self._resource_version,
+            allow_watch_bookmarks=True,
+            timeout_seconds=self.watch_timeout,
+            watch=True,
+            _preload_content=False,
+            _request_timeout=(10, self.watch_timeout + 30),
+        )
+        try:
+            for line in iter_resp_lines(response):
+                if self._stop_event.is_set():
+                    return
+                if not line:
+                    continue
+                event = json.loads(line)
+                event_type, obj = event["type"], event["object"]
+
+                if event_type == "ERROR":
+                    raise client.ApiException(
+                        status=obj.get("code"), reason=obj.get("message")
+                    )
+                self._resource_version = obj["metadata"]["resourceVersion"]
+                if event_type == "BOOKMARK":
+                    continue
+                if event_type == "DELETED":
+                    self.store.delete(obj)
+                else:
+                    self.store.upsert(obj)
+                self._notify(event_type, obj)
+        finally:
+            response.close()
+            response.release_conn()
+
+    def run(self):
+        failures = 0
+        while not self._stop_event.is_set():
+            try:
+                if self._resource_version is None:
+                    self._list()
+                self._watch()
+                failures = 0
+            except client.ApiException as e:
+                if e.status == 410:
+                    logger.debug(f"{self.kind} watch expired, relisting")
+                    self._resource_version = None
+                    continue
+                failures += 1
+                logger.warning(f"{self.kind} watch failed: {e.status} {e}")
+            except Exception as e:
+                failures += 1
+                logger.warning(f"{self.kind} watch failed: {e!r}")
+
+            if failures:
+                # Relist after a jittered, capped backoff
+                self._resource_version = None
+                self._stop_event.wait(
+                    min(30.0, 2**failures) * random.uniform(0.5, 1.0)
+                )
+
+
+class ClusterInformer:
+    """
+    An in-memory, continuously updated view of the pods, jobs and PVCs of a
+    namespace, shared by the tools that read cluster state.
+
+    One list per kind is done on start; afterwards only watch events are
+    received, so reading the current state costs no API calls. Pods are
+    indexed by user label ("user"), job ("job-name"), node ("node") and
+    mounted claim ("pvc"); jobs and PVCs by user label.
+
+    Args:
+        namespace (str, optional): Namespace to follow. Defaults to the
+            current kube config namespace.
+        resources (Sequence[str]): Kinds to follow, among "pods", "jobs"
+            and "pvcs". Defaults to all of them.
+        label_selector (str, optional): Restricts every kind to matching
+            objects, e.g. "eidf/user=jane".
+
+    Example:
+
+    .. code-block:: python
+
+        informer = ClusterInformer("informatics").start()
+        informer.wait_for_sync()
+        pods_on_claim = informer.pods.by_index("pvc", "gate-pvc-3")
+    """
+
+    def __init__(
+        self,
+        namespace: Optional[str] = None,
+        resources: Sequence[str] = (PODS, JOBS, PVCS),
+        label_selector: Optional[str] = None,
+    ):
+        self.namespace = namespace or get_current_namespace()
+        self.resources = tuple(resources)
+        self.pods = Store(POD_INDEXERS)
+        self.jobs = Store(JOB_INDEXERS)
+        self.pvcs = Store(PVC_INDEXERS)
+        self._handlers: List[EventHandler] = []
+
+        list_fns = {
+            PODS: lambda: get_core_api().list_namespaced_pod,
+            JOBS: lambda: get_batch_api().list_namespaced_job,
+            PVCS: lambda: (
+                get_core_api().list_namespaced_persistent_volume_claim
+            ),
+        }
+        unknown = set(resources) - set(list_fns)
+        if unknown:
+            raise ValueError(f"Unknown resources {sorted(unknown)}")
+
+        self._reflectors = {
+            resource: Reflector(
+                kind=resource,
+                list_fn=list_fns[resource](),
+                namespace=self.namespace,
+                store=getattr(self, resource),
+                handlers=self._handlers,
+                label_selector=label_selector,
+            )
+            for resource in resources
+        }
+
+    def add_event_handler(self, handler: EventHandler):
+        """Registers ``handler(kind, event_type, obj)``, called from the
+        reflector threads for every change, including those found on a
+        relist."""
+        self._handlers.append(handler)
+
+    def start(self) -> "ClusterInformer":
+        for reflector in self._reflectors.values():
+            if not reflector.is_alive():
+                reflector.start()
+        return self
+
+    def stop(self):
+        for reflector in self._reflectors.values():
+            reflector.stop()
+
+    def wait_for_sync(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until every followed kind has been listed once."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for reflector in self._reflectors.values():
+            remaining = (
+                None
+                if deadline is None
+                else max(0.0, deadline - time.monotonic())
+            )
+            if not reflector.synced.wait(remaining):
+                return False
+        return True
+
+
+_informers: Dict[str, List[ClusterInformer]] = defaultdict(list)
+_informers_lock = threading.Lock()
+
+
+def get_informer(
+    namespace: Optional[str] = None,
+    timeout: Optional[float] = 60.0,
+    resources: Sequence[str] = (PODS, JOBS, PVCS),
+) -> ClusterInformer:
+    """
+    Returns a process-wide informer of a namespace following at least
+    ``resources``, starting it and waiting for its initial sync on first
+    use.
+
+    Args:
+        namespace (str, optional): Namespace to follow. Defaults to the
+            current kube config namespace.
+        timeout (float, optional): Seconds to wait for the initial sync.
+        resources (Sequence[str]): Kinds needed, among "pods", "jobs" and
+            "pvcs". An informer already following them is reused, otherwise
+            one following only them is started. Defaults to all of them.
+
+    Raises:
+        TimeoutError: If the initial lists did not complete in time.
+    """
+    namespace = namespace or get_current_namespace()
+    with _informers_lock:
+        informer = next(
+            (
+                informer
+                for informer in _informers[namespace]
+                if set(resources) <= set(informer.resources)
+            ),
+            None,
+        )
+        if informer is None:
+            informer = ClusterInformer(namespace, resources).start()
+            _informers[namespace].append(informer)
+
+    if not informer.wait_for_sync(timeout):
+        raise TimeoutError(
+            f"Timed out listing the objects of namespace {namespace}"
+        )
+    return informer
@@ -1,26 +1,49 @@
+import functools
+import getpass
 import grp
+import hashlib
 import json
 import logging
 import os
 import pwd
 import subprocess
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import fire
-import yaml
+import pandas as pd
 from kubernetes import client, config
 from rich.logging import RichHandler
 
+from kubejobs.capacity import NodeShape, node_shape
+from kubejobs.serialization import to_json, to_yaml
+from kubejobs.submission import (
+    SubmittedObject,
+    results_to_frame,
+    submit_indexed_job,
+    submit_job,
+    submit_manifests,
+)
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 handler = RichHandler(markup=True)
 handler.setFormatter(logging.Formatter("%(message)s"))
 logger.addHandler(handler)
 
+# Node shape assumed when the cluster's nodes cannot be listed, see
+# kubejobs.capacity
 MAX_CPU = 192
 MAX_RAM = 890
 MAX_GPU = 8
 
+# Where sweep commands are mounted in the pods of an Indexed Job
+SWEEP_COMMANDS_MOUNT_PATH = "/etc/kubejobs/sweep"
+# ConfigMaps are capped at 1 MiB, keep some headroom for metadata
+MAX_SWEEP_COMMANDS_BYTES = 1000 * 1024
+# Retries per command of a sweep: like a Job, each command runs once, and a
+# failing command does not stop the others
+DEFAULT_SWEEP_BACKOFF_LIMIT_PER_INDEX = 0
+
 # A summary of the GPU setup is:
 
 # * 32 full Nvidia A100 80 GB GPUs
@@ -29,21 +52,29 @@ MAX_GPU = 8
 # * 20 MIG Nvidia A100 40 GB GPU equating to 140 A100 1G.5GB GPUs
 
 
+@functools.lru_cache(maxsize=None)
 def fetch_user_info():
+    # Cached: the login, passwd and group lookups cannot change within a
+    # process, and every KubernetesJob would otherwise repeat them
     user_info = {}
 
-    # Get the current user name
-    user_info["login_user"] = os.getlogin()
+    # Get the current user name; os.getlogin needs a controlling terminal,
+    # which containers and CI runners do not have
+    try:
+        login_user = os.getlogin()
+    except OSError:
+        login_user = getpass.getuser()
+    user_info["login_user"] = login_user
 
     # Get user entry from /etc/passwd
-    pw_entry = pwd.getpwnam(os.getlogin())
+    pw_entry = pwd.getpwnam(login_user)
 
     # Extracting home directory and shell from the password entry
     user_info["home"] = pw_entry.pw_dir
     user_info["shell"] = pw_entry.pw_shell
 
     # Get group IDs
-    group_ids = os.getgrouplist(os.getlogin(), pw_entry.pw_gid)
+    group_ids = os.getgrouplist(login_user, pw_entry.pw_gid)
 
     # Get group names from group IDs
     user_info["groups"] = " ".join(
@@ -53,6 +84,27 @@ def fetch_user_info():
     return user_info
 
 
+def default_shm_size(
+    gpu_product: Optional[str], gpu_limit: int, discover: bool = False
+) -> str:
+    """
+    Returns the default shared memory size of a pod using ``gpu_limit`` GPUs
+    of ``gpu_product``, sized from the node shape of the product (falling
+    back to MAX_CPU, MAX_RAM and MAX_GPU).
+
+    Building a manifest should not need a cluster, so the nodes are only
+    listed when ``discover`` is True; otherwise a node shape is only used if
+    the capacity was already discovered in this process, e.g. by
+    gpu_capacity.
+    """
+    shape = node_shape(
+        gpu_product,
+        fallback=NodeShape(cpu=MAX_CPU, memory_gb=MAX_RAM, gpus=MAX_GPU),
+        fetch=discover,
+    )
+    return f"{int(shape.memory_gb) // max(1, shape.gpus - gpu_limit + 1)}G"
+
+
 class GPU_PRODUCT:
     NVIDIA_A100_SXM4_80GB = "NVIDIA-A100-SXM4-80GB"
     NVIDIA_A100_SXM4_40GB = "NVIDIA-A100-SXM4-40GB"
@@ -84,16 +136,29 @@ class KubernetesJob:
                                                                       NVIDIA-A100-SXM4-40GB-MIG-3g.20gb – just under half-GPU
                                                                       NVIDIA-A100-SXM4-40GB-MIG-1g.5gb – a seventh of a GPU
         gpu_limit (int, optional): Number of GPU resources to allocate. Defaults to None.
-        backoff_limit (int, optional): Maximum number of retries before marking job as failed. Defaults to 4.
+        backoff_limit (int, optional): Maximum number of retries before marking job as failed. Defaults to 0,
+                                       and for sweeps to no overall limit, as their retries are counted per command.
         restart_policy (str, optional): Restart policy for the job, default is "Never".
         shm_size (str, optional): Size of shared memory, e.g. "2Gi". If not set, defaults to None.
         secret_env_vars (dict, optional): Dictionary of secret environment variables. Defaults to None.
         env_vars (dict, optional): Dictionary of normal (non-secret) environment variables. Defaults to None.
         volume_mounts (dict, optional): Dictionary of volume mounts. Defaults to None.
         namespace (str, optional): Namespace of the job. Defaults to None.
+        sweep_commands (List[str], optional): Commands of a sweep to run as a single Indexed Job, one completion per command.
+                                              Each pod runs the command at its JOB_COMPLETION_INDEX, read from a generated ConfigMap.
+                                              Overrides command and args. Defaults to None.
+        parallelism (int, optional): Maximum number of sweep commands running at the same time. Defaults to all of them.
+        backoff_limit_per_index (int, optional): Retries per sweep command, so one failing command does not fail the whole sweep.
+                                                 Requires Kubernetes 1.29+; older clusters fail the sweep once backoff_limit (6 by default) pods have failed.
+                                                 Defaults to DEFAULT_SWEEP_BACKOFF_LIMIT_PER_INDEX, running each command once.
+        discover_node_shape (bool, optional): List the cluster's nodes to size the default shm_size from the node shape of gpu_product.
+                                              Defaults to False, using the static MAX_RAM and MAX_GPU unless the shape was already discovered.
 
     Methods:
-        generate_yaml() -> dict: Generate the Kubernetes Job YAML configuration.
+        generate_dict() -> dict: Generate the Kubernetes Job manifest.
+        generate_yaml() -> str: Generate the Kubernetes Job YAML configuration.
+        generate_json() -> str: Generate the Kubernetes Job JSON configuration.
+        generate_sweep_config_map() -> dict: Generate the ConfigMap holding the sweep commands.
     """
 
     def __init__(
@@ -109,7 +174,7 @@ class KubernetesJob:
         gpu_type: Optional[str] = None,
         gpu_product: Optional[str] = None,
         gpu_limit: Optional[int] = None,
-        backoff_limit: int = 0,
+        backoff_limit: Optional[int] = None,
         restart_policy: str = "Never",
         shm_size: Optional[str] = None,
         secret_env_vars: Optional[dict] = None,
@@ -123,6 +188,10 @@ class KubernetesJob:
         annotations: Optional[dict] = None,
         namespace: Optional[str] = None,
         image_pull_secret: Optional[str] = None,
+        sweep_commands: Optional[List[str]] = None,
+        parallelism: Optional[int] = None,
+        backoff_limit_per_index: Optional[int] = None,
+        discover_node_shape: bool = False,
     ):
         self.name = name
 
@@ -149,7 +218,9 @@ class KubernetesJob:
             else (
                 ram_request
                 if ram_request is not None
-                else f"{MAX_RAM // (MAX_GPU - gpu_limit + 1)}G"
+                else default_shm_size(
+                    gpu_product, gpu_limit, discover=discover_node_shape
+                )
             )
         )
         self.secret_env_vars = secret_env_vars
@@ -185,6 +256,16 @@ class KubernetesJob:
 
         self.namespace = namespace
 
+        self.sweep_commands = (
+            list(sweep_commands) if sweep_commands is not None else None
+        )
+        if self.sweep_commands is not None and not self.sweep_commands:
+            raise ValueError(
+                "sweep_commands must contain at least one command"
+            )
+        self.parallelism = parallelism
+        self.backoff_limit_per_index = backoff_limit_per_index
+
     def _add_shm_size(self, container: dict):
         """Adds shared memory volume if shm_size is set."""
         if self.shm_size:
@@ -248,7 +329,66 @@ class KubernetesJob:
 
         return container
 
-    def generate_yaml(self):
+    def _add_sweep_command(self, container: dict):
+        """Makes the container run the sweep command matching its
+        completion index."""
+        if self.sweep_commands is not None:
+            container["command"] = ["/bin/bash", "-c"]
+            container["args"] = [
+                f'exec /bin/bash "{SWEEP_COMMANDS_MOUNT_PATH}/$JOB_COMPLETION_INDEX"'
+            ]
+            container["volumeMounts"].append(
+                {
+                    "name": "sweep-commands",
+                    "mountPath": SWEEP_COMMANDS_MOUNT_PATH,
+                    "readOnly": True,
+                }
+            )
+
+        return container
+
+    @property
+    def sweep_config_map_name(self) -> str:
+        """Name of the sweep ConfigMap, derived from the commands so that
+        resubmitting the same sweep reuses it."""
+        digest = hashlib.sha1(
+            "\0".join(self.sweep_commands).encode("utf-8")
+        ).hexdigest()
+        return f"{self.name}-sweep-{digest[:10]}"
+
+    def generate_sweep_config_map(self) -> dict:
+        """Generates the ConfigMap holding one command per completion index."""
+        if self.sweep_commands is None:
+            raise ValueError("This job has no sweep_commands")
+
+        data = {
+            str(idx): f"{command}\n"
+            for idx, command in enumerate(self.sweep_commands)
+        }
+        size = sum(len(command.encode("utf-8")) for command in data.values())
+        if size > MAX_SWEEP_COMMANDS_BYTES:
+            raise ValueError(
+                f"The sweep commands take {size} bytes, more than the "
+                f"{MAX_SWEEP_COMMANDS_BYTES} bytes a ConfigMap can hold. "
+                "Split the sweep into several jobs."
+            )
+
+        config_map = {
+            "apiVersion": "v1",
+            "kind": "ConfigMap",
+            "metadata": {
+                "name": self.sweep_config_map_name,
+                "labels": {"eidf/user": self.user_name},
+            },
+            "data": data,
+        }
+        if self.namespace:
+            config_map["metadata"]["namespace"] = self.namespace
+
+        return config_map
+
+    def generate_dict(self) -> dict:
+        """Generates the Kubernetes Job manifest as a dict."""
         container = {
             "name": self.name,
             "image": self.image,
@@ -272,13 +412,14 @@ class KubernetesJob:
             or self.gpu_product is None
         ):
             container["resources"] = {
-                "limits": {f"{self.gpu_type}": self.gpu_limit}
+                "limits": {f"{self.gpu_type}": str(self.gpu_limit)}
             }
 
         container = self._add_shm_size(container)
         container = self._add_env_vars(container)
         container = self._add_volume_mounts(container)
         container = self._add_privileged_security_context(container)
+        container = self._add_sweep_command(container)
 
         if (
             self.cpu_request is not None
@@ -292,8 +433,8 @@ class KubernetesJob:
                 container["resources"]["requests"] = {}
 
         if self.cpu_request is not None:
-            container["resources"]["requests"]["cpu"] = self.cpu_request
-            container["resources"]["limits"]["cpu"] = self.cpu_request
+            container["resources"]["requests"]["cpu"] = str(self.cpu_request)
+            container["resources"]["limits"]["cpu"] = str(self.cpu_request)
 
         if self.ram_request is not None:
             container["resources"]["requests"]["memory"] = self.ram_request
@@ -305,9 +446,9 @@ class KubernetesJob:
             ] = self.storage_request
 
         if self.gpu_type is not None and self.gpu_limit is not None:
-            container["resources"]["limits"][
-                f"{self.gpu_type}"
-            ] = self.gpu_limit
+            container["resources"]["limits"][f"{self.gpu_type}"] = str(
+                self.gpu_limit
+            )
 
         job = {
             "apiVersion": "batch/v1",
@@ -330,10 +471,35 @@ class KubernetesJob:
                         "volumes": [],
                     },
                 },
-                "backoffLimit": self.backoff_limit,
             },
         }
 
+        if self.sweep_commands is None:
+            job["spec"]["backoffLimit"] = (
+                self.backoff_limit if self.backoff_limit is not None else 0
+            )
+        else:
+            job["spec"]["completionMode"] = "Indexed"
+            job["spec"]["completions"] = len(self.sweep_commands)
+            job["spec"]["parallelism"] = self.parallelism or len(
+                self.sweep_commands
+            )
+            # Failures are counted per command; an overall backoffLimit
+            # would fail the whole sweep on the first failing commands
+            job["spec"]["backoffLimitPerIndex"] = (
+                self.backoff_limit_per_index
+                if self.backoff_limit_per_index is not None
+                else DEFAULT_SWEEP_BACKOFF_LIMIT_PER_INDEX
+            )
+            if self.backoff_limit is not None:
+                job["spec"]["backoffLimit"] = self.backoff_limit
+            job["spec"]["template"]["spec"]["volumes"].append(
+                {
+                    "name": "sweep-commands",
+                    "configMap": {"name": self.sweep_config_map_name},
+                }
+            )
+
         if self.job_deadlineseconds:
             job["spec"]["activeDeadlineSeconds"] = self.job_deadlineseconds
 
@@ -385,53 +551,47 @@ class KubernetesJob:
                 {"name": self.image_pull_secret}
             ]
 
-        return yaml.dump(job)
+        return job
+
+    def generate_yaml(self) -> str:
+        """Generates the Kubernetes Job manifest as YAML."""
+        return to_yaml(self.generate_dict())
+
+    def generate_json(self, indent: Optional[int] = None) -> str:
+        """Generates the Kubernetes Job manifest as JSON."""
+        return to_json(self.generate_dict(), indent=indent)
+
+    def submit(self) -> SubmittedObject:
+        """Creates the job through the Kubernetes API and returns the name
+        and UID the API server assigned to it."""
+        job_dict = self.generate_dict()
+        if self.sweep_commands is not None:
+            return submit_indexed_job(
+                job_dict,
+                self.generate_sweep_config_map(),
+                namespace=self.namespace,
+            )
+        return submit_job(job_dict, namespace=self.namespace)
 
     def run(self):
-        config.load_kube_config()
-
-        job_yaml = self.generate_yaml()
-
-        # Save the generated YAML to a temporary file
-        with open("temp_job.yaml", "w") as temp_file:
-            temp_file.write(job_yaml)
-
-        job_dict = yaml.safe_load(job_yaml)
-
-        # Run the kubectl command -- if generateName is being used, use kubectl create instead of apply
-        if "generateName" in job_dict.get("metadata", {}):
-            cmd = ["kubectl", "create", "-f", "temp_job.yaml"]
-        else:
-            cmd = ["kubectl", "apply", "-f", "temp_job.yaml"]
-
         try:
-            result = subprocess.run(
-                cmd,
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
-            # Remove the temporary file
-            os.remove("temp_job.yaml")
-            return result.returncode
-        except subprocess.CalledProcessError as e:
+            submitted = self.submit()
+        except client.ApiException as e:
             logger.info(
-                f"Command '{' '.join(cmd)}' failed with return code {e.returncode}."
+                f"Creating job '{self.name}' failed with status {e.status}."
             )
-            logger.info(f"Stdout:\n{e.stdout}")
-            logger.info(f"Stderr:\n{e.stderr}")
-            # Remove the temporary file
-            os.remove("temp_job.yaml")
-            return e.returncode  # return the exit code
+            logger.info(f"Reason:\n{e.reason}")
+            logger.info(f"Body:\n{e.body}")
+            return 1  # return the exit code
         except Exception as e:
             logger.exception(
-                f"An unexpected error occurred while running '{' '.join(cmd)}'."
+                f"An unexpected error occurred while creating job '{self.name}'."
             )  # This logs the traceback too
-            # Remove the temporary file
-            os.remove("temp_job.yaml")
             return 1  # return the exit code
 
+        logger.info(f"Created job {submitted.name} (uid {submitted.uid})")
+        return 0
+
     @classmethod
     def from_command_line(cls):
         """Create a KubernetesJob instance from command-line arguments
@@ -441,6 +601,104 @@ class KubernetesJob:
         fire.Fire(cls)
 
 
+class KubernetesJobTemplate:
+    """
+    A precompiled Kubernetes Job manifest for building many similar jobs cheaply.
+
+    The user identity, labels, annotations, volumes and resources are resolved once, when
+    the template is created. Each call to render() then only patches the name, command, args
+    and environment of a shallow copy of the precompiled manifest, so building thousands
+    of per-experiment manifests costs microseconds each and makes no system calls.
+
+    The rendered manifests share their unpatched parts (labels, volumes, resources, ...) with
+    the template and with each other, so they should be treated as read-only.
+
+    Args:
+        name (str): Default name prefix for the rendered jobs.
+        *args, **kwargs: Passed to the KubernetesJob constructor.
+
+    Methods:
+        render(name, command, args, env_vars) -> dict: Build the manifest of one job.
+        render_commands(commands) -> Iterator[Tuple[str, dict]]: Build one manifest per command.
+    """
+
+    def __init__(self, name: str, *args, **kwargs):
+        self.name = name
+        self.job = KubernetesJob(name, *args, **kwargs)
+        self.manifest = self.job.generate_dict()
+
+    def render(
+        self,
+        name: str,
+        command: Optional[List[str]] = None,
+        args: Optional[List[str]] = None,
+        env_vars: Optional[Dict[str, str]] = None,
+    ) -> dict:
+        """
+        Builds the manifest of one job from the template.
+
+        Args:
+            name (str): Name of the job and its container.
+            command (List[str], optional): Command replacing the template's one.
+            args (List[str], optional): Arguments replacing the template's ones.
+            env_vars (Dict[str, str], optional): Environment variables added to, or
+                overriding, the template's ones.
+
+        Returns:
+            dict: The Job manifest.
+        """
+        manifest = self.manifest
+        pod_template = manifest["spec"]["template"]
+        containers = pod_template["spec"]["containers"]
+
+        container = dict(containers[0], name=name)
+        if command is not None:
+            container["command"] = command
+        if args is not None:
+            container["args"] = args
+        if env_vars:
+            container["env"] = [
+                {"name": key, "value": value}
+                for key, value in env_vars.items()
+            ] + [
+                env_var
+                for env_var in containers[0]["env"]
+                if env_var["name"] not in env_vars
+            ]
+
+        pod_spec = dict(
+            pod_template["spec"], containers=[container, *containers[1:]]
+        )
+        return dict(
+            manifest,
+            metadata=dict(manifest["metadata"], generateName=f"{name}-"),
+            spec=dict(
+                manifest["spec"],
+                template=dict(pod_template, spec=pod_spec),
+            ),
+        )
+
+    def render_commands(
+        self, commands: Iterable[str], name: Optional[str] = None
+    ) -> Iterator[Tuple[str, dict]]:
+        """
+        Lazily builds one manifest per command, running it with /bin/bash -c.
+
+        Args:
+            commands (Iterable[str]): The commands, consumed lazily.
+            name (str, optional): Name prefix of the jobs, suffixed with the
+                command's index. Defaults to the template's name.
+
+        Yields:
+            Tuple[str, dict]: The command and the manifest of its job.
+        """
+        name = name or self.name
+        for idx, command in enumerate(commands):
+            yield command, self.render(
+                f"{name}-{idx}", command=["/bin/bash"], args=["-c", command]
+            )
+
+
 def create_jobs_for_experiments(commands: List[str], *args, **kwargs):
     """
     Creates and runs a Kubernetes Job for each command in the given list of commands.
@@ -470,8 +728,9 @@ def create_jobs_for_experiments(commands: List[str], *args, **kwargs):
         )
     """
     jobs = []
+    name = kwargs.pop("name", "experiment")
     for idx, command in enumerate(commands):
-        job_name = f"{kwargs.get('name', 'experiment')}-{idx}"
+        job_name = f"{name}-{idx}"
         kubernetes_job = KubernetesJob(
             name=job_name,
             command=["/bin/bash"],
@@ -485,6 +744,104 @@ def create_jobs_for_experiments(commands: List[str], *args, **kwargs):
     return jobs
 
 
+def create_jobs_for_experiments_bulk(
+    commands: Iterable[str],
+    *args,
+    max_workers: int = 16,
+    rate_limit: Optional[float] = 20.0,
+    max_retries: int = 5,
+    **kwargs,
+) -> pd.DataFrame:
+    """
+    Creates a Kubernetes Job for each command, submitting them concurrently.
+
+    Unlike create_jobs_for_experiments, jobs are posted from a pool of worker
+    threads sharing one API client, throttled by a client-side rate limit and
+    retried with backoff on HTTP 429 and 503 responses.
+
+    :param commands: An iterable of commands, consumed lazily.
+    :param args: Positional arguments to be passed to the KubernetesJob constructor.
+    :param max_workers: Number of concurrent submissions. Defaults to 16.
+    :param rate_limit: Maximum job creations per second, or None for no limit. Defaults to 20.
+    :param max_retries: Retries per job on HTTP 429 and 503. Defaults to 5.
+    :param kwargs: Keyword arguments to be passed to the KubernetesJob constructor.
+    :return: A DataFrame with one row per command and the columns command, name, uid, latency, error and attempts.
+
+    :Example:
+
+    .. code-block:: python
+
+        results = create_jobs_for_experiments_bulk(
+            commands,
+            image="nvcr.io/nvidia/cuda:12.0.0-cudnn8-devel-ubuntu22.04",
+            kueue_queue_name=KueueQueue.INFORMATICS,
+            gpu_type="nvidia.com/gpu",
+            gpu_limit=1,
+            max_workers=32,
+            rate_limit=50,
+        )
+        print(results[results.error.notna()])
+    """
+    template = KubernetesJobTemplate(
+        kwargs.pop("name", "experiment"), *args, **kwargs
+    )
+    results = submit_manifests(
+        template.render_commands(commands),
+        submit_fn=submit_job,
+        max_workers=max_workers,
+        rate_limit=rate_limit,
+        max_retries=max_retries,
+    )
+    return results_to_frame(results)
+
+
+def create_indexed_job_for_experiments(
+    commands: Iterable[str],
+    *args,
+    parallelism: Optional[int] = None,
+    backoff_limit_per_index: Optional[int] = None,
+    **kwargs,
+) -> SubmittedObject:
+    """
+    Creates and runs a single Indexed Kubernetes Job covering all the given commands.
+
+    Instead of one Job per command, the commands are stored once in a ConfigMap and
+    each pod of the Job picks its command by JOB_COMPLETION_INDEX. A sweep of N commands
+    therefore adds two API objects instead of N, and Kueue admits a single workload.
+
+    :param commands: An iterable of strings, where each string represents a command to be executed.
+    :param args: Positional arguments to be passed to the KubernetesJob constructor.
+    :param parallelism: Maximum number of commands running at the same time. Defaults to all of them.
+    :param backoff_limit_per_index: Retries per command. Requires Kubernetes 1.29+. Defaults to 0, running each command once
+        without a failing command failing the others.
+    :param kwargs: Keyword arguments to be passed to the KubernetesJob constructor.
+    :return: The name and UID of the created Job.
+
+    :Example:
+
+    .. code-block:: python
+
+        create_indexed_job_for_experiments(
+            commands,
+            name="lr-sweep",
+            image="nvcr.io/nvidia/cuda:12.0.0-cudnn8-devel-ubuntu22.04",
+            kueue_queue_name=KueueQueue.INFORMATICS,
+            gpu_type="nvidia.com/gpu",
+            gpu_limit=1,
+            parallelism=8,
+        )
+    """
+    kwargs.setdefault("name", "experiment")
+    kubernetes_job = KubernetesJob(
+        *args,
+        sweep_commands=list(commands),
+        parallelism=parallelism,
+        backoff_limit_per_index=backoff_limit_per_index,
+        **kwargs,
+    )
+    return kubernetes_job.submit()
+
+
 def create_pvc(
     pvc_name: str,
     storage: str,
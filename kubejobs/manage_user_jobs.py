@@ -1,28 +1,20 @@
-import json
-import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from typing import Dict, Optional
 
 import fire
 import rich
+from kubernetes import client
 from rich import print
 from rich.console import Console
 from rich.table import Table
 from tqdm import tqdm
 
-console = Console()
-
+from kubejobs.api import get_batch_api, list_items, read_json_response
+from kubejobs.history import HistoryWriter
 
-# 🚀 Run shell command and return the output
-def run_command(cmd: str) -> str:
-    result = subprocess.run(
-        cmd,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    return result.stdout
+console = Console()
 
 
 # 📅 Parse ISO formatted time to Python datetime object
@@ -114,11 +106,19 @@ def list_or_delete_jobs_by_user(
     term: str,
     delete: bool = False,
     show_job_status: bool = False,
+    page_size: int = 500,
+    propagation_policy: str = "Background",
+    max_workers: int = 16,
+    history_dir: Optional[str] = None,
 ) -> None:
-    # Fetch all jobs from a specific Kubernetes namespace
-    get_jobs_cmd = f"kubectl get jobs -n {namespace} -o json"
-    jobs_output = run_command(get_jobs_cmd)
-    jobs_json = json.loads(jobs_output)
+    # Let the API server filter on the user label and page through the
+    # results, so only this user's jobs are downloaded and held in memory
+    user_jobs = list_items(
+        get_batch_api().list_namespaced_job,
+        namespace,
+        label_selector=f"eidf/user={username}",
+        limit=page_size,
+    )
 
     filtered_jobs = []  # Store jobs that match filters
     current_time = datetime.now(timezone.utc)
@@ -162,13 +162,14 @@ def list_or_delete_jobs_by_user(
         table.add_column("🧐 Reason", justify="right")
         table.add_column("🔖 Ready", justify="right")
 
-    # Filter jobs and fill in the table
-    for item in tqdm(jobs_json["items"]):
-        annotations = item["metadata"].get("labels", {})
-        if (
-            annotations.get("eidf/user", "") == username
-            and term in item["metadata"]["name"]
-        ):
+    # The listed jobs are recorded to the history too, when asked
+    listed_jobs = []
+
+    # Filter jobs on the search term and fill in the table
+    for item in tqdm(user_jobs):
+        if history_dir:
+            listed_jobs.append(item)
+        if term in item["metadata"]["name"]:
             filtered_jobs.append(item)
 
             if show_job_status:
@@ -183,9 +184,21 @@ def list_or_delete_jobs_by_user(
     # Display the table
     console.print(table)
 
+    if history_dir:
+        # Only this user's jobs were listed, so nothing is marked deleted
+        with HistoryWriter(history_dir) as history:
+            history.write_jobs(listed_jobs, complete=False)
+
     # Optionally delete filtered jobs
     if delete:
-        delete_filtered_jobs(filtered_jobs, namespace, username, term)
+        delete_filtered_jobs(
+            filtered_jobs,
+            namespace,
+            username,
+            term,
+            propagation_policy=propagation_policy,
+            max_workers=max_workers,
+        )
 
 
 # 📝 Add a row to the table with job details
@@ -268,15 +281,81 @@ def get_job_duration(item: dict) -> str:
 
 # 🗑 Delete filtered jobs
 def delete_filtered_jobs(
-    filtered_jobs: list, namespace: str, username: str, term: str
+    filtered_jobs: list,
+    namespace: str,
+    username: str,
+    term: str,
+    propagation_policy: str = "Background",
+    max_workers: int = 16,
 ) -> None:
-    for item in filtered_jobs:
-        job_name = item["metadata"]["name"]
-        del_cmd = f"kubectl delete job {job_name} -n {namespace}"
-        run_command(del_cmd)
+    """
+    Deletes the filtered jobs and reports how many were deleted and how long
+    it took.
+
+    Without a search term every job of the user matches, so they are all
+    removed with a single deletecollection call on the user label. Name
+    substrings cannot be expressed as a selector, so with a term the jobs are
+    deleted individually from a bounded pool of worker threads.
+
+    Args:
+        filtered_jobs (list): The jobs to delete, as listed.
+        namespace (str): Namespace of the jobs.
+        username (str): Value of the eidf/user label of the jobs.
+        term (str): The search term the jobs were filtered on.
+        propagation_policy (str): "Background", "Foreground" or "Orphan".
+            Decides what happens to the jobs' pods. Defaults to "Background",
+            like kubectl; the API's own default for jobs orphans the pods.
+        max_workers (int): Concurrent deletes when falling back to deleting
+            jobs one by one. Defaults to 16.
+    """
+    batch_api = get_batch_api()
+    start_time = time.perf_counter()
+    failed = 0
+
+    if not term:
+        response = batch_api.delete_collection_namespaced_job(
+            namespace,
+            label_selector=f"eidf/user={username}",
+            propagation_policy=propagation_policy,
+            _preload_content=False,
+        )
+        # The API server returns the list of deleted jobs
+        deleted = len(read_json_response(response).get("items", filtered_jobs))
+    else:
+
+        def delete_job(job_name: str) -> bool:
+            try:
+                batch_api.delete_namespaced_job(
+                    job_name,
+                    namespace,
+                    propagation_policy=propagation_policy,
+                    _preload_content=False,
+                )
+            except client.ApiException as e:
+                if e.status == 404:  # Already gone
+                    return True
+                console.print(
+                    f"[red]Failed to delete job {job_name}: {e.status} {e.reason}[/red]"
+                )
+                return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            outcomes = list(
+                executor.map(
+                    delete_job,
+                    [item["metadata"]["name"] for item in filtered_jobs],
+                )
+            )
+        deleted = sum(outcomes)
+        failed = len(outcomes) - deleted
+
+    elapsed = time.perf_counter() - start_time
     console.print(
-        f"[red]✅ Deleted jobs initiated by '{username}' in namespace '{namespace}' matching term '{term}'[/red]"
+        f"[red]✅ Deleted {deleted} jobs initiated by '{username}' in namespace '{namespace}' matching term '{term}' in {elapsed:.1f}s[/red]"
     )
+    if failed:
+        console.print(f"[red]❌ Failed to delete {failed} jobs[/red]")
 
 
 if __name__ == "__main__":
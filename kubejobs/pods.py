@@ -1,12 +1,12 @@
 import logging
 import os
-import subprocess
 from typing import List, Optional
 
-import yaml
-from kubernetes import config
+from kubernetes import client
 
-from kubejobs.jobs import fetch_user_info
+from kubejobs.jobs import default_shm_size, fetch_user_info
+from kubejobs.serialization import to_json, to_yaml
+from kubejobs.submission import SubmittedObject, submit_pod
 
 logger = logging.getLogger(__name__)
 MAX_CPU = 192
@@ -36,6 +36,7 @@ class KubernetesPod:
         volume_mounts (dict, optional): Dictionary of volume mounts. Defaults to None.
         namespace (str, optional): Namespace of the pod. Defaults to None.
         image_pull_secret (str, optional): Name of the image pull secret. Defaults to None.
+        discover_node_shape (bool, optional): List the cluster's nodes to size the default shm_size, see KubernetesJob. Defaults to False.
     """
 
     def __init__(
@@ -63,6 +64,7 @@ class KubernetesPod:
         namespace: Optional[str] = None,
         image_pull_secret: Optional[str] = None,
         kueue_queue_name: str = "informatics-user-queue",
+        discover_node_shape: bool = False,
     ):
         self.name = name
         self.image = image
@@ -83,7 +85,9 @@ class KubernetesPod:
             else (
                 ram_request
                 if ram_request is not None
-                else f"{MAX_RAM // (MAX_GPU - gpu_limit + 1)}G"
+                else default_shm_size(
+                    gpu_product, gpu_limit, discover=discover_node_shape
+                )
             )
         )
         self.secret_env_vars = secret_env_vars
@@ -179,7 +183,8 @@ class KubernetesPod:
 
         return container
 
-    def generate_yaml(self):
+    def generate_dict(self) -> dict:
+        """Generates the Kubernetes Pod manifest as a dict."""
         container = {
             "name": self.name,
             "image": self.image,
@@ -203,7 +208,7 @@ class KubernetesPod:
             or self.gpu_product is None
         ):
             container["resources"] = {
-                "limits": {f"{self.gpu_type}": self.gpu_limit}
+                "limits": {f"{self.gpu_type}": str(self.gpu_limit)}
             }
 
         container = self._add_shm_size(container)
@@ -223,8 +228,8 @@ class KubernetesPod:
                 container["resources"]["requests"] = {}
 
         if self.cpu_request is not None:
-            container["resources"]["requests"]["cpu"] = self.cpu_request
-            container["resources"]["limits"]["cpu"] = self.cpu_request
+            container["resources"]["requests"]["cpu"] = str(self.cpu_request)
+            container["resources"]["limits"]["cpu"] = str(self.cpu_request)
 
         if self.ram_request is not None:
             container["resources"]["requests"]["memory"] = self.ram_request
@@ -236,9 +241,9 @@ class KubernetesPod:
             ] = self.storage_request
 
         if self.gpu_type is not None and self.gpu_limit is not None:
-            container["resources"]["limits"][
-                f"{self.gpu_type}"
-            ] = self.gpu_limit
+            container["resources"]["limits"][f"{self.gpu_type}"] = str(
+                self.gpu_limit
+            )
 
         pod = {
             "apiVersion": "v1",
@@ -304,44 +309,37 @@ class KubernetesPod:
                 {"name": self.image_pull_secret}
             ]
 
-        return yaml.dump(pod)
-
-    def run(self):
-        config.load_kube_config()
+        return pod
 
-        pod_yaml = self.generate_yaml()
+    def generate_yaml(self) -> str:
+        """Generates the Kubernetes Pod manifest as YAML."""
+        return to_yaml(self.generate_dict())
 
-        # Save the generated YAML to a temporary file
-        with open("temp_pod.yaml", "w") as temp_file:
-            temp_file.write(pod_yaml)
+    def generate_json(self, indent: Optional[int] = None) -> str:
+        """Generates the Kubernetes Pod manifest as JSON."""
+        return to_json(self.generate_dict(), indent=indent)
 
-        # Run the kubectl command with --validate=False
-        cmd = ["kubectl", "apply", "-f", "temp_pod.yaml"]
+    def submit(self) -> SubmittedObject:
+        """Creates the pod through the Kubernetes API and returns its name
+        and UID."""
+        pod_dict = self.generate_dict()
+        return submit_pod(pod_dict, namespace=self.namespace)
 
+    def run(self):
         try:
-            result = subprocess.run(
-                cmd,
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
-            # Remove the temporary file
-            os.remove("temp_pod.yaml")
-            return result.returncode
-        except subprocess.CalledProcessError as e:
+            submitted = self.submit()
+        except client.ApiException as e:
             logger.info(
-                f"Command '{' '.join(cmd)}' failed with return code {e.returncode}."
+                f"Creating pod '{self.name}' failed with status {e.status}."
             )
-            logger.info(f"Stdout:\n{e.stdout}")
-            logger.info(f"Stderr:\n{e.stderr}")
-            # Remove the temporary file
-            os.remove("temp_pod.yaml")
-            return e.returncode  # return the exit code
+            logger.info(f"Reason:\n{e.reason}")
+            logger.info(f"Body:\n{e.body}")
+            return 1  # return the exit code
         except Exception as e:
             logger.exception(
-                f"An unexpected error occurred while running '{' '.join(cmd)}'."
+                f"An unexpected error occurred while creating pod '{self.name}'."
             )  # This logs the traceback too
-            # Remove the temporary file
-            os.remove("temp_pod.yaml")
             return 1  # return the exit code
+
+        logger.info(f"Created pod {submitted.name} (uid {submitted.uid})")
+        return 0
@@ -0,0 +1,95 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from kubejobs.api import get_core_api, get_current_namespace, list_items
+
+# Pods in these phases hold on to the claims they mount
+ACTIVE_POD_PHASES = ("Pending", "Running")
+
+
+def claim_names(pod: dict) -> List[str]:
+    """Returns the names of the PVCs mounted by a pod."""
+    return [
+        volume["persistentVolumeClaim"]["claimName"]
+        for volume in (pod.get("spec") or {}).get("volumes") or []
+        if "persistentVolumeClaim" in volume
+    ]
+
+
+class PVCUsageIndex:
+    """
+    Maps every PVC of a namespace to the pods mounting it, and their phase.
+
+    The index is built from one list of PVCs and one list of pods, joining
+    them on the claim names in the pods' volumes, so answering which claims
+    are free costs two list calls (or none when built from an informer)
+    however many pods and PVCs there are.
+
+    Args:
+        pvcs (Iterable[dict]): The PVC objects of the namespace.
+        pods (Iterable[dict]): The pod objects of the namespace.
+
+    Example:
+
+    .. code-block:: python
+
+        index = PVCUsageIndex.from_cluster("informatics")
+        free = index.available(unique_identifier="gate")
+    """
+
+    def __init__(self, pvcs: Iterable[dict], pods: Iterable[dict]):
+        self.claims: List[str] = [pvc["metadata"]["name"] for pvc in pvcs]
+        self._pods: Dict[str, Dict[str, str]] = defaultdict(dict)
+        for pod in pods:
+            phase = (pod.get("status") or {}).get("phase", "Unknown")
+            for claim in claim_names(pod):
+                self._pods[claim][pod["metadata"]["name"]] = phase
+
+    @classmethod
+    def from_cluster(cls, namespace: Optional[str] = None) -> "PVCUsageIndex":
+        """Builds the index from a paged list of the PVCs and the pods of a
+        namespace, defaulting to the current kube config namespace."""
+        namespace = namespace or get_current_namespace()
+        core_api = get_core_api()
+        return cls(
+            list_items(
+                core_api.list_namespaced_persistent_volume_claim, namespace
+            ),
+            list_items(core_api.list_namespaced_pod, namespace),
+        )
+
+    @classmethod
+    def from_informer(cls, informer) -> "PVCUsageIndex":
+        """Builds the index from the PVCs and pods cached by a
+        ClusterInformer, without any API call."""
+        return cls(informer.pvcs.list(), informer.pods.list())
+
+    def pods(self, claim: str) -> Dict[str, str]:
+        """Returns the pods mounting a claim, mapped to their phase."""
+        return dict(self._pods.get(claim, {}))
+
+    def in_use(self, claim: str) -> bool:
+        """Whether a pending or running pod mounts the claim."""
+        return any(
+            phase in ACTIVE_POD_PHASES
+            for phase in self._pods.get(claim, {}).values()
+        )
+
+    def available(self, unique_identifier: Optional[str] = None) -> List[str]:
+        """Returns the existing claims no active pod mounts, optionally only
+        those whose name contains ``unique_identifier``."""
+        return [
+            claim
+            for claim in self.claims
+            if not self.in_use(claim)
+            and (not unique_identifier or unique_identifier in claim)
+        ]
+
+    def mounts(self) -> List[Tuple[str, str, str]]:
+        """Returns every (claim, pod, phase) mount, sorted by claim, including
+        claims mounted by pods but missing from the PVC list."""
+        return sorted(
+            (claim, pod, phase)
+            for claim, pods in self._pods.items()
+            for pod, phase in pods.items()
+        )
@@ -0,0 +1,30 @@
+import json
+from typing import Optional
+
+import yaml
+
+# libyaml's C emitter and parser are an order of magnitude faster than the
+# pure-Python ones; PyYAML builds without libyaml fall back to the latter
+YAML_DUMPER_BASE = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class ManifestDumper(YAML_DUMPER_BASE):
+    """Safe YAML dumper that writes shared sub-objects (such as the labels
+    used by both a Job and its pod template) in full instead of as
+    &anchors and *aliases."""
+
+    def ignore_aliases(self, data):
+        return True
+
+
+def to_yaml(manifest: dict) -> str:
+    """Serializes a manifest to a YAML document."""
+    return yaml.dump(manifest, Dumper=ManifestDumper)
+
+
+def to_json(manifest: dict, indent: Optional[int] = None) -> str:
+    """Serializes a manifest to JSON, compact unless an indent is given."""
+    if indent is None:
+        return json.dumps(manifest, separators=(",", ":"))
+    return json.dumps(manifest, indent=indent)
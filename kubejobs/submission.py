@@ -0,0 +1,407 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from kubernetes import client
+
+from kubejobs.api import (
+    get_api_client,
+    get_batch_api,
+    get_core_api,
+    get_current_namespace,
+    read_json_response,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SubmittedObject:
+    name: str
+    uid: str
+    namespace: str
+    kind: str
+
+
+def _resolve_namespace(manifest: dict, namespace: Optional[str]) -> str:
+    return (
+        namespace
+        or manifest.get("metadata", {}).get("namespace")
+        or get_current_namespace()
+    )
+
+
+def submit_job(
+    manifest: dict, namespace: Optional[str] = None
+) -> SubmittedObject:
+    """
+    Creates a Job by posting its manifest straight to the API server.
+
+    Args:
+        manifest (dict): The Job manifest, e.g. from KubernetesJob.
+        namespace (str, optional): Target namespace. Defaults to the
+            manifest's namespace, then to the current kube config namespace.
+
+    Returns:
+        SubmittedObject: The server-assigned name and UID of the new Job.
+
+    Raises:
+        kubernetes.client.ApiException: If the API server rejects the Job.
+    """
+    namespace = _resolve_namespace(manifest, namespace)
+    response = get_batch_api().create_namespaced_job(
+        namespace, manifest, _preload_content=False
+    )
+    metadata = read_json_response(response)["metadata"]
+    return SubmittedObject(
+        name=metadata["name"],
+        uid=metadata["uid"],
+        namespace=namespace,
+        kind="Job",
+    )
+
+
+def submit_pod(
+    manifest: dict, namespace: Optional[str] = None
+) -> SubmittedObject:
+    """
+    Creates a Pod by posting its manifest straight to the API server.
+
+    Args:
+        manifest (dict): The Pod manifest, e.g. from KubernetesPod.
+        namespace (str, optional): Target namespace. Defaults to the
+            manifest's namespace, then to the current kube config namespace.
+
+    Returns:
+        SubmittedObject: The name and UID of the new Pod.
+
+    Raises:
+        kubernetes.client.ApiException: If the API server rejects the Pod.
+    """
+    namespace = _resolve_namespace(manifest, namespace)
+    response = get_core_api().create_namespaced_pod(
+        namespace, manifest, _preload_content=False
+    )
+    metadata = read_json_response(response)["metadata"]
+    return SubmittedObject(
+        name=metadata["name"],
+        uid=metadata["uid"],
+        namespace=namespace,
+        kind="Pod",
+    )
+
+
+def submit_config_map(
+    manifest: dict, namespace: Optional[str] = None
+) -> SubmittedObject:
+    """
+    Creates a ConfigMap, such as the one holding the commands of a sweep.
+
+    Sweep ConfigMap names are content-addressed, so an existing ConfigMap
+    with the same name is reused rather than treated as an error.
+
+    Raises:
+        kubernetes.client.ApiException: If the API server rejects the
+            ConfigMap.
+    """
+    namespace = _resolve_namespace(manifest, namespace)
+    core_api = get_core_api()
+    try:
+        response = core_api.create_namespaced_config_map(
+            namespace, manifest, _preload_content=False
+        )
+    except client.ApiException as e:
+        if e.status != 409:
+            raise
+        response = core_api.read_namespaced_config_map(
+            manifest["metadata"]["name"], namespace, _preload_content=False
+        )
+    metadata = read_json_response(response)["metadata"]
+    return SubmittedObject(
+        name=metadata["name"],
+        uid=metadata["uid"],
+        namespace=namespace,
+        kind="ConfigMap",
+    )
+
+
+def submit_manifest(
+    manifest: dict, namespace: Optional[str] = None
+) -> SubmittedObject:
+    """Creates a Job, a Pod or a ConfigMap, depending on the manifest's
+    kind."""
+    kind = manifest.get("kind")
+    if kind == "Job":
+        return submit_job(manifest, namespace=namespace)
+    if kind == "Pod":
+        return submit_pod(manifest, namespace=namespace)
+    if kind == "ConfigMap":
+        return submit_config_map(manifest, namespace=namespace)
+    raise ValueError(f"Cannot submit manifests of kind {kind!r}")
+
+
+def submit_indexed_job(
+    manifest: dict,
+    config_map: dict,
+    namespace: Optional[str] = None,
+) -> SubmittedObject:
+    """
+    Creates an Indexed Job together with the ConfigMap holding its sweep
+    commands.
+
+    The ConfigMap is created first, because the Job's pods mount it. Once
+    the Job exists, the ConfigMap gets an owner reference to it, so deleting
+    the Job garbage-collects the commands as well. ConfigMap names are
+    expected to be content-addressed, so an existing ConfigMap with the same
+    name is reused rather than treated as an error.
+
+    Args:
+        manifest (dict): The Job manifest.
+        config_map (dict): The ConfigMap manifest mounted by the Job.
+        namespace (str, optional): Target namespace. Defaults to the
+            manifest's namespace, then to the current kube config namespace.
+
+    Returns:
+        SubmittedObject: The server-assigned name and UID of the new Job.
+    """
+    namespace = _resolve_namespace(manifest, namespace)
+    config_map_name = config_map["metadata"]["name"]
+    core_api = get_core_api()
+
+    try:
+        core_api.create_namespaced_config_map(
+            namespace, config_map, _preload_content=False
+        )
+        created_config_map = True
+    except client.ApiException as e:
+        if e.status != 409:
+            raise
+        created_config_map = False
+
+    try:
+        submitted = submit_job(manifest, namespace=namespace)
+    except Exception:
+        if created_config_map:
+            core_api.delete_namespaced_config_map(config_map_name, namespace)
+        raise
+
+    owner_reference = {
+        "apiVersion": "batch/v1",
+        "kind": "Job",
+        "name": submitted.name,
+        "uid": submitted.uid,
+    }
+    # A strategic merge keys owner references by UID, so a ConfigMap shared
+    # by identical sweeps keeps every Job as an owner
+    core_api.patch_namespaced_config_map(
+        config_map_name,
+        namespace,
+        {"metadata": {"ownerReferences": [owner_reference]}},
+        _content_type="application/strategic-merge-patch+json",
+        _preload_content=False,
+    )
+    return submitted
+
+
+# HTTP statuses worth retrying a create on: the API server throttled or shed
+# the request before storing anything. After a 500, 502 or 504 the object
+# may have been created, and with generateName a retry would create another
+RETRYABLE_STATUSES = {429, 503}
+
+
+class RateLimiter:
+    """
+    A thread-safe token bucket limiting how many requests are sent per
+    second, shared by all workers of a bulk submission.
+
+    Args:
+        rate (float): Sustained number of requests per second.
+        burst (int, optional): Maximum number of requests that can be sent
+            back to back after an idle period. Defaults to ``rate``.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, not {rate}")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._last_refill) * self.rate,
+                )
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@dataclass
+class SubmissionResult:
+    command: Optional[str]
+    name: Optional[str]
+    uid: Optional[str]
+    latency: float
+    error: Optional[str] = None
+    attempts: int = 1
+
+
+def _retry_delay(
+    error: client.ApiException,
+    attempt: int,
+    base_delay: float,
+    max_delay: float,
+) -> float:
+    """Honours the server's Retry-After header when present, otherwise
+    backs off exponentially with full jitter."""
+    retry_after = (error.headers or {}).get("Retry-After")
+    if retry_after is not None:
+        try:
+            return min(max_delay, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+def submit_with_retries(
+    submit_fn: Callable[[dict], SubmittedObject],
+    manifest: dict,
+    rate_limiter: Optional[RateLimiter] = None,
+    max_retries: int = 5,
+    base_delay: float = 0.5,
+    max_delay: float = 30.0,
+) -> Tuple[SubmittedObject, int]:
+    """
+    Calls ``submit_fn`` on the manifest, retrying on HTTP 429 and 503
+    responses, see RETRYABLE_STATUSES.
+
+    Returns:
+        Tuple[SubmittedObject, int]: The created object and the number of
+            attempts it took.
+
+    Raises:
+        kubernetes.client.ApiException: On a non-retryable status, or when
+            the retries are exhausted.
+    """
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return submit_fn(manifest), attempt + 1
+        except client.ApiException as e:
+            if e.status not in RETRYABLE_STATUSES or attempt >= max_retries:
+                raise
+            delay = _retry_delay(e, attempt, base_delay, max_delay)
+            logger.debug(
+                f"Submission got HTTP {e.status}, retrying in {delay:.2f}s"
+            )
+            time.sleep(delay)
+            attempt += 1
+
+
+def submit_manifests(
+    manifests: Iterable[Tuple[Optional[str], dict]],
+    submit_fn: Callable[[dict], SubmittedObject] = submit_job,
+    max_workers: int = 16,
+    rate_limit: Optional[float] = 20.0,
+    max_retries: int = 5,
+) -> List[SubmissionResult]:
+    """
+    Submits manifests concurrently from a pool of worker threads.
+
+    The manifests are consumed lazily and at most ``2 * max_workers`` of them
+    are in flight at any time, so a generator of manifests is never
+    materialised in memory. Failures do not stop the submission; they are
+    reported in the ``error`` field of the corresponding result.
+
+    Args:
+        manifests (Iterable[Tuple[str, dict]]): Pairs of (command, manifest).
+            The command is only used to label the result.
+        submit_fn (Callable): Function creating a single object, e.g.
+            ``submit_job`` or ``submit_pod``. Defaults to ``submit_job``.
+        max_workers (int): Number of concurrent submissions. Defaults to 16.
+        rate_limit (float, optional): Maximum requests per second across all
+            workers, or None for no limit. Defaults to 20.
+        max_retries (int): Retries per manifest on HTTP 429 and 503.
+            Defaults to 5.
+
+    Returns:
+        List[SubmissionResult]: One result per manifest, in input order.
+    """
+    # Size the shared connection pool for the workers before first use
+    get_api_client(connection_pool_maxsize=max_workers)
+    rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+    in_flight = threading.BoundedSemaphore(2 * max_workers)
+
+    def submit_one(command: Optional[str], manifest: dict):
+        start = time.perf_counter()
+        try:
+            submitted, attempts = submit_with_retries(
+                submit_fn,
+                manifest,
+                rate_limiter=rate_limiter,
+                max_retries=max_retries,
+            )
+            return SubmissionResult(
+                command=command,
+                name=submitted.name,
+                uid=submitted.uid,
+                latency=time.perf_counter() - start,
+                attempts=attempts,
+            )
+        except Exception as e:
+            return SubmissionResult(
+                command=command,
+                name=None,
+                uid=None,
+                latency=time.perf_counter() - start,
+                error=(
+                    f"{e.status} {e.reason}"
+                    if isinstance(e, client.ApiException)
+                    else repr(e)
+                ),
+            )
+        finally:
+            in_flight.release()
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for command, manifest in manifests:
+            in_flight.acquire()
+            futures.append(executor.submit(submit_one, command, manifest))
+
+    results = [future.result() for future in futures]
+    failed = sum(result.error is not None for result in results)
+    logger.info(f"Submitted {len(results) - failed}/{len(results)} objects")
+    return results
+
+
+def results_to_frame(results: List[SubmissionResult]) -> pd.DataFrame:
+    """Turns submission results into a table with one row per command."""
+    return pd.DataFrame(
+        [asdict(result) for result in results],
+        columns=[
+            "command",
+            "name",
+            "uid",
+            "latency",
+            "error",
+            "attempts",
+        ],
+    )
@@ -0,0 +1,381 @@
+import functools
+import hashlib
+import json
+import math
+import operator
+import random
+import shlex
+from abc import ABC, abstractmethod
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+Params = Dict[str, Any]
+# A str.format template, given the parameters and their "flags", or a
+# function of the parameters
+Template = Union[str, Callable[[Params], str]]
+
+
+def _product(lengths: Iterable[int]) -> int:
+    # math.prod needs Python 3.8
+    return functools.reduce(operator.mul, lengths, 1)
+
+
+class Dimension(ABC):
+    """A distribution of one parameter of a Random or LatinHypercube sweep,
+    defined by its quantile function on [0, 1)."""
+
+    @abstractmethod
+    def quantile(self, u: float) -> Any:
+        pass
+
+
+class Uniform(Dimension):
+    def __init__(self, low: float, high: float):
+        self.low, self.high = low, high
+
+    def quantile(self, u: float) -> float:
+        return self.low + u * (self.high - self.low)
+
+
+class LogUniform(Dimension):
+    """Uniform in log space, e.g. for learning rates."""
+
+    def __init__(self, low: float, high: float):
+        if low <= 0 or high <= 0:
+            raise ValueError("LogUniform bounds must be positive")
+        self.low, self.high = low, high
+
+    def quantile(self, u: float) -> float:
+        return math.exp(
+            math.log(self.low) + u * (math.log(self.high) - math.log(self.low))
+        )
+
+
+class IntUniform(Dimension):
+    """Uniform over the integers from ``low`` to ``high``, both included."""
+
+    def __init__(self, low: int, high: int):
+        self.low, self.high = low, high
+
+    def quantile(self, u: float) -> int:
+        return min(self.low + int(u * (self.high - self.low + 1)), self.high)
+
+
+class Choice(Dimension):
+    def __init__(self, values: Sequence):
+        if not len(values):
+            raise ValueError("Choice needs at least one value")
+        self.values = values
+
+    def quantile(self, u: float) -> Any:
+        return self.values[
+            min(int(u * len(self.values)), len(self.values) - 1)
+        ]
+
+
+def _dimension(value) -> Dimension:
+    # Lists, tuples and ranges are choices, other values constants
+    if isinstance(value, Dimension):
+        return value
+    if isinstance(value, (list, tuple, range)):
+        return Choice(value)
+    return Choice([value])
+
+
+def _values(value) -> Sequence:
+    if isinstance(value, (list, tuple, range)):
+        return value
+    return [value]
+
+
+def to_flags(params: Mapping[str, Any]) -> str:
+    """Formats parameters as shell-quoted ``--name=value`` flags."""
+    return " ".join(
+        f"--{name}={shlex.quote(str(value))}" for name, value in params.items()
+    )
+
+
+def experiment_name(params: Mapping[str, Any], prefix: str = "exp") -> str:
+    """A name derived from the parameters only, so it is the same in every
+    process and shard, and across restarts."""
+    digest = hashlib.sha1(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f"{prefix}-{digest[:10]}"
+
+
+class Sweep(ABC):
+    """
+    A sequence of parameter dicts, computed from their index on demand: a
+    sweep of any size is expanded lazily, in constant memory, and any part
+    of it can be read without expanding the rest.
+
+    Sweeps combine with ``*`` (every combination of the two) and ``+`` (one
+    after the other), and are turned into commands for the launchers with
+    ``commands`` and ``experiments``.
+    """
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abstractmethod
+    def _params(self, index: int) -> Params:
+        pass
+
+    def __getitem__(self, index: int) -> Params:
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError(f"Sweep index {index} out of range")
+        return self._params(index)
+
+    def __iter__(self) -> Iterator[Params]:
+        for index in range(len(self)):
+            yield self._params(index)
+
+    def __mul__(self, other: "Sweep") -> "Sweep":
+        return Product(self, other)
+
+    def __add__(self, other: "Sweep") -> "Sweep":
+        return Chain(self, other)
+
+    def shard(self, index: int, count: int) -> "Sweep":
+        """
+        The part of the sweep a launcher ``index`` out of ``count`` runs:
+        every ``count``-th item, starting at ``index``. The shards of a
+        sweep cover it exactly once, and each is read without expanding
+        the others.
+        """
+        return _Shard(self, index, count)
+
+    def commands(self, template: Template) -> Iterator[str]:
+        """
+        Lazily formats a command per item, e.g. for
+        create_jobs_for_experiments.
+
+        Args:
+            template (str | Callable): A str.format template, filled with
+                the parameters and ``flags``, all of them as --name=value
+                flags, e.g. "python train.py {flags}". Or a function of the
+                parameters returning the command.
+        """
+        for params in self:
+            yield _format(template, params)
+
+    def experiments(
+        self, template: Template, prefix: str = "exp"
+    ) -> Iterator[Tuple[str, str]]:
+        """Lazily yields a (name, command) pair per item, e.g. for
+        run_jobs.launch_jobs or ExperimentQueue, named by
+        experiment_name."""
+        for params in self:
+            yield experiment_name(params, prefix), _format(template, params)
+
+
+def _format(template: Template, params: Params) -> str:
+    if callable(template):
+        return template(params)
+    return template.format(**params, flags=to_flags(params))
+
+
+class Grid(Sweep):
+    """
+    Every combination of the values of the parameters, in the order of
+    itertools.product: the last parameter varies fastest. Single values
+    are constants.
+
+    Example:
+
+    .. code-block:: python
+
+        Grid(lr=[1e-3, 1e-4], batch_size=[32, 64], model="vit")
+    """
+
+    def __init__(self, **params):
+        self.names = list(params)
+        self.values = [_values(value) for value in params.values()]
+        self._length = _product(len(values) for values in self.values)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _params(self, index: int) -> Params:
+        params = {}
+        for name, values in zip(reversed(self.names), reversed(self.values)):
+            index, position = divmod(index, len(values))
+            params[name] = values[position]
+        return {name: params[name] for name in self.names}
+
+
+class Zip(Sweep):
+    """
+    The values of the parameters, or the items of the sweeps, taken
+    together position by position, as long as the shortest of them. Single
+    values are constants.
+
+    Example:
+
+    .. code-block:: python
+
+        Zip(lr=[1e-3, 1e-4], warmup=[100, 1000])
+    """
+
+    def __init__(self, *sweeps: Sweep, **params):
+        self.sweeps = list(sweeps)
+        self.params = {
+            name: _values(value)
+            for name, value in params.items()
+            if isinstance(value, (list, tuple, range))
+        }
+        self.constants = {
+            name: value
+            for name, value in params.items()
+            if name not in self.params
+        }
+        lengths = [len(sweep) for sweep in self.sweeps]
+        lengths += [len(values) for values in self.params.values()]
+        self._length = min(lengths) if lengths else 1
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _params(self, index: int) -> Params:
+        params = {}
+        for sweep in self.sweeps:
+            params.update(sweep._params(index))
+        for name, values in self.params.items():
+            params[name] = values[index]
+        params.update(self.constants)
+        return params
+
+
+class Random(Sweep):
+    """
+    ``samples`` independent draws of the parameters, each a Dimension, a
+    list of values to choose from or a constant.
+
+    Draw ``i`` only depends on ``seed`` and ``i``, so it is the same in
+    every process and can be computed on its own.
+
+    Example:
+
+    .. code-block:: python
+
+        Random(16, lr=LogUniform(1e-5, 1e-2), dropout=[0.0, 0.1], seed=0)
+    """
+
+    def __init__(self, samples: int, seed: int = 0, **params):
+        self.samples = samples
+        self.seed = seed
+        self.dimensions = {
+            name: _dimension(value) for name, value in params.items()
+        }
+
+    def __len__(self) -> int:
+        return self.samples
+
+    def _params(self, index: int) -> Params:
+        rng = random.Random(f"{self.seed}:{index}")
+        return {
+            name: dimension.quantile(rng.random())
+            for name, dimension in self.dimensions.items()
+        }
+
+
+class LatinHypercube(Random):
+    """
+    ``samples`` draws of the parameters that, for every parameter, fall in
+    each of ``samples`` equally likely strata exactly once, covering the
+    space more evenly than Random draws.
+
+    The stratum of draw ``i`` in each dimension comes from a seeded affine
+    permutation, (a * i + b) mod samples with a coprime to samples, so
+    draws are computed on their own and no permutation is stored.
+    """
+
+    def __init__(self, samples: int, seed: int = 0, **params):
+        super().__init__(samples, seed, **params)
+        self._permutations: List[Tuple[int, int]] = []
+        for name in self.dimensions:
+            rng = random.Random(f"{seed}:{name}")
+            a = rng.randrange(1, samples) if samples > 1 else 1
+            while math.gcd(a, samples) != 1:
+                a = rng.randrange(1, samples)
+            self._permutations.append((a, rng.randrange(max(samples, 1))))
+
+    def _params(self, index: int) -> Params:
+        rng = random.Random(f"{self.seed}:{index}")
+        return {
+            name: dimension.quantile(
+                ((a * index + b) % self.samples + rng.random()) / self.samples
+            )
+            for (name, dimension), (a, b) in zip(
+                self.dimensions.items(), self._permutations
+            )
+        }
+
+
+class Product(Sweep):
+    """Every combination of the items of the sweeps, the last varying
+    fastest."""
+
+    def __init__(self, *sweeps: Sweep):
+        self.sweeps = list(sweeps)
+        self._length = _product(len(sweep) for sweep in self.sweeps)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _params(self, index: int) -> Params:
+        parts = []
+        for sweep in reversed(self.sweeps):
+            index, position = divmod(index, len(sweep))
+            parts.append(sweep._params(position))
+        params = {}
+        for part in reversed(parts):
+            params.update(part)
+        return params
+
+
+class Chain(Sweep):
+    """The items of the sweeps, one sweep after the other."""
+
+    def __init__(self, *sweeps: Sweep):
+        self.sweeps = list(sweeps)
+
+    def __len__(self) -> int:
+        return sum(len(sweep) for sweep in self.sweeps)
+
+    def _params(self, index: int) -> Params:
+        for sweep in self.sweeps:
+            if index < len(sweep):
+                return sweep._params(index)
+            index -= len(sweep)
+        raise IndexError(index)
+
+
+class _Shard(Sweep):
+    def __init__(self, sweep: Sweep, index: int, count: int):
+        if not 0 <= index < count:
+            raise ValueError(
+                f"Shard index must be in [0, {count}), got {index}"
+            )
+        self.sweep, self.index, self.count = sweep, index, count
+
+    def __len__(self) -> int:
+        return len(range(self.index, len(self.sweep), self.count))
+
+    def _params(self, index: int) -> Params:
+        return self.sweep._params(self.index + index * self.count)
@@ -0,0 +1,188 @@
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import rich
+from rich.table import Table
+
+from kubejobs.gpu_accounting import GPU_PRODUCT_LABEL, GPU_RESOURCE, USER_LABEL
+from kubejobs.quantity import GIGABYTE, parse_quantities
+
+# Column name -> path of the value in the object, through dict keys and list
+# indices, e.g. ("spec", "containers", 0, "image")
+Path = Tuple[Union[str, int], ...]
+
+_POD_SPEC = ("spec",)
+_JOB_POD_SPEC = ("spec", "template", "spec")
+_RESOURCES = ("containers", 0, "resources")
+
+JOB_COLUMNS: Dict[str, Path] = {
+    "Name": ("metadata", "name"),
+    "Namespace": ("metadata", "namespace"),
+    "Username": ("metadata", "labels", USER_LABEL),
+    "UID": ("metadata", "uid"),
+    "Creation Time": ("metadata", "creationTimestamp"),
+    "Completions": ("spec", "completions"),
+    "Failed": ("status", "failed"),
+    "Succeeded": ("status", "succeeded"),
+    "CPU Request": (*_JOB_POD_SPEC, *_RESOURCES, "requests", "cpu"),
+    "Memory Request": (*_JOB_POD_SPEC, *_RESOURCES, "requests", "memory"),
+    "GPU Type": (*_JOB_POD_SPEC, "nodeSelector", GPU_PRODUCT_LABEL),
+    "GPU Limit": (*_JOB_POD_SPEC, *_RESOURCES, "limits", GPU_RESOURCE),
+}
+
+POD_COLUMNS: Dict[str, Path] = {
+    "Name": ("metadata", "name"),
+    "Namespace": ("metadata", "namespace"),
+    "Username": ("metadata", "labels", USER_LABEL),
+    "UID": ("metadata", "uid"),
+    "Status": ("status", "phase"),
+    "Node": (*_POD_SPEC, "nodeName"),
+    "Image": (*_POD_SPEC, "containers", 0, "image"),
+    "CPU Request": (*_POD_SPEC, *_RESOURCES, "requests", "cpu"),
+    "Memory Request": (*_POD_SPEC, *_RESOURCES, "requests", "memory"),
+    "GPU Type": (*_POD_SPEC, "nodeSelector", GPU_PRODUCT_LABEL),
+    "GPU Limit": (*_POD_SPEC, *_RESOURCES, "limits", GPU_RESOURCE),
+    "Creation Time": ("metadata", "creationTimestamp"),
+}
+
+
+def _get(obj, path: Path):
+    for key in path:
+        try:
+            obj = obj[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return obj
+
+
+def flatten(objects: Iterable[dict], columns: Dict[str, Path]) -> pd.DataFrame:
+    """
+    Flattens API objects into a DataFrame with one row per object and one
+    column per path in ``columns``, like ``pd.json_normalize`` but only
+    visiting the requested fields and reaching into lists. Missing fields
+    are None.
+    """
+    paths = list(columns.values())
+    return pd.DataFrame.from_records(
+        [tuple(_get(obj, path) for path in paths) for obj in objects],
+        columns=list(columns),
+    )
+
+
+def format_durations(durations: pd.Series) -> pd.Series:
+    """Formats timedeltas as "1d 2h 3m 4s", a column at a time. Missing
+    durations become "N/A"."""
+    seconds = durations.dt.total_seconds()
+    missing = seconds.isna()
+    total = seconds.fillna(0).to_numpy(dtype=np.int64)
+    days, total = np.divmod(total, 86400)
+    hours, total = np.divmod(total, 3600)
+    minutes, total = np.divmod(total, 60)
+    formatted = pd.Series(
+        np.char.add(
+            np.char.add(
+                np.char.add(days.astype(str), "d "),
+                np.char.add(hours.astype(str), "h "),
+            ),
+            np.char.add(
+                np.char.add(minutes.astype(str), "m "),
+                np.char.add(total.astype(str), "s"),
+            ),
+        ),
+        index=durations.index,
+        dtype=object,
+    )
+    formatted[missing] = "N/A"
+    return formatted
+
+
+def _type_columns(
+    frame: pd.DataFrame, now: Optional[datetime] = None
+) -> pd.DataFrame:
+    now = pd.Timestamp(now or datetime.now(timezone.utc))
+    frame["Creation Time"] = pd.to_datetime(frame["Creation Time"], utc=True)
+    frame.insert(
+        frame.columns.get_loc("Creation Time") + 1,
+        "Age",
+        format_durations(now - frame["Creation Time"]),
+    )
+    # Requests such as "500m" CPUs or "1.5Gi" become cores, GB and GPUs
+    frame["CPU Request"] = parse_quantities(frame["CPU Request"])
+    frame["Memory Request"] = parse_quantities(
+        frame["Memory Request"], scale=GIGABYTE
+    )
+    frame["GPU Limit"] = parse_quantities(frame["GPU Limit"])
+    return frame
+
+
+def job_table(
+    jobs: Iterable[dict], now: Optional[datetime] = None
+) -> pd.DataFrame:
+    """
+    Builds the typed table of jobs shown by the dashboards.
+
+    Args:
+        jobs (Iterable[dict]): Job objects, e.g. from list_items.
+        now (datetime, optional): Time the ages are computed at. Defaults to
+            now.
+
+    Returns:
+        pd.DataFrame: The JOB_COLUMNS, with the creation time as a UTC
+            datetime, its "Age" as text, the completion counts as nullable
+            integers and the requests as floats (cores, GB, GPUs).
+    """
+    frame = _type_columns(flatten(jobs, JOB_COLUMNS), now)
+    for column in ("Completions", "Failed", "Succeeded"):
+        frame[column] = frame[column].astype("Int64")
+    return frame
+
+
+def pod_table(
+    pods: Iterable[dict], now: Optional[datetime] = None
+) -> pd.DataFrame:
+    """Builds the typed table of pods shown by the dashboards, with the
+    POD_COLUMNS typed as in job_table."""
+    return _type_columns(flatten(pods, POD_COLUMNS), now)
+
+
+def rich_table(
+    frame: pd.DataFrame,
+    columns: Optional[Sequence[str]] = None,
+    max_rows: Optional[int] = None,
+    **table_kwargs,
+) -> Table:
+    """
+    Renders a DataFrame as a Rich table, formatting whole columns at once.
+
+    Args:
+        frame (pd.DataFrame): The table.
+        columns (Sequence[str], optional): Columns to show. Defaults to all.
+        max_rows (int, optional): Only show the first rows, noting how many
+            were left out in the caption. Defaults to all.
+        **table_kwargs: Passed to rich.table.Table.
+
+    Returns:
+        rich.table.Table: The table, ready for Console.print.
+    """
+    columns = list(columns) if columns is not None else list(frame.columns)
+    shown = frame[columns] if max_rows is None else frame[columns][:max_rows]
+    table_kwargs.setdefault("show_header", True)
+    table_kwargs.setdefault("header_style", "bold magenta")
+    table_kwargs.setdefault("box", rich.box.SQUARE)
+    if len(shown) < len(frame):
+        table_kwargs.setdefault(
+            "caption", f"{len(frame) - len(shown)} more rows not shown"
+        )
+
+    table = Table(**table_kwargs)
+    for column in columns:
+        table.add_column(column)
+    cells = [
+        shown[column].astype(object).where(shown[column].notna(), "N/A")
+        for column in columns
+    ]
+    for row in zip(*(column.astype(str).tolist() for column in cells)):
+        table.add_row(*row)
+    return table
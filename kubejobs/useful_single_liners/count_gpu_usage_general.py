@@ -1,13 +1,23 @@
-import json
 import subprocess
+import threading
+import time
 from collections import OrderedDict, defaultdict
+from typing import Dict, Optional, Tuple
 
 from rich import print
 from rich.console import Console
 from rich.table import Table
 from tqdm.auto import tqdm
 
-# GPU details
+from kubejobs.capacity import gpu_capacity, queue_gpu_quota
+from kubejobs.gpu_accounting import (
+    get_gpu_usage_view,
+    pod_gpu_product,
+    pod_gpu_request,
+)
+from kubejobs.informer import PODS, get_informer
+
+# GPU details, used when the nodes of the cluster cannot be listed
 GPU_DETAIL_DICT = {
     "NVIDIA-A100-SXM4-80GB": 40,
     "NVIDIA-A100-SXM4-40GB": 112,
@@ -16,7 +26,9 @@ GPU_DETAIL_DICT = {
     "NVIDIA-H100-80GB-HBM3": 32,
 }
 
+# Used when the quota of the Kueue queue cannot be read
 INFORMATICS_GPU_ALLOWANCE = 60
+INFORMATICS_QUEUE = "informatics-user-queue"
 
 
 # 🚀 Execute the shell command and get the output
@@ -31,45 +43,21 @@ def run_command(command: str) -> str:
     return result.stdout
 
 
-def get_k8s_pods_gpu_info():
-    # Run kubectl command to get all pods in JSON format
-    result = subprocess.run(
-        ["kubectl", "get", "pods", "-o", "json"], stdout=subprocess.PIPE
-    )
-
-    pod_json = json.loads(result.stdout)
+def get_k8s_pods_gpu_info(namespace: Optional[str] = None):
+    # Read all pods from the shared informer cache
+    pods = get_informer(namespace, resources=(PODS,)).pods.list()
 
     # Initialize the dictionary to store GPU info for each pod
     pod_gpu_info = {}
 
     # Loop through each pod
-    for pod in pod_json["items"]:
+    for pod in pods:
         pod_name = pod["metadata"]["name"]
-        containers = pod["spec"]["containers"]
-
-        # Initialize GPU count to 0
-        gpu_count = 0
-        gpu_type = "Unknown"
-
-        # Check if pod has nodeSelector for GPU type
-        if "nodeSelector" in pod["spec"]:
-            gpu_type = pod["spec"]["nodeSelector"].get(
-                "nvidia.com/gpu.product", "Unknown"
-            )
-
-        # Loop through each container to sum up GPU requests
-        for container in containers:
-            resources = container["resources"]
-            if (
-                "limits" in resources
-                and "nvidia.com/gpu" in resources["limits"]
-            ):
-                gpu_count += int(resources["limits"]["nvidia.com/gpu"])
 
         # Store GPU info for the pod
         pod_gpu_info[pod_name] = {
-            "gpu_count": gpu_count,
-            "gpu_type": gpu_type,
+            "gpu_count": pod_gpu_request(pod),
+            "gpu_type": pod_gpu_product(pod),
             "phase": pod["status"]["phase"],
         }
 
@@ -90,50 +78,80 @@ def extract_gpu_info(containers):
     return gpu_model, gpu_count
 
 
-def count_gpu_usage():
-    pod_gpu_info = get_k8s_pods_gpu_info()
-    gpu_usage = {}
+# Namespace to (time computed, result) of count_gpu_usage
+_cached_usage: Dict[Optional[str], Tuple[float, dict]] = {}
+_cached_usage_lock = threading.Lock()
+
+
+def _copy_usage(gpu_usage: dict) -> dict:
+    return {status: dict(gpus) for status, gpus in gpu_usage.items()}
 
-    for pod_name, info in pod_gpu_info.items():
-        gpu_model = info["gpu_type"]
-        gpu_count = info["gpu_count"]
 
-        # Here you may also consider the 'status' of the pod to categorize GPU usage
-        status = info["phase"]
+def count_gpu_usage(
+    namespace: Optional[str] = None, max_staleness: float = 0.0
+):
+    """
+    Counts the GPUs in use per pod phase and GPU product, and the GPUs left
+    free in the cluster and in the Informatics allowance.
 
-        if gpu_model and gpu_count:
-            if status not in gpu_usage:
-                gpu_usage[status] = dict()
-            if gpu_model in gpu_usage[status]:
-                gpu_usage[status][gpu_model] += gpu_count
-            else:
-                gpu_usage[status][gpu_model] = gpu_count
+    Pod usage is read from a GPUUsageView, which the shared informer keeps
+    up to date from pod events, so no pods are listed after the first call.
+
+    Args:
+        namespace (str, optional): Namespace to count. Defaults to the
+            current kube config namespace.
+        max_staleness (float): Seconds for which a previously computed result
+            may be returned. Defaults to 0, always recomputing.
+
+    Returns:
+        dict: GPUs per status, then per GPU product. Every call returns its
+            own copy, which the caller may modify.
+    """
+    # Held while computing, so that concurrent callers wait for one result
+    # rather than all computing it
+    with _cached_usage_lock:
+        now = time.monotonic()
+        cached = _cached_usage.get(namespace)
+        if cached is None or now - cached[0] > max_staleness:
+            cached = (now, _compute_gpu_usage(namespace))
+            _cached_usage[namespace] = cached
+        return _copy_usage(cached[1])
+
+
+def _compute_gpu_usage(namespace: Optional[str]) -> dict:
+    # Cluster totals come from the nodes' allocatable GPUs and the allowance
+    # from the queue's quota, both falling back to the static values
+    cluster_total = gpu_capacity(fallback=GPU_DETAIL_DICT)
+    allowance = queue_gpu_quota(INFORMATICS_QUEUE, namespace)
+    if allowance is None:
+        allowance = INFORMATICS_GPU_ALLOWANCE
+
+    gpu_usage = get_gpu_usage_view(namespace).usage()
 
     gpu_usage["Free"] = {
         k: v - gpu_usage.get("Running", {}).get(k, 0)
-        for k, v in GPU_DETAIL_DICT.items()
+        for k, v in cluster_total.items()
     }
     used_gpus_total = sum(
         [
             gpu_usage.get("Running", {}).get(k, 0)
-            for k, v in GPU_DETAIL_DICT.items()
+            for k, v in cluster_total.items()
         ]
     )
     gpu_usage["Informatics Allowance Free"] = {
         k: min(
             v - gpu_usage.get("Running", {}).get(k, 0),
-            INFORMATICS_GPU_ALLOWANCE - used_gpus_total,
+            allowance - used_gpus_total,
         )
-        for k, v in GPU_DETAIL_DICT.items()
+        for k, v in cluster_total.items()
     }
 
     gpu_usage["Total Free"] = {
         k: v - gpu_usage.get("Running", {}).get(k, 0)
-        for k, v in GPU_DETAIL_DICT.items()
+        for k, v in cluster_total.items()
     }
 
-    gpu_usage["Cluster Total"] = GPU_DETAIL_DICT
-
+    gpu_usage["Cluster Total"] = cluster_total
     return gpu_usage
 
 
@@ -145,7 +163,8 @@ if __name__ == "__main__":
     table.add_column("Status", justify="left", style="cyan")
 
     # Dynamically add columns for each GPU model
-    for gpu_model in GPU_DETAIL_DICT.keys():
+    gpu_models = list(gpu_usage["Cluster Total"].keys())
+    for gpu_model in gpu_models:
         table.add_column(gpu_model, justify="right", style="magenta")
 
     console = Console()
@@ -156,7 +175,7 @@ if __name__ == "__main__":
 
         if status.lower() != "succeeded" and status.lower() != "failed":
 
-            for gpu_model in GPU_DETAIL_DICT.keys():
+            for gpu_model in gpu_models:
                 row.append(
                     str(gpu_dict.get(gpu_model, 0))
                 )  # Use 0 if the GPU model is not found
@@ -1,55 +1,57 @@
-import json
-import re
-import subprocess
+from typing import Optional, Sequence
 
+import fire
 import yaml
 
-
-def get_gpu_usage():
-    pods_info = json.loads(
-        subprocess.check_output(["kubectl", "get", "pods", "-o", "json"])
+from kubejobs.gpu_accounting import aggregate_gpu_usage, fetch_gpu_usage_frame
+
+
+def get_gpu_usage(
+    namespace: Optional[str] = None,
+    phases: Optional[Sequence[str]] = ("Pending", "Running"),
+):
+    """
+    Returns the GPUs used per GPU product, and per user and GPU product,
+    from one list of the pods of a namespace. Users are identified by the
+    eidf/user label set by KubernetesJob.
+
+    Args:
+        namespace (str, optional): Namespace to count. Defaults to the
+            current kube config namespace.
+        phases (Sequence[str], optional): Only count pods in these phases.
+            Defaults to pending and running pods; None counts every pod.
+    """
+    frame = fetch_gpu_usage_frame(namespace)
+
+    gpu_usage = (
+        aggregate_gpu_usage(frame, by=["product"], phases=phases)
+        .set_index("product")["gpus"]
+        .to_dict()
     )
-
-    gpu_usage = {}
     user_gpu_usage = {}
-    for item in pods_info["items"]:
-        pod_name = item["metadata"]["name"]
-        user_name = item["metadata"]["annotations"]["kubernetes.io/created-by"]
-
-        pod_info = json.loads(
-            subprocess.check_output(
-                ["kubectl", "describe", "pod", pod_name, "-o", "json"]
-            )
-        )
-        for container in pod_info["spec"]["containers"]:
-            gpu_request = (
-                container["resources"]
-                .get("requests", {})
-                .get("nvidia.com/gpu")
-            )
-            gpu_model = pod_info["spec"]["nodeSelector"].get(
-                "nvidia.com/gpu.product"
-            )
-
-            if gpu_model and gpu_request:
-                gpu_usage[gpu_model] = gpu_usage.get(gpu_model, 0) + int(
-                    gpu_request
-                )
-                user_gpu_usage[user_name] = user_gpu_usage.get(user_name, {})
-                user_gpu_usage[user_name][gpu_model] = user_gpu_usage[
-                    user_name
-                ].get(gpu_model, 0) + int(gpu_request)
-
-    return gpu_usage, user_gpu_usage
+    for row in aggregate_gpu_usage(
+        frame, by=["user", "product"], phases=phases
+    ).itertuples():
+        user_gpu_usage.setdefault(row.user, {})[row.product] = int(row.gpus)
+
+    return {k: int(v) for k, v in gpu_usage.items()}, user_gpu_usage
 
 
 def dict_to_yaml(dictionary):
     return yaml.dump(dictionary, default_flow_style=False)
 
 
-gpu_usage, user_gpu_usage = get_gpu_usage()
+def main(
+    namespace: Optional[str] = None,
+    phases: Optional[Sequence[str]] = ("Pending", "Running"),
+):
+    gpu_usage, user_gpu_usage = get_gpu_usage(namespace, phases)
+
+    print("Overall GPU Usage:")
+    print(dict_to_yaml(gpu_usage))
+    print("\nUser Specific GPU Usage:")
+    print(dict_to_yaml(user_gpu_usage))
+
 
-print("Overall GPU Usage:")
-print(dict_to_yaml(gpu_usage))
-print("\nUser Specific GPU Usage:")
-print(dict_to_yaml(user_gpu_usage))
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -1,52 +1,116 @@
+import csv
 import json
-import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional
 
 import fire
 from rich import print
 from rich.table import Table
-from tqdm.auto import tqdm
 
+from kubejobs.api import (
+    get_batch_api,
+    get_core_api,
+    get_current_namespace,
+    list_items,
+)
 
-def check_jobs():
-    # Get all jobs
-    get_jobs_command = ["kubectl", "get", "jobs", "-o", "json"]
-    jobs_output = subprocess.check_output(get_jobs_command)
-    jobs_json = json.loads(jobs_output)
+OUTPUT_FORMATS = ("table", "json", "csv")
 
-    table = Table(show_header=True, header_style="bold cyan")
-    table.add_column("Job Name", style="green", width=50)
-    table.add_column("Pods", style="yellow", width=50)
 
-    for job in tqdm(jobs_json["items"]):
-        job_name = job["metadata"]["name"]
+def find_problem_jobs(namespace: Optional[str] = None) -> List[Dict]:
+    """
+    Finds the jobs that have failed pods and no completed pods.
+
+    The jobs and the pods are each listed once, and the pods are joined to
+    their jobs through an index on the job-name label, so the cost is two
+    paged list calls however many jobs the namespace holds.
+
+    Args:
+        namespace (str, optional): Namespace to check. Defaults to the
+            current kube config namespace.
 
-        # Get job details
-        get_job_command = ["kubectl", "get", "job", job_name, "-o", "json"]
-        job_output = subprocess.check_output(get_job_command)
-        job_json = json.loads(job_output)
+    Returns:
+        List[Dict]: One entry per problem job, with its name, its failed and
+            succeeded pod counts and the names of its pods.
+    """
+    namespace = namespace or get_current_namespace()
+
+    pods_by_job = defaultdict(list)
+    for pod in list_items(
+        get_core_api().list_namespaced_pod,
+        namespace,
+        label_selector="job-name",
+    ):
+        metadata = pod["metadata"]
+        pods_by_job[metadata["labels"]["job-name"]].append(metadata["name"])
+
+    problem_jobs = []
+    for job in list_items(get_batch_api().list_namespaced_job, namespace):
+        job_name = job["metadata"]["name"]
+        status = job.get("status", {})
 
         # Check if the job has failed pods
-        failed_pods = job_json["status"].get("failed", 0)
+        failed_pods = status.get("failed", 0)
 
         # Check if the job has completed pods
-        completed_pods = job_json["status"].get("succeeded", 0)
+        completed_pods = status.get("succeeded", 0)
 
         if failed_pods > 0 and completed_pods == 0:
-            # Get all pods for this job
-            get_pods_command = [
-                "kubectl",
-                "get",
-                "pods",
-                "--selector",
-                f"job-name={job_name}",
-                "-o",
-                "json",
-            ]
-            pods_output = subprocess.check_output(get_pods_command)
-            pods_json = json.loads(pods_output)
-
-            pods = [pod["metadata"]["name"] for pod in pods_json["items"]]
-            table.add_row(job_name, "\n".join(pods))
+            problem_jobs.append(
+                {
+                    "job": job_name,
+                    "failed": failed_pods,
+                    "succeeded": completed_pods,
+                    "pods": sorted(pods_by_job.get(job_name, [])),
+                }
+            )
+
+    return problem_jobs
+
+
+def check_jobs(namespace: Optional[str] = None, output: str = "table"):
+    """
+    Reports the jobs that have failed pods and no completed pods.
+
+    Args:
+        namespace (str, optional): Namespace to check. Defaults to the
+            current kube config namespace.
+        output (str): "table" for a Rich table, or "json" or "csv" for
+            machine-readable output on stdout. Defaults to "table".
+    """
+    if output not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"output must be one of {', '.join(OUTPUT_FORMATS)}, not {output!r}"
+        )
+
+    problem_jobs = find_problem_jobs(namespace)
+
+    if output == "json":
+        json.dump(problem_jobs, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+
+    if output == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["job", "failed", "succeeded", "pods"])
+        for job in problem_jobs:
+            writer.writerow(
+                [
+                    job["job"],
+                    job["failed"],
+                    job["succeeded"],
+                    " ".join(job["pods"]),
+                ]
+            )
+        return
+
+    table = Table(show_header=True, header_style="bold cyan")
+    table.add_column("Job Name", style="green", width=50)
+    table.add_column("Pods", style="yellow", width=50)
+
+    for job in problem_jobs:
+        table.add_row(job["job"], "\n".join(job["pods"]))
 
     print(table)
 
@@ -1,51 +1,18 @@
-import json
-import subprocess
-
 from rich.console import Console
 from rich.table import Table
-from tqdm.auto import tqdm
-
 
-# Function to execute a shell command and return the output
-def run_command(command):
-    process = subprocess.Popen(command, stdout=subprocess.PIPE, shell=True)
-    output, error = process.communicate()
-    if error:
-        raise Exception("Error executing command: " + command)
-    return output.decode("utf-8")
+from kubejobs.pvc_usage import PVCUsageIndex
 
-
-# Get the list of pods
-pods_json = run_command(f"kubectl get pods  -o json")
-pods_data = json.loads(pods_json)
-pods = [pod["metadata"]["name"] for pod in pods_data["items"]]
+# Map every PVC to the pods mounting it, from one pod and one PVC list
+index = PVCUsageIndex.from_cluster()
 
 # Create a console instance
 console = Console()
 
-# Prepare data for the table
-data = []
-for pod in tqdm(pods):
-    # Get the PVC name associated with the pod
-    pod_json = run_command(f"kubectl get pod {pod} -o json")
-    pod_data = json.loads(pod_json)
-    volumes = pod_data["spec"]["volumes"]
-
-    pvc_names = []
-    for volume in volumes:
-        if "persistentVolumeClaim" in volume:
-            pvc_names.append(volume["persistentVolumeClaim"]["claimName"])
-
-    for pvc_name in pvc_names:
-        data.append((pvc_name, pod))
-
-# Sort data by PVC name
-data.sort(key=lambda x: x[0])
-
-# Add index to the data
+# Prepare data for the table, sorted by PVC name, with an index
 data = [
     (str(idx), pvc_name, pod)
-    for idx, (pvc_name, pod) in enumerate(data, start=1)
+    for idx, (pvc_name, pod, _) in enumerate(index.mounts(), start=1)
 ]
 
 # Calculate the maximum length of the strings in each column
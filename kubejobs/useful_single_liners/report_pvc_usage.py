@@ -1,35 +1,13 @@
 import re
-import subprocess
 
 from rich import print
 
-# Get all PVCs
-get_pvcs = subprocess.run(
-    ["kubectl", "get", "pvc", "-o", "jsonpath={.items[*].metadata.name}"],
-    capture_output=True,
-    text=True,
-)
-pvcs = get_pvcs.stdout.split()
+from kubejobs.pvc_usage import PVCUsageIndex
 
-# Create a dictionary to store PVC usage status
-pvc_usage = {pvc: False for pvc in pvcs}
-
-# Get all Pods
-get_pods = subprocess.run(
-    ["kubectl", "get", "pods", "-o", "jsonpath={.items[*].metadata.name}"],
-    capture_output=True,
-    text=True,
-)
-pods = get_pods.stdout.split()
-
-# Check each pod for PVC usage
-for pod in pods:
-    describe_pod = subprocess.run(
-        ["kubectl", "describe", "pod", pod], capture_output=True, text=True
-    )
-    for pvc in pvcs:
-        if pvc in describe_pod.stdout:
-            pvc_usage[pvc] = True
+# Map every PVC to the pods mounting it, from one pod and one PVC list.
+# Like kubectl describe, any pod mounting a PVC counts as using it.
+index = PVCUsageIndex.from_cluster()
+pvc_usage = {pvc: bool(index.pods(pvc)) for pvc in index.claims}
 
 
 # Function to sort PVCs by name and index
@@ -1,4 +1,3 @@
-import json
 import subprocess
 import time
 from collections import defaultdict
@@ -11,38 +10,7 @@ import rich
 import wandb
 from tqdm.auto import tqdm
 
-
-def convert_to_gigabytes(value: str) -> float:
-    """
-    Convert the given storage/memory value to base Gigabytes (GB).
-
-    Args:
-        value (str): Input storage/memory value with units. E.g., '20G', '20Gi', '2000M', '2000Mi'
-
-    Returns:
-        float: The value converted to Gigabytes (GB).
-    """
-    # Define conversion factors
-    factor_gb = {
-        "G": 1,
-        "Gi": 1 / 1.073741824,
-        "M": 1 / 1024,
-        "Mi": 1 / (1024 * 1.073741824),
-    }
-
-    # Find the numeric and unit parts of the input
-    numeric_part = "".join(filter(str.isdigit, value))
-    unit_part = "".join(filter(str.isalpha, value))
-
-    # Convert to Gigabytes (GB)
-    if unit_part in factor_gb.keys():
-        return float(numeric_part) * factor_gb[unit_part]
-    elif value == "N/A":
-        return -1
-    else:
-        raise ValueError(
-            f"Unknown unit {unit_part}. Supported units are {list(factor_gb.keys())}."
-        )
+from kubejobs.informer import get_informer
 
 
 def parse_iso_time(time_str: str) -> datetime:
@@ -87,15 +55,12 @@ def fetch_and_render_pod_info(
     wandb.login()
 
     runs = {}  # Store the wandb runs
+    informer = get_informer(namespace)
 
     while True:
-        get_pods_cmd = f"kubectl get pods -n {namespace} -o json"
-        pods_output, pods_error = run_command(get_pods_cmd)
-        pod_data = json.loads(pods_output)
-
         current_time = datetime.now(timezone.utc)
 
-        for pod in tqdm(pod_data["items"]):
+        for pod in tqdm(informer.pods.list()):
             metadata = pod["metadata"]
             spec = pod.get("spec", {})
             status = pod["status"]
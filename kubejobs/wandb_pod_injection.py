@@ -8,6 +8,8 @@ import fire
 from rich import print
 from tqdm.auto import tqdm
 
+from kubejobs.informer import get_informer
+
 
 def run_command(command: str) -> (str, str):
     try:
@@ -95,14 +97,11 @@ def fetch_and_render_pod_info(
     infinite_loop=True,
 ):
     name_set = set()
+    informer = get_informer(namespace)
     while True:
-        get_pods_cmd = f"kubectl get pods -n {namespace} -o json"
-        pods_output, pods_error = run_command(get_pods_cmd)
-        pod_data = json.loads(pods_output)
-
         current_time = datetime.now(timezone.utc)
 
-        for pod in tqdm(pod_data["items"]):
+        for pod in tqdm(informer.pods.list()):
             metadata = pod["metadata"]
             spec = pod.get("spec", {})
             status = pod["status"]
@@ -1,87 +1,17 @@
-import json
 import subprocess
 import time
-from collections import defaultdict
 from datetime import datetime, timezone
 
 import fire
-import numpy as np
 import pandas as pd
 import rich
 import streamlit as st
-from tqdm import tqdm
 
-
-def exponential_moving_average_efficient(data, N):
-    """
-    Compute the Exponential Moving Average (EMA) for a list of values.
-
-    Args:
-        data (list): The list of data points.
-        span (int): The span N for the EMA calculation.
-
-    Returns:
-        float: The EMA of the data.
-    """
-    # Convert list to numpy array for vectorized operations
-    data_array = np.array(data)
-
-    # Calculate the smoothing factor alpha
-    alpha = 2 / (N + 1)
-
-    # Initialize the EMA array
-    ema = np.zeros_like(data_array)
-    ema[0] = data_array[0]
-
-    # Calculate the EMA
-    for i in range(1, len(data_array)):
-        ema[i] = (alpha * data_array[i]) + ((1 - alpha) * ema[i - 1])
-
-    return ema[-1]
-
-
-def convert_to_gigabytes(value: str) -> float:
-    """
-    Convert the given storage/memory value to base Gigabytes (GB).
-
-    Args:
-        value (str): Input storage/memory value with units. E.g., '20G', '20Gi', '2000M', '2000Mi'
-
-    Returns:
-        float: The value converted to Gigabytes (GB).
-    """
-    # Define conversion factors
-    factor_gb = {
-        "G": 1,
-        "Gi": 1 / 1.073741824,
-        "M": 1 / 1024,
-        "Mi": 1 / (1024 * 1.073741824),
-    }
-
-    # Find the numeric and unit parts of the input
-    numeric_part = "".join(filter(str.isdigit, value))
-    unit_part = "".join(filter(str.isalpha, value))
-
-    # Convert to Gigabytes (GB)
-    if unit_part in factor_gb.keys():
-        return float(numeric_part) * factor_gb[unit_part]
-    elif value == "N/A":
-        return -1
-    else:
-        return -1
-
-
-def parse_iso_time(time_str: str) -> datetime:
-    return datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%SZ").replace(
-        tzinfo=timezone.utc
-    )
-
-
-def time_diff_to_human_readable(start: datetime, end: datetime) -> str:
-    diff = end - start
-    minutes, seconds = divmod(diff.seconds, 60)
-    hours, minutes = divmod(minutes, 60)
-    return f"{diff.days}d {hours}h {minutes}m {seconds}s"
+from kubejobs.gpu_metrics import METRICS, GPUMetricsStore
+from kubejobs.gpu_sampling import GPUSampler
+from kubejobs.history import HistoryWriter
+from kubejobs.informer import get_informer
+from kubejobs.tables import pod_table
 
 
 def run_command(command: str) -> str:
@@ -105,11 +35,23 @@ def ssh_into_pod_and_run_command(
     return stdout
 
 
+@st.cache_resource
+def get_sampler(max_workers: int, timeout: float, samples: int) -> GPUSampler:
+    # Streamlit reruns the script on every interaction; the sampler, its
+    # worker threads and circuit breaker are shared by all runs instead
+    return GPUSampler(
+        max_workers=max_workers, timeout=timeout, samples=samples
+    )
+
+
 def fetch_and_render_pod_info(
     namespace="informatics",
     loop=True,
     refresh_interval=0,
     samples_per_gpu=1,
+    max_workers=32,
+    sample_timeout=15.0,
+    history_dir=None,
 ):
     """
     Fetches information about Kubernetes pods and renders it in a Streamlit table.
@@ -118,7 +60,10 @@ def fetch_and_render_pod_info(
     - namespace (str): The Kubernetes namespace to fetch pod information from. Default is "informatics".
     - loop (bool): Whether to continuously refresh the pod information and update the table. Default is True.
     - refresh_interval (int): The number of seconds to wait between each refresh of the pod information. Default is 60.
-    - samples_per_gpu (int): The number of samples to take when measuring GPU utilization. Default is 3.
+    - samples_per_gpu (int): The number of samples to take when measuring GPU utilization. Default is 1.
+    - max_workers (int): The number of pods sampled concurrently. Default is 32.
+    - sample_timeout (float): The number of seconds after which sampling a pod is abandoned. Default is 15.
+    - history_dir (str, optional): Directory where the pod states and GPU samples of every refresh are recorded as Parquet, see kubejobs.history. Default is None, recording nothing.
     """
     # Outside of your loop, before you start refreshing data
     st_table = st.empty()
@@ -143,123 +88,55 @@ def fetch_and_render_pod_info(
         "Age",
     ]
 
-    per_user_total_gpu_memory = defaultdict(list)
-    per_user_total_gpu_utilization = defaultdict(list)
-    per_user_total_gpu_memory_used = defaultdict(list)
-
-    while True:
-        get_pods_cmd = f"kubectl get pods -n {namespace} -o json"
-        pods_output, _ = run_command(get_pods_cmd)
-        pod_data = json.loads(pods_output)
-
-        current_time = datetime.now(timezone.utc)
-        data = []
-
-        for pod in tqdm(pod_data["items"]):
-            metadata = pod["metadata"]
-            spec = pod.get("spec", {})
-            status = pod["status"]
-
-            name = metadata["name"]
-            namespace = metadata["namespace"]
-            uid = metadata["uid"]
-
-            username = metadata.get("labels", {}).get("eidf/user", "N/A")
-            email = metadata.get("annotations", {}).get("eidf/email", "N/A")
-
-            pod_status = status["phase"]
-            node = spec.get("nodeName", "N/A")
+    # Moving averages and recent history per pod and GPU, bounded in size
+    gpu_metrics = GPUMetricsStore(span=25)
 
-            container = spec.get("containers", [{}])[0]
-            image = container.get("image", "N/A")
+    # Pods are listed once and then kept up to date from a watch, so a
+    # refresh reads them from memory instead of re-downloading them
+    informer = get_informer(namespace)
 
-            resources = container.get("resources", {})
-            cpu_request = resources.get("requests", {}).get("cpu", "0")
-            memory_request = resources.get("requests", {}).get("memory", "N/A")
-            gpu_type = spec.get("nodeSelector", {}).get(
-                "nvidia.com/gpu.product", "N/A"
-            )
-            gpu_limit = resources.get("limits", {}).get("nvidia.com/gpu", "0")
+    # nvidia-smi is run through websocket exec, in many pods at once and with
+    # a time limit per pod; pods that keep failing are skipped for a while
+    sampler = get_sampler(max_workers, sample_timeout, samples_per_gpu)
 
-            creation_time = parse_iso_time(metadata["creationTimestamp"])
-            age = time_diff_to_human_readable(creation_time, current_time)
+    # Only the pods that changed since the previous refresh are recorded
+    history = HistoryWriter(history_dir) if history_dir else None
 
-            # SSH into the pod and get GPU utilization details
-            gpu_count_actual = 0
-            for _ in range(samples_per_gpu):
-                gpu_usage_output = ssh_into_pod_and_run_command(
-                    name,
-                    namespace,
-                    "nvidia-smi --query-gpu=memory.total,memory.used,utilization.gpu --format=csv,noheader,nounits",
-                )
-                lines = gpu_usage_output.splitlines()
-                gpu_count_actual = len(lines)
-                for line in lines:
-                    (
-                        gpu_memory_total,
-                        gpu_memory_used,
-                        gpu_utilization,
-                    ) = line.split(",")
-
-                    per_user_total_gpu_memory[username].append(
-                        float(gpu_memory_total)
-                    )
-                    per_user_total_gpu_memory_used[username].append(
-                        float(gpu_memory_used)
-                    )
-                    per_user_total_gpu_utilization[username].append(
-                        float(gpu_utilization)
-                    )
-
-            gpu_memory_total = (
-                exponential_moving_average_efficient(
-                    data=per_user_total_gpu_memory[username],
-                    N=min(25, len(per_user_total_gpu_memory[username])),
-                )
-                if len(per_user_total_gpu_memory[username]) > 0
-                else -1
-            )
-            gpu_memory_used = (
-                exponential_moving_average_efficient(
-                    data=per_user_total_gpu_memory_used[username],
-                    N=min(25, len(per_user_total_gpu_memory_used[username])),
-                )
-                if len(per_user_total_gpu_memory_used[username]) > 0
-                else -1
-            )
-            gpu_utilization = (
-                exponential_moving_average_efficient(
-                    data=per_user_total_gpu_utilization[username],
-                    N=min(25, len(per_user_total_gpu_utilization[username])),
-                )
-                if len(per_user_total_gpu_utilization[username]) > 0
-                else -1
-            )
-
-            data.append(
-                [
-                    str(name),
-                    str(namespace),
-                    str(username),
-                    str(uid),
-                    pod_status,
-                    node,
-                    image,
-                    int(cpu_request),
-                    convert_to_gigabytes(memory_request),
-                    gpu_type,
-                    int(gpu_limit),
-                    gpu_memory_used,
-                    gpu_memory_total,
-                    gpu_utilization,
-                    gpu_count_actual,
-                    str(creation_time),
-                    age,
-                ]
-            )
+    while True:
+        current_time = datetime.now(timezone.utc)
 
-        df = pd.DataFrame(data, columns=columns)
-        # Inside your loop, when you update the DataFrame
+        pods = informer.pods.list()
+        samples = sampler.sample(
+            (pod["metadata"]["name"], pod["metadata"]["namespace"])
+            for pod in pods
+            if pod["status"]["phase"] == "Running"
+        )
+        if history is not None:
+            history.write_pods(pods, current_time, complete=True)
+            history.write_gpu_samples(samples.values(), current_time)
+
+        # Typed columns straight from the pod objects, ages and requests
+        # computed a column at a time
+        df = pod_table(pods, current_time)
+
+        # GPU utilization details, sampled in all running pods at once
+        gpu_emas, gpu_counts = [], []
+        for name, namespace in zip(df["Name"], df["Namespace"]):
+            pod_samples = samples.get((name, namespace))
+            for gpu_round in pod_samples.rounds if pod_samples else []:
+                gpu_metrics.update(name, namespace, gpu_round)
+            gpu_emas.append(gpu_metrics.pod_ema(name, namespace))
+            gpu_counts.append(pod_samples.gpu_count if pod_samples else 0)
+        gpu_emas = pd.DataFrame(gpu_emas, columns=list(METRICS), dtype=float)
+
+        df["GPU Memory Used"] = gpu_emas["memory_used"].fillna(-1).to_numpy()
+        df["GPU Memory Total"] = gpu_emas["memory_total"].fillna(-1).to_numpy()
+        df["GPU Utilization"] = gpu_emas["utilization"].fillna(-1).to_numpy()
+        df["GPU Count Actual"] = gpu_counts
+        df = df[columns]
+
+        # Forget the metrics of pods that are gone
+        gpu_metrics.retain(set(zip(df["Name"], df["Namespace"])))
 
         st_table.dataframe(df)
 
@@ -7,6 +7,7 @@ dev_requirements = [
     "isort",
     "flake8",
     "autoflake",
+    "pytest",
     "sphinx",
     "sphinx_rtd_theme",
     "sphinx-autodoc-typehints",
@@ -30,6 +31,7 @@ setup(
     install_requires=requirements,
     extras_require={
         "dev": dev_requirements,
+        "history": ["pyarrow"],
     },
     classifiers=[
         "Development Status :: 3 - Alpha",
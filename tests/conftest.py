@@ -0,0 +1,130 @@
+from typing import Iterable, Optional
+
+import pytest
+
+from kubejobs.gpu_accounting import (
+    GPU_PRODUCT_LABEL,
+    GPU_RESOURCE,
+    USER_LABEL,
+)
+from kubejobs.informer import (
+    JOB_INDEXERS,
+    POD_INDEXERS,
+    PVC_INDEXERS,
+    Store,
+)
+
+NAMESPACE = "test"
+
+
+def make_pod(
+    name: str,
+    phase: str = "Running",
+    user: str = "jane",
+    claims: Iterable[str] = (),
+    job: Optional[str] = None,
+    gpus: int = 1,
+    gpu_product: str = "NVIDIA-A100-SXM4-80GB",
+    created: str = "2024-05-01T00:00:00Z",
+) -> dict:
+    labels = {USER_LABEL: user}
+    if job is not None:
+        labels["job-name"] = job
+    return {
+        "metadata": {
+            "name": name,
+            "namespace": NAMESPACE,
+            "uid": f"uid-{name}",
+            "labels": labels,
+            "creationTimestamp": created,
+        },
+        "spec": {
+            "nodeName": "node-1",
+            "nodeSelector": {GPU_PRODUCT_LABEL: gpu_product},
+            "containers": [
+                {
+                    "name": "main",
+                    "image": "busybox",
+                    "resources": {
+                        "limits": {GPU_RESOURCE: str(gpus)},
+                        "requests": {"cpu": "500m", "memory": "1.5Gi"},
+                    },
+                }
+            ],
+            "volumes": [
+                {"name": claim, "persistentVolumeClaim": {"claimName": claim}}
+                for claim in claims
+            ],
+        },
+        "status": {"phase": phase},
+    }
+
+
+def make_job(
+    name: str,
+    condition: Optional[str] = None,
+    labels: Optional[dict] = None,
+    created: str = "2024-05-01T00:00:00Z",
+) -> dict:
+    status = {}
+    if condition is not None:
+        status["conditions"] = [{"type": condition, "status": "True"}]
+    return {
+        "metadata": {
+            "name": name,
+            "namespace": NAMESPACE,
+            "uid": f"uid-{name}",
+            "labels": dict(labels or {}),
+            "creationTimestamp": created,
+        },
+        "spec": {"completions": 1},
+        "status": status,
+    }
+
+
+def make_pvc(name: str) -> dict:
+    return {"metadata": {"name": name, "namespace": NAMESPACE}}
+
+
+@pytest.fixture
+def pod():
+    return make_pod
+
+
+@pytest.fixture
+def job():
+    return make_job
+
+
+@pytest.fixture
+def pvc():
+    return make_pvc
+
+
+class FakeInformer:
+    """A ClusterInformer without reflectors: ``emit`` updates the stores
+    and calls the handlers as a watch event would."""
+
+    def __init__(self, namespace: str = NAMESPACE):
+        self.namespace = namespace
+        self.pods = Store(POD_INDEXERS)
+        self.jobs = Store(JOB_INDEXERS)
+        self.pvcs = Store(PVC_INDEXERS)
+        self.handlers = []
+
+    def add_event_handler(self, handler):
+        self.handlers.append(handler)
+
+    def emit(self, kind: str, event_type: str, obj: dict):
+        store = getattr(self, kind)
+        if event_type == "DELETED":
+            store.delete(obj)
+        else:
+            store.upsert(obj)
+        for handler in self.handlers:
+            handler(kind, event_type, obj)
+
+
+@pytest.fixture
+def informer():
+    return FakeInformer()
@@ -0,0 +1,92 @@
+import threading
+from collections import defaultdict
+
+import pytest
+
+from kubejobs import informer as informer_module
+from kubejobs.gpu_accounting import GPUUsageView
+from kubejobs.informer import JOBS, PODS, PVCS, get_informer
+from kubejobs.useful_single_liners import count_gpu_usage_general
+from kubejobs.useful_single_liners.count_gpu_usage_general import (
+    count_gpu_usage,
+)
+
+A100 = "NVIDIA-A100-SXM4-80GB"
+H100 = "NVIDIA-H100-80GB-HBM3"
+
+
+@pytest.fixture
+def usage(monkeypatch, informer, pod):
+    informer.emit(PODS, "ADDED", pod("a", gpus=2))
+    informer.emit(PODS, "ADDED", pod("b", phase="Pending", gpu_product=H100))
+    view = GPUUsageView(informer)
+    computed = []
+
+    def get_gpu_usage_view(namespace):
+        computed.append(namespace)
+        return view
+
+    module = count_gpu_usage_general
+    monkeypatch.setattr(module, "_cached_usage", {})
+    monkeypatch.setattr(module, "get_gpu_usage_view", get_gpu_usage_view)
+    monkeypatch.setattr(
+        module, "gpu_capacity", lambda fallback: {A100: 8, H100: 4}
+    )
+    monkeypatch.setattr(module, "queue_gpu_quota", lambda queue, namespace: 5)
+    return computed
+
+
+def test_count_gpu_usage(usage):
+    gpu_usage = count_gpu_usage("test")
+    assert gpu_usage["Running"] == {A100: 2}
+    assert gpu_usage["Pending"] == {H100: 1}
+    assert gpu_usage["Free"] == {A100: 6, H100: 4}
+    assert gpu_usage["Informatics Allowance Free"] == {A100: 3, H100: 3}
+
+
+def test_cached_usage_is_shared_safely(usage):
+    results = []
+
+    def count():
+        results.append(count_gpu_usage("test", max_staleness=60))
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert usage == ["test"]
+
+    # Callers get their own copy of the cached result
+    results[0]["Free"][A100] = 0
+    assert count_gpu_usage("test", max_staleness=60)["Free"][A100] == 6
+    assert count_gpu_usage("test")["Free"][A100] == 6
+    assert usage == ["test", "test"]
+
+
+def test_informers_follow_only_the_kinds_needed(monkeypatch):
+    started = []
+
+    class ClusterInformer:
+        def __init__(self, namespace, resources):
+            self.namespace = namespace
+            self.resources = tuple(resources)
+
+        def start(self):
+            started.append(self.resources)
+            return self
+
+        def wait_for_sync(self, timeout):
+            return True
+
+    monkeypatch.setattr(informer_module, "ClusterInformer", ClusterInformer)
+    monkeypatch.setattr(informer_module, "_informers", defaultdict(list))
+    pods = get_informer("test", resources=(PODS,))
+    assert started == [(PODS,)]
+
+    full = get_informer("test")
+    assert started == [(PODS,), (PODS, JOBS, PVCS)]
+    # Informers following more kinds than needed are reused
+    assert get_informer("test", resources=(PODS,)) is pods
+    assert get_informer("test", resources=(PVCS, JOBS)) is full
+    assert get_informer("other", resources=(PODS,)) is not pods
@@ -0,0 +1,115 @@
+import pytest
+
+from kubejobs import export
+from kubejobs.export import (
+    export_manifests,
+    iter_manifests,
+    replay_manifest_file,
+)
+from kubejobs.jobs import KubernetesJob
+from kubejobs.submission import SubmittedObject
+
+
+def make_job(name: str, **kwargs) -> KubernetesJob:
+    return KubernetesJob(
+        name=name,
+        image="busybox",
+        command=["echo", name],
+        kueue_queue_name="test-queue",
+        gpu_type="nvidia.com/gpu",
+        gpu_limit=1,
+        namespace="test",
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def jobs():
+    return [
+        make_job("single"),
+        make_job("sweep", sweep_commands=["run a", "run b"]),
+    ]
+
+
+@pytest.mark.parametrize("suffix", [".yaml", ".jsonl.gz"])
+def test_sweeps_are_exported_with_their_config_map(tmp_path, jobs, suffix):
+    path = tmp_path / f"manifests{suffix}"
+    assert export_manifests(jobs, path) == 3
+    manifests = list(iter_manifests(path))
+    assert [manifest["kind"] for manifest in manifests] == [
+        "Job",
+        "ConfigMap",
+        "Job",
+    ]
+    assert manifests[1] == jobs[1].generate_sweep_config_map()
+    assert manifests[2] == jobs[1].generate_dict()
+
+
+def test_replay_creates_config_maps_with_their_job(
+    tmp_path, monkeypatch, jobs
+):
+    path = tmp_path / "manifests.yaml"
+    orphan = {
+        "apiVersion": "v1",
+        "kind": "ConfigMap",
+        "metadata": {"name": "orphan", "namespace": "test"},
+    }
+    export_manifests([orphan, *jobs], path)
+    submitted = []
+
+    def name_of(manifest):
+        metadata = manifest["metadata"]
+        return metadata.get("name") or metadata["generateName"]
+
+    def submit_manifest(manifest):
+        name = name_of(manifest)
+        submitted.append((manifest["kind"], name))
+        return SubmittedObject(name, "uid", "test", manifest["kind"])
+
+    def submit_indexed_job(manifest, config_map):
+        name = name_of(manifest)
+        submitted.append(("Indexed", name, config_map["metadata"]["name"]))
+        return SubmittedObject(name, "uid", "test", "Job")
+
+    monkeypatch.setattr(export, "submit_manifest", submit_manifest)
+    monkeypatch.setattr(export, "submit_indexed_job", submit_indexed_job)
+    monkeypatch.setattr(
+        "kubejobs.submission.get_api_client", lambda **kwargs: None
+    )
+
+    results = replay_manifest_file(str(path), rate_limit=None)
+    assert results["error"].isna().all()
+    sweep_config_map = jobs[1].sweep_config_map_name
+    assert sorted(submitted) == [
+        ("ConfigMap", "orphan"),
+        ("Indexed", "sweep-", sweep_config_map),
+        ("Job", "single-"),
+    ]
+    assert list(results["command"]) == ["single-", "sweep-", "orphan"]
+
+
+def test_replay_hands_each_config_map_to_one_job(tmp_path, monkeypatch):
+    # The ConfigMap is created with the first Job mounting it and reused by
+    # the second
+    sweep = make_job("sweep", sweep_commands=["run a"])
+    path = tmp_path / "manifests.yaml"
+    export_manifests([sweep, sweep.generate_dict()], path)
+    submitted = []
+
+    def submit_manifest(manifest):
+        submitted.append((manifest["kind"], type(manifest)))
+        return SubmittedObject("sweep-abcde", "uid", "test", "Job")
+
+    def submit_indexed_job(manifest, config_map):
+        submitted.append(("Indexed", type(manifest)))
+        return SubmittedObject("sweep-abcde", "uid", "test", "Job")
+
+    monkeypatch.setattr(export, "submit_manifest", submit_manifest)
+    monkeypatch.setattr(export, "submit_indexed_job", submit_indexed_job)
+    monkeypatch.setattr(
+        "kubejobs.submission.get_api_client", lambda **kwargs: None
+    )
+
+    results = replay_manifest_file(str(path), rate_limit=None, max_workers=1)
+    assert results["error"].isna().all()
+    assert submitted == [("Indexed", dict), ("Job", dict)]
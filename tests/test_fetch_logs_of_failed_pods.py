@@ -0,0 +1,113 @@
+import json
+
+import pytest
+from kubernetes import client
+
+pytest.importorskip("fire")
+
+from kubejobs import fetch_logs_of_failed_pods as module  # noqa: E402
+
+
+class Response:
+    def __init__(self, body: dict):
+        self.data = json.dumps(body)
+
+
+class FakeCoreApi:
+    def __init__(self, gone: bool = False):
+        self.gone = gone
+        self.collection_deletes = []
+        self.deleted = []
+
+    def list_namespaced_pod(self, *args, **kwargs):
+        raise AssertionError("listed through list_pages")
+
+    def delete_collection_namespaced_pod(self, namespace, **kwargs):
+        self.collection_deletes.append(kwargs)
+        if self.gone:
+            raise client.ApiException(status=410, reason="Gone")
+        jobs = kwargs["label_selector"].split("(")[1].rstrip(")").split(",")
+        return Response({"items": [{} for job in jobs for _ in range(2)]})
+
+    def delete_namespaced_pod(self, name, namespace, **kwargs):
+        self.deleted.append(name)
+
+
+@pytest.fixture
+def harvest(monkeypatch, tmp_path, pod):
+    def failed(name, job):
+        return pod(name, phase="Failed", job=job)
+
+    pods = [
+        failed("train-a-1", "train-a"),
+        failed("train-a-2", "train-a"),
+        failed("train-b-1", "train-b"),
+        failed("train-b-2", "train-b"),
+        failed("train-c-1", "train-c"),
+        failed("train-c-2", "train-c"),
+        failed("other-1", "other"),
+    ]
+
+    def list_pages(list_fn, namespace, **kwargs):
+        assert kwargs["field_selector"] == "status.phase=Failed"
+        yield {"metadata": {"resourceVersion": "42"}, "items": pods[:4]}
+        yield {"metadata": {"resourceVersion": "42"}, "items": pods[4:]}
+
+    def stream_pod_log(pod_name, namespace, log_path, **kwargs):
+        if pod_name == "train-c-2":
+            raise client.ApiException(status=500)
+        log_path.write_text("log")
+
+    def run(core_api: FakeCoreApi, **kwargs):
+        monkeypatch.setattr(module, "get_api_client", lambda **kwargs: None)
+        monkeypatch.setattr(module.client, "CoreV1Api", lambda api: core_api)
+        monkeypatch.setattr(module, "list_pages", list_pages)
+        monkeypatch.setattr(module, "stream_pod_log", stream_pod_log)
+        module.fetch_logs_of_failed_jobs(
+            "test", "train", log_dir=tmp_path, max_workers=2, **kwargs
+        )
+        return sorted(path.name for path in tmp_path.iterdir())
+
+    return run
+
+
+def test_saved_pods_are_deleted_per_job(harvest):
+    core_api = FakeCoreApi()
+    saved = harvest(core_api)
+    assert saved == [
+        "train-a-1.log",
+        "train-a-2.log",
+        "train-b-1.log",
+        "train-b-2.log",
+        "train-c-1.log",
+    ]
+    assert core_api.collection_deletes == [
+        {
+            "label_selector": "job-name in (train-a,train-b)",
+            "field_selector": "status.phase=Failed",
+            "resource_version": "42",
+            "resource_version_match": "Exact",
+            "_preload_content": False,
+        }
+    ]
+    # train-c-2 keeps its pod for a retry
+    assert core_api.deleted == ["train-c-1"]
+
+
+def test_pods_are_deleted_one_by_one_without_the_snapshot(harvest):
+    core_api = FakeCoreApi(gone=True)
+    harvest(core_api)
+    assert len(core_api.collection_deletes) == 1
+    assert core_api.deleted == [
+        "train-a-1",
+        "train-a-2",
+        "train-b-1",
+        "train-b-2",
+        "train-c-1",
+    ]
+
+
+def test_nothing_is_deleted_on_request(harvest):
+    core_api = FakeCoreApi()
+    assert len(harvest(core_api, delete=False)) == 5
+    assert core_api.collection_deletes == core_api.deleted == []
@@ -0,0 +1,119 @@
+import math
+import threading
+
+import pytest
+
+from kubejobs import gpu_sampling
+from kubejobs.gpu_sampling import (
+    CONNECT_TIMEOUT,
+    ROUND_SEPARATOR,
+    CircuitBreaker,
+    GPUSampler,
+    parse_sampling_output,
+)
+
+OUTPUT = (
+    f"0, 81920, 1024, 50\n1, 81920, [N/A], 0\n{ROUND_SEPARATOR}\n"
+    f"0, 81920, 2048, 100\n1, 81920, 0, 0\n{ROUND_SEPARATOR}\n"
+)
+
+
+class FakeResponse:
+    """A finished exec websocket."""
+
+    def __init__(self, stdout: str, status: str = '{"status":"Success"}'):
+        self.stdout = stdout
+        self.status = status
+        self.closed = False
+
+    def is_open(self):
+        return False
+
+    def read_stdout(self, timeout=None):
+        return self.stdout
+
+    def read_stderr(self, timeout=None):
+        return "nvidia-smi: not found"
+
+    def read_channel(self, channel, timeout=None):
+        return self.status
+
+    def close(self):
+        self.closed = True
+
+
+FakeCoreApi = type("CoreV1Api", (), {"connect_get_namespaced_pod_exec": None})
+
+
+@pytest.fixture
+def sampler(monkeypatch):
+    monkeypatch.setattr(GPUSampler, "_core_api", lambda self: FakeCoreApi)
+    sampler = GPUSampler(max_workers=2, timeout=5, samples=2, interval=1)
+    yield sampler
+    sampler.close()
+
+
+def test_parse_sampling_output():
+    rounds = parse_sampling_output(OUTPUT)
+    assert [len(gpus) for gpus in rounds] == [2, 2]
+    assert rounds[0][0].memory_used == 1024
+    assert math.isnan(rounds[0][1].memory_used)
+    assert rounds[1][0].utilization == 100
+
+
+def test_exec_is_bounded(sampler, monkeypatch):
+    calls = []
+
+    def stream(method, pod, namespace, **kwargs):
+        calls.append(kwargs)
+        return FakeResponse(OUTPUT)
+
+    monkeypatch.setattr(gpu_sampling, "stream", stream)
+    results = sampler.sample([("a", "test"), ("b", "test")])
+    assert [results[pod, "test"].gpu_count for pod in "ab"] == [2, 2]
+    assert all(
+        kwargs["_request_timeout"] == (CONNECT_TIMEOUT, 6) for kwargs in calls
+    )
+
+
+def test_failing_pods_are_skipped(sampler, monkeypatch):
+    sampler.breaker = CircuitBreaker(failure_threshold=2)
+    monkeypatch.setattr(
+        gpu_sampling,
+        "stream",
+        lambda *args, **kwargs: FakeResponse(
+            "", status='{"status":"Failure"}'
+        ),
+    )
+    for _ in range(2):
+        assert sampler.sample_pod("a", "test").error == "nvidia-smi: not found"
+    assert (
+        sampler.sample_pod("a", "test").error == "skipped, pod keeps failing"
+    )
+
+
+def test_batch_timeouts_are_counted_once(monkeypatch):
+    release = threading.Event()
+
+    def stream(method, pod, namespace, **kwargs):
+        release.wait()
+        return FakeResponse("", status='{"status":"Failure"}')
+
+    monkeypatch.setattr(gpu_sampling, "stream", stream)
+    monkeypatch.setattr(GPUSampler, "_core_api", lambda self: FakeCoreApi)
+    sampler = GPUSampler(max_workers=1, timeout=0.05)
+    sampler.breaker = CircuitBreaker(failure_threshold=2)
+    try:
+        results = sampler.sample([("running", "test"), ("queued", "test")])
+        assert {result.error for result in results.values()} == {"timed out"}
+        # The queued pod was cancelled and counts as failed; the running
+        # one reports its own failure once it finishes
+        assert sampler.breaker._failures == {"test/queued": 1}
+        release.set()
+        sampler._executor.shutdown(wait=True)
+        assert sampler.breaker._failures == {
+            "test/queued": 1,
+            "test/running": 1,
+        }
+    finally:
+        release.set()
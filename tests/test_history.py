@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from kubejobs.history import (  # noqa: E402
+    DELETED,
+    HistoryWriter,
+    gpu_hours,
+    read_history,
+)
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def write(root, pods, at=NOW, complete=True):
+    with HistoryWriter(root) as writer:
+        return writer.write_pods(pods, snapshot_time=at, complete=complete)
+
+
+def test_unchanged_snapshot_writes_nothing(tmp_path, pod):
+    pods = [pod("a"), pod("b")]
+    with HistoryWriter(tmp_path) as writer:
+        assert writer.write_pods(pods, snapshot_time=NOW, complete=True) == 2
+        later = NOW + timedelta(seconds=5)
+        assert writer.write_pods(pods, snapshot_time=later, complete=True) == 0
+        assert (
+            writer.write_pods(pods, snapshot_time=later, complete=False) == 0
+        )
+
+    assert len(read_history(tmp_path, "pods")) == 2
+
+
+def test_empty_snapshots(tmp_path, pod):
+    with HistoryWriter(tmp_path) as writer:
+        assert writer.write_pods([], snapshot_time=NOW, complete=True) == 0
+        assert writer.write_pods([pod("a")], snapshot_time=NOW) == 1
+        # A partial empty listing says nothing about deletions
+        assert writer.write_pods([], snapshot_time=NOW, complete=False) == 0
+        assert writer.write_pods([], snapshot_time=NOW, complete=True) == 1
+
+    rows = read_history(tmp_path, "pods").sort_values("snapshot_time")
+    assert rows["phase"].tolist() == ["Running", DELETED]
+
+
+def test_changed_pods_are_recorded(tmp_path, pod):
+    with HistoryWriter(tmp_path) as writer:
+        writer.write_pods([pod("a"), pod("b")], snapshot_time=NOW)
+        changed = [pod("a", phase="Succeeded"), pod("b")]
+        assert writer.write_pods(changed, snapshot_time=NOW) == 1
+
+    rows = read_history(tmp_path, "pods", columns=["name", "phase"])
+    assert sorted(rows.itertuples(index=False, name=None)) == [
+        ("a", "Running"),
+        ("a", "Succeeded"),
+        ("b", "Running"),
+    ]
+
+
+def test_restart_restores_last_rows(tmp_path, pod):
+    assert write(tmp_path, [pod("a"), pod("b")]) == 2
+    # A new writer reads back the last rows instead of duplicating them
+    later = NOW + timedelta(minutes=1)
+    assert write(tmp_path, [pod("a"), pod("b")], at=later) == 0
+    assert write(tmp_path, [pod("a", phase="Failed")], at=later) == 2
+
+    rows = read_history(tmp_path, "pods", columns=["uid", "phase"])
+    assert sorted(rows.itertuples(index=False, name=None)) == [
+        ("uid-a", "Failed"),
+        ("uid-a", "Running"),
+        ("uid-b", DELETED),
+        ("uid-b", "Running"),
+    ]
+    # Deleted pods are not restored, so they are not deleted twice
+    assert write(tmp_path, [pod("a", phase="Failed")], at=later) == 0
+
+
+def test_first_snapshot_of_a_day_records_every_pod(tmp_path, pod):
+    today = NOW.replace(hour=8, minute=0, second=0)
+    with HistoryWriter(tmp_path) as writer:
+        writer.write_pods([pod("a")], snapshot_time=today - timedelta(days=1))
+        assert writer.write_pods([pod("a")], snapshot_time=today) == 1
+        assert writer.write_pods([pod("a")], snapshot_time=today) == 0
+
+
+def test_gpu_hours_reads_from_the_day_before_start(tmp_path, pod):
+    today = NOW.replace(hour=0, minute=0, second=0)
+    # Running since three days ago, and recorded again on each day since
+    for days in (3, 1):
+        write(tmp_path, [pod("a", gpus=2)], at=today - timedelta(days=days))
+    write(tmp_path, [pod("a", gpus=2)], at=today + timedelta(hours=8))
+    # A partition older than the lookback is never opened
+    old = tmp_path / "pods" / f"date={(today - timedelta(days=2)):%Y-%m-%d}"
+    old.mkdir(parents=True)
+    (old / "part-broken.parquet").write_bytes(b"not parquet")
+
+    hours = gpu_hours(
+        tmp_path,
+        start=today + timedelta(hours=6),
+        end=today + timedelta(hours=12),
+        max_gap=None,
+    )
+    assert hours.to_dict("records") == [{"user": "jane", "gpu_hours": 12.0}]
+
+
+def test_gpu_hours_stop_after_the_last_snapshot(tmp_path, pod):
+    today = NOW.replace(hour=0, minute=0, second=0)
+    write(tmp_path, [pod("a", gpus=2), pod("b")], at=today)
+    # b changes two hours later, then the writer stops while a still runs
+    write(
+        tmp_path,
+        [pod("a", gpus=2), pod("b", phase="Succeeded")],
+        at=today + timedelta(hours=2),
+    )
+
+    hours = gpu_hours(
+        tmp_path,
+        start=today,
+        end=today + timedelta(hours=12),
+        by=["name"],
+    )
+    assert hours.to_dict("records") == [
+        {"name": "a", "gpu_hours": 6.0},
+        {"name": "b", "gpu_hours": 2.0},
+    ]
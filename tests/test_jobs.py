@@ -0,0 +1,103 @@
+import pytest
+
+from kubejobs import capacity
+from kubejobs.capacity import ClusterCapacity, NodeShape
+from kubejobs.jobs import KubernetesJob, default_shm_size
+from kubejobs.pods import KubernetesPod
+
+A100 = "NVIDIA-A100-SXM4-80GB"
+
+
+@pytest.fixture
+def listed_nodes(monkeypatch):
+    """Counts the calls listing the cluster's nodes, which find none."""
+    calls = []
+
+    def fetch_cluster_capacity():
+        calls.append(1)
+        return ClusterCapacity()
+
+    monkeypatch.setattr(
+        capacity, "fetch_cluster_capacity", fetch_cluster_capacity
+    )
+    monkeypatch.setattr(capacity, "_capacity", None)
+    monkeypatch.setattr(capacity, "_capacity_checked_at", None)
+    return calls
+
+
+@pytest.mark.parametrize("gpu_product", [None, A100])
+def test_manifests_are_built_offline(listed_nodes, gpu_product):
+    job = KubernetesJob(
+        name="offline",
+        image="busybox",
+        command=["echo", "hi"],
+        gpu_type="nvidia.com/gpu",
+        gpu_product=gpu_product,
+        gpu_limit=1,
+        kueue_queue_name="test-queue",
+    )
+    assert "kind: Job" in job.generate_yaml()
+    pod = KubernetesPod(
+        name="offline",
+        image="busybox",
+        command=["echo", "hi"],
+        gpu_type="nvidia.com/gpu",
+        gpu_product=gpu_product,
+        gpu_limit=1,
+    )
+    assert "kind: Pod" in pod.generate_yaml()
+    assert job.shm_size == pod.shm_size
+    assert listed_nodes == []
+
+
+def test_shm_size_uses_a_discovered_node_shape(listed_nodes, monkeypatch):
+    static = default_shm_size(A100, 1)
+    shape = NodeShape(cpu=64, memory_gb=512, gpus=4)
+    monkeypatch.setattr(
+        capacity,
+        "fetch_cluster_capacity",
+        lambda: ClusterCapacity(node_shapes={A100: shape}),
+    )
+    assert default_shm_size(A100, 1) == static
+    assert default_shm_size(A100, 1, discover=True) == "128G"
+    # Once discovered, the shape is reused without listing the nodes again
+    assert default_shm_size(A100, 2) == "170G"
+    assert default_shm_size(None, 1) == static
+
+
+def sweep_job(**kwargs) -> KubernetesJob:
+    return KubernetesJob(
+        name="sweep",
+        image="busybox",
+        kueue_queue_name="test-queue",
+        gpu_type="nvidia.com/gpu",
+        gpu_limit=1,
+        sweep_commands=["run a", "run b", "run c"],
+        **kwargs,
+    )
+
+
+def test_sweep_failures_are_counted_per_command(listed_nodes):
+    spec = sweep_job().generate_dict()["spec"]
+    assert spec["completionMode"] == "Indexed"
+    assert spec["completions"] == spec["parallelism"] == 3
+    assert spec["backoffLimitPerIndex"] == 0
+    assert "backoffLimit" not in spec
+
+    spec = sweep_job(
+        backoff_limit=10, backoff_limit_per_index=2, parallelism=1
+    ).generate_dict()["spec"]
+    assert spec["backoffLimitPerIndex"] == 2
+    assert spec["backoffLimit"] == 10
+    assert spec["parallelism"] == 1
+
+    job = KubernetesJob(
+        name="single",
+        image="busybox",
+        kueue_queue_name="test-queue",
+        gpu_type="nvidia.com/gpu",
+        gpu_limit=1,
+    )
+    spec = job.generate_dict()["spec"]
+    assert spec["backoffLimit"] == 0
+    assert "backoffLimitPerIndex" not in spec
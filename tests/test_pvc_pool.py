@@ -0,0 +1,134 @@
+import json
+
+from kubejobs.experiments.pvc_pool import PVCPool
+from kubejobs.informer import JOBS, PODS, PVCS
+
+
+def add_claims(informer, pvc, *names):
+    for name in names:
+        informer.emit(PVCS, "ADDED", pvc(name))
+
+
+def test_claims_follow_pvc_events(informer, pvc):
+    add_claims(informer, pvc, "gate-pvc-0", "other-pvc-0")
+    pool = PVCPool(informer, "gate")
+    assert pool.acquire("exp-1", timeout=0) == "gate-pvc-0"
+    assert pool.acquire("exp-2", timeout=0) is None
+
+    # A new claim is usable as soon as its event arrives
+    add_claims(informer, pvc, "gate-pvc-1", "gate-pvc-2")
+    informer.emit(PVCS, "DELETED", pvc("gate-pvc-1"))
+    assert pool.acquire("exp-2", timeout=0) == "gate-pvc-2"
+    assert pool.acquire("exp-3", timeout=0) is None
+
+
+def test_claims_are_never_leased_twice(informer, pvc):
+    add_claims(informer, pvc, *(f"gate-pvc-{i}" for i in range(3)))
+    pool = PVCPool(informer, "gate")
+    claims = [pool.acquire(f"exp-{i}", timeout=0) for i in range(4)]
+    assert sorted(claims[:3]) == ["gate-pvc-0", "gate-pvc-1", "gate-pvc-2"]
+    assert claims[3] is None
+
+    # Released claims are handed out after the others
+    pool.release("gate-pvc-1")
+    assert pool.acquire("exp-4", timeout=0) == "gate-pvc-1"
+
+
+def test_lease_lasts_until_the_job_finishes(informer, pvc, pod, job):
+    add_claims(informer, pvc, "gate-pvc-0")
+    pool = PVCPool(informer, "gate")
+    claim = pool.acquire("exp-1")
+    informer.emit(JOBS, "ADDED", job("exp-1-abcde"))
+    pool.bind(claim, "exp-1-abcde")
+
+    # The job retries its failed pod on the same claim
+    first = pod("exp-1-abcde-1", claims=[claim], job="exp-1-abcde")
+    informer.emit(PODS, "ADDED", first)
+    informer.emit(PODS, "MODIFIED", {**first, "status": {"phase": "Failed"}})
+    assert pool.acquire("exp-2", timeout=0) is None
+
+    second = pod("exp-1-abcde-2", claims=[claim], job="exp-1-abcde")
+    informer.emit(PODS, "ADDED", second)
+    informer.emit(
+        PODS, "MODIFIED", {**second, "status": {"phase": "Succeeded"}}
+    )
+    assert pool.leases == {}
+    assert pool.acquire("exp-2", timeout=0) == claim
+
+
+def test_finished_or_deleted_jobs_release_their_claim(informer, pvc, job):
+    add_claims(informer, pvc, "gate-pvc-0", "gate-pvc-1")
+    pool = PVCPool(informer, "gate")
+    first, second = pool.acquire("exp-1"), pool.acquire("exp-2")
+    pool.bind(first, "job-1")
+    pool.bind(second, "job-2")
+    assert pool.busy == 2
+
+    informer.emit(JOBS, "MODIFIED", job("job-1", condition="Failed"))
+    informer.emit(JOBS, "DELETED", job("job-2"))
+    assert pool.busy == 0
+
+    # A job that finished before it was bound releases its claim at once
+    claim = pool.acquire("exp-3")
+    informer.emit(JOBS, "ADDED", job("job-3", condition="Complete"))
+    pool.bind(claim, "job-3")
+    assert pool.leases == {}
+
+
+def test_claims_mounted_by_other_pods_are_busy(informer, pvc, pod):
+    add_claims(informer, pvc, "gate-pvc-0", "gate-pvc-1")
+    other = pod("someone-else", claims=["gate-pvc-0"])
+    informer.emit(PODS, "ADDED", other)
+    pool = PVCPool(informer, "gate")
+    assert pool.busy == 1
+    assert pool.acquire("exp-1", max_busy=1, timeout=0) is None
+    assert pool.acquire("exp-1", timeout=0) == "gate-pvc-1"
+
+    informer.emit(PODS, "DELETED", other)
+    assert pool.acquire("exp-2", timeout=0) == "gate-pvc-0"
+
+
+def test_leases_are_restored(tmp_path, informer, pvc, job):
+    add_claims(informer, pvc, "gate-pvc-0", "gate-pvc-1", "gate-pvc-2")
+    path = tmp_path / "leases.json"
+    pool = PVCPool(informer, "gate", state_path=path)
+    running, finished = pool.acquire("exp-1"), pool.acquire("exp-2")
+    pool.bind(running, "job-1")
+    pool.bind(finished, "job-2")
+    pool.acquire("exp-3")
+    assert len(json.loads(path.read_text())) == 3
+
+    # Only the lease of the job still running survives a restart
+    informer.emit(JOBS, "ADDED", job("job-1"))
+    restarted = PVCPool(informer, "gate", state_path=path)
+    assert list(restarted.leases) == [running]
+    assert list(json.loads(path.read_text())) == [running]
+
+
+def test_resync_keeps_leases_of_jobs_not_reported_yet(informer, pvc, job):
+    add_claims(informer, pvc, "gate-pvc-0", "gate-pvc-1")
+    pool = PVCPool(informer, "gate")
+    claim = pool.acquire("exp-1")
+    pool.bind(claim, "exp-1-abcde")
+
+    # The job's watch event has not arrived when the launcher resyncs
+    pool.resync()
+    assert list(pool.leases) == [claim]
+    assert pool.acquire("exp-2", max_busy=1, timeout=0) is None
+
+    # Once reported, the job holds the lease until it is gone
+    informer.emit(JOBS, "ADDED", job("exp-1-abcde"))
+    pool.resync()
+    assert list(pool.leases) == [claim]
+    informer.jobs.delete(job("exp-1-abcde"))
+    pool.resync()
+    assert pool.leases == {}
+
+
+def test_unseen_jobs_lose_their_lease_after_the_grace(informer, pvc):
+    add_claims(informer, pvc, "gate-pvc-0")
+    pool = PVCPool(informer, "gate", unseen_job_grace=0)
+    pool.bind(pool.acquire("exp-1"), "exp-1-abcde")
+    pool.resync()
+    assert pool.leases == {}
+    assert pool.acquire("exp-2", timeout=0) == "gate-pvc-0"
@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from kubejobs.quantity import GIGABYTE, parse_quantities, parse_quantity
+
+
+@pytest.mark.parametrize(
+    "quantity, expected",
+    [
+        ("500m", 0.5),
+        ("100m", 0.1),
+        ("2", 2.0),
+        (" 4 ", 4.0),
+        ("1.5Gi", 1.5 * 2**30),
+        ("128Mi", 128 * 2**20),
+        ("1k", 1000.0),
+        ("1.5G", 1.5e9),
+        ("1E", 1e18),
+        ("1E3", 1000.0),
+        ("1e-3", 0.001),
+        ("250n", 250e-9),
+        (".5", 0.5),
+        ("+3", 3.0),
+        (2, 2.0),
+        (0.25, 0.25),
+    ],
+)
+def test_parse_quantity(quantity, expected):
+    assert parse_quantity(quantity) == pytest.approx(expected, rel=1e-12)
+
+
+@pytest.mark.parametrize("quantity", ["", "N/A", "1.5GB", "Gi", "1 Gi", True])
+def test_invalid_quantities(quantity):
+    with pytest.raises(ValueError):
+        parse_quantity(quantity)
+
+
+def test_parse_quantities_keeps_the_index():
+    requests = pd.Series(
+        ["1Gi", None, "2G", "1Gi", "N/A", np.nan], index=list("abcdef")
+    )
+    parsed = parse_quantities(requests, scale=GIGABYTE)
+    assert list(parsed.index) == list("abcdef")
+    assert parsed["a"] == parsed["d"] == pytest.approx(2**30 / GIGABYTE)
+    assert parsed["c"] == 2.0
+    assert parsed[["b", "e", "f"]].isna().all()
+
+
+def test_parse_quantities_of_an_iterable():
+    parsed = parse_quantities(iter(["500m", "2", None]))
+    assert isinstance(parsed, np.ndarray)
+    assert parsed[:2].tolist() == [0.5, 2.0]
+    assert math.isnan(parsed[2])
+    assert len(parse_quantities([])) == 0
@@ -0,0 +1,120 @@
+import pytest
+
+from kubejobs.experiments import queue as queue_module
+from kubejobs.experiments.queue import (
+    ATTEMPT_LABEL,
+    EXPERIMENT_LABEL,
+    FAILED,
+    PENDING,
+    RUNNING,
+    SUBMITTED,
+    SUCCEEDED,
+    SWEEP_LABEL,
+    ExperimentQueue,
+    label_value,
+)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = ExperimentQueue(tmp_path / "sweep.db")
+    yield queue
+    queue.close()
+
+
+def test_label_value():
+    assert label_value("exp-001") == "exp-001"
+    hashed = label_value("lr=1e-3 seed=0")
+    assert hashed == label_value("lr=1e-3 seed=0")
+    assert len(hashed) == 40 and hashed.isalnum()
+
+
+def test_add_is_idempotent(queue):
+    assert queue.add([("a", "run a"), ("b", "run b")]) == 2
+    assert queue.add([("a", "run a"), ("c", "run c")]) == 1
+    assert list(queue.pending(batch_size=2)) == [
+        ("a", "run a"),
+        ("b", "run b"),
+        ("c", "run c"),
+    ]
+    assert queue.labels("a") == {
+        SWEEP_LABEL: "sweep",
+        EXPERIMENT_LABEL: "a",
+        ATTEMPT_LABEL: "0",
+    }
+
+
+def test_stream_yields_each_experiment_as_it_is_read(queue):
+    queue.add([("old", "run old")])
+    read = []
+
+    def experiments():
+        for name in ("old", "a", "b"):
+            read.append(name)
+            yield name, f"run {name}"
+
+    stream = queue.stream(experiments())
+    assert next(stream) == ("old", "run old")
+    assert read == []
+    assert next(stream) == ("a", "run a")
+    # Already queued experiments are skipped, new ones are not waited on
+    assert read == ["old", "a"]
+    assert queue.counts()[PENDING] == 2
+    assert list(stream) == [("b", "run b")]
+
+
+def test_job_events_update_the_current_attempt(queue, job):
+    queue.add([("a", "run a")])
+    queue.mark_submitted("a", "a-xyz", "uid-a-xyz", "gate-pvc-0")
+    labels = queue.labels("a")
+    queue.update_from_job(job("a-xyz", labels=labels))
+    assert queue.counts()[SUBMITTED] == 1
+    queue.update_from_job(job("a-xyz", condition="Failed", labels=labels))
+    assert queue.counts()[FAILED] == 1
+
+    # Events of the failed attempt no longer count once requeued
+    assert queue.requeue() == 1
+    queue.update_from_job(job("a-xyz", condition="Failed", labels=labels))
+    assert queue.counts()[PENDING] == 1
+    assert queue.labels("a")[ATTEMPT_LABEL] == "1"
+
+
+def test_mark_submitted_keeps_later_states(queue, job):
+    queue.add([("a", "run a")])
+    queue.update_from_job(
+        job("a-xyz", condition="Complete", labels=queue.labels("a"))
+    )
+    queue.mark_submitted("a", "a-xyz", "uid-a-xyz", "gate-pvc-0")
+    assert queue.counts()[SUCCEEDED] == 1
+
+
+def test_reconcile(queue, job, monkeypatch):
+    queue.add([(name, f"run {name}") for name in "abcd"])
+    for name in "abc":
+        queue.mark_submitted(name, f"{name}-xyz", f"uid-{name}", None)
+    running = job("a-xyz", labels=queue.labels("a"))
+    running["status"]["active"] = 1
+    jobs = [
+        running,
+        job("b-xyz", condition="Complete", labels=queue.labels("b")),
+        # Created just before the launcher died, never recorded
+        job("d-xyz", labels=queue.labels("d")),
+    ]
+    monkeypatch.setattr(
+        queue_module, "list_items", lambda *args, **kwargs: iter(jobs)
+    )
+    monkeypatch.setattr(
+        queue_module,
+        "get_batch_api",
+        lambda: type("BatchApi", (), {"list_namespaced_job": None}),
+    )
+
+    counts = queue.reconcile(namespace="test")
+    # c's job is gone, so it failed
+    assert counts == {
+        PENDING: 0,
+        SUBMITTED: 1,
+        RUNNING: 1,
+        SUCCEEDED: 1,
+        FAILED: 1,
+    }
@@ -0,0 +1,96 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip("fire")
+
+from kubejobs.experiments.run_jobs import (  # noqa: E402
+    iter_commands_input,
+    iter_sweep_spec,
+    parse_commands_input,
+)
+
+
+def lines(text: str):
+    return io.StringIO(text)
+
+
+def test_plain_lines():
+    assert list(iter_commands_input(lines("run a\n\nrun b\r\n"))) == [
+        ("exp-001", "run a"),
+        ("exp-002", "run b"),
+    ]
+
+
+def test_json_lines():
+    text = '"run a"\n{"name": "b", "command": "run b"}\n{"command": "run c"}\n'
+    assert list(iter_commands_input(lines(text))) == [
+        ("exp-001", "run a"),
+        ("b", "run b"),
+        ("exp-003", "run c"),
+    ]
+
+
+def test_json_lines_of_named_commands():
+    text = '{"a": "run a"}\n{"b": "run b", "c": "run c"}\n"run d"\n'
+    assert list(iter_commands_input(lines(text))) == [
+        ("a", "run a"),
+        ("b", "run b"),
+        ("c", "run c"),
+        ("exp-004", "run d"),
+    ]
+
+
+def test_plain_lines_starting_with_a_json_string():
+    text = '"run a"\nrun b --x=1\ntrue\n'
+    assert list(iter_commands_input(lines(text))) == [
+        ("exp-001", "run a"),
+        ("exp-002", "run b --x=1"),
+        ("exp-003", "true"),
+    ]
+
+
+def test_json_documents():
+    commands = ["run a", "run b"]
+    assert parse_commands_input(json.dumps(commands, indent=2)) == {
+        "exp-001": "run a",
+        "exp-002": "run b",
+    }
+    named = {"x": "run x", "y": "run y"}
+    assert parse_commands_input(json.dumps(named, indent=2)) == named
+    assert parse_commands_input(json.dumps(named)) == named
+    assert parse_commands_input("") == {}
+
+
+def test_input_is_read_lazily():
+    read = []
+
+    def endless():
+        index = 0
+        while True:
+            index += 1
+            read.append(index)
+            yield f"run {index}\n"
+
+    experiments = iter_commands_input(endless())
+    assert next(experiments) == ("exp-001", "run 1")
+    assert next(experiments) == ("exp-002", "run 2")
+    assert len(read) == 2
+
+
+def test_sweep_spec(tmp_path, monkeypatch):
+    (tmp_path / "my_sweeps.py").write_text(
+        "def sweep():\n"
+        "    yield 'run a'\n"
+        "    yield ('b', 'run b')\n"
+        "    yield {'name': 'c', 'command': 'run c'}\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    assert list(iter_sweep_spec("my_sweeps:sweep")) == [
+        ("exp-001", "run a"),
+        ("b", "run b"),
+        ("c", "run c"),
+    ]
+    with pytest.raises(ValueError):
+        iter_sweep_spec("my_sweeps")
@@ -0,0 +1,132 @@
+import threading
+
+import pytest
+from kubernetes import client
+
+from kubejobs import submission
+from kubejobs.submission import (
+    RateLimiter,
+    SubmittedObject,
+    submit_manifests,
+    submit_with_retries,
+)
+
+
+class FakeClock:
+    """Stands in for time.monotonic and time.sleep."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(submission.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(submission.time, "sleep", clock.sleep)
+    return clock
+
+
+def failing(*statuses):
+    """A submit function failing with ``statuses`` before succeeding."""
+    statuses = list(statuses)
+
+    def submit(manifest):
+        if statuses:
+            raise client.ApiException(status=statuses.pop(0))
+        return SubmittedObject("job-abcde", "uid", "test", "Job")
+
+    return submit
+
+
+def test_rate_limiter_allows_a_burst_then_the_rate(clock):
+    # Powers of two keep the fake clock exact
+    limiter = RateLimiter(rate=4, burst=2)
+    for _ in range(2):
+        limiter.acquire()
+    assert clock.sleeps == []
+
+    for _ in range(8):
+        limiter.acquire()
+    assert clock.now == 2.0
+
+    # Idle time refills the bucket up to the burst only
+    clock.now += 60
+    for _ in range(2):
+        limiter.acquire()
+    assert clock.now == 62.0
+    limiter.acquire()
+    assert clock.now == 62.25
+
+
+def test_rate_limiter_is_shared_by_threads():
+    limiter = RateLimiter(rate=1000, burst=1)
+    acquired = []
+
+    def worker():
+        for _ in range(20):
+            limiter.acquire()
+            acquired.append(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(acquired) == 80
+    assert limiter._tokens < 1
+
+
+def test_rate_limiter_rejects_a_non_positive_rate():
+    with pytest.raises(ValueError):
+        RateLimiter(rate=0)
+
+
+def test_throttled_creates_are_retried(clock):
+    submitted, attempts = submit_with_retries(failing(429, 503), {})
+    assert submitted.name == "job-abcde"
+    assert attempts == 3
+    assert len(clock.sleeps) == 2
+
+
+@pytest.mark.parametrize("status", [500, 502, 504, 409])
+def test_creates_that_may_have_succeeded_are_not_retried(clock, status):
+    with pytest.raises(client.ApiException):
+        submit_with_retries(failing(status), {})
+    assert clock.sleeps == []
+
+
+def test_retries_are_bounded(clock):
+    with pytest.raises(client.ApiException):
+        submit_with_retries(failing(*[429] * 4), {}, max_retries=3)
+    assert len(clock.sleeps) == 3
+
+
+def test_submit_manifests_reports_errors_in_order(monkeypatch):
+    monkeypatch.setattr(submission, "get_api_client", lambda **kwargs: None)
+
+    def submit(manifest):
+        if manifest["fail"]:
+            raise client.ApiException(status=500, reason="Internal Error")
+        return SubmittedObject(manifest["name"], "uid", "test", "Job")
+
+    manifests = (
+        (f"run {i}", {"name": f"job-{i}", "fail": i % 3 == 0})
+        for i in range(10)
+    )
+    results = submit_manifests(manifests, submit, max_workers=3)
+    assert [result.command for result in results] == [
+        f"run {i}" for i in range(10)
+    ]
+    assert [result.error for result in results if result.error] == [
+        "500 Internal Error"
+    ] * 4
+    assert results[1].name == "job-1"
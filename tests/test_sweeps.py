@@ -0,0 +1,105 @@
+import itertools
+
+import pytest
+
+from kubejobs.sweeps import (
+    Chain,
+    Choice,
+    Dimension,
+    Grid,
+    IntUniform,
+    LatinHypercube,
+    LogUniform,
+    Random,
+    Sweep,
+    Uniform,
+    Zip,
+    experiment_name,
+    to_flags,
+)
+
+
+def test_grid_follows_itertools_product():
+    grid = Grid(lr=[1e-3, 1e-4], batch_size=[32, 64, 128], model="vit")
+    expected = [
+        {"lr": lr, "batch_size": batch_size, "model": "vit"}
+        for lr, batch_size in itertools.product([1e-3, 1e-4], [32, 64, 128])
+    ]
+    assert len(grid) == 6
+    assert list(grid) == expected
+    assert grid[-1] == expected[-1]
+    with pytest.raises(IndexError):
+        grid[6]
+
+
+def test_combinations():
+    seeds = Grid(seed=range(3))
+    lrs = Zip(lr=[1e-3, 1e-4], warmup=[100, 1000, 10000], model="vit")
+    product = lrs * seeds
+    assert len(product) == 6
+    assert product[4] == {
+        "lr": 1e-4,
+        "warmup": 1000,
+        "model": "vit",
+        "seed": 1,
+    }
+    chain = seeds + Grid(seed=[10])
+    assert [params["seed"] for params in chain] == [0, 1, 2, 10]
+    assert len(Grid() * seeds) == 3
+
+
+def test_shards_cover_the_sweep_once():
+    sweep = Grid(a=range(5), b=range(3))
+    shards = [sweep.shard(index, 4) for index in range(4)]
+    assert sum(len(shard) for shard in shards) == len(sweep)
+    items = [params for shard in shards for params in shard]
+    assert sorted(items, key=lambda p: (p["a"], p["b"])) == list(sweep)
+    with pytest.raises(ValueError):
+        sweep.shard(4, 4)
+
+
+def test_random_draws_are_reproducible():
+    params = dict(lr=LogUniform(1e-5, 1e-2), layers=IntUniform(2, 4))
+    draws = list(Random(20, seed=1, **params))
+    assert draws == list(Random(20, seed=1, **params))
+    assert draws[7] == Random(20, seed=1, **params)[7]
+    assert draws != list(Random(20, seed=2, **params))
+    assert all(1e-5 <= draw["lr"] <= 1e-2 for draw in draws)
+    assert {draw["layers"] for draw in draws} == {2, 3, 4}
+
+
+def test_latin_hypercube_fills_every_stratum():
+    samples = 16
+    sweep = LatinHypercube(
+        samples, seed=3, x=Uniform(0, 1), y=Uniform(0, 1), z=Choice("ab")
+    )
+    for name in "xy":
+        strata = sorted(int(params[name] * samples) for params in sweep)
+        assert strata == list(range(samples))
+    assert sorted(params["z"] for params in sweep) == ["a"] * 8 + ["b"] * 8
+
+
+def test_commands_and_experiments():
+    sweep = Grid(lr=[0.1], name="a b")
+    assert list(sweep.commands("python train.py {flags}")) == [
+        "python train.py --lr=0.1 --name='a b'"
+    ]
+    assert list(sweep.commands(lambda params: f"run {params['lr']}")) == [
+        "run 0.1"
+    ]
+    ((name, command),) = sweep.experiments("train --lr={lr}", prefix="lr")
+    assert command == "train --lr=0.1"
+    assert name == experiment_name({"name": "a b", "lr": 0.1}, prefix="lr")
+    assert to_flags({"x": 1}) == "--x=1"
+
+
+def test_bases_are_abstract():
+    with pytest.raises(TypeError):
+        Sweep()
+    with pytest.raises(TypeError):
+        Dimension()
+    with pytest.raises(ValueError):
+        Choice([])
+    with pytest.raises(ValueError):
+        LogUniform(0, 1)
+    assert Chain(Grid(a=[1])).shard(0, 1)[0] == {"a": 1}
@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+from rich.console import Console
+
+from kubejobs.tables import (
+    POD_COLUMNS,
+    flatten,
+    format_durations,
+    job_table,
+    pod_table,
+    rich_table,
+)
+
+NOW = datetime(2024, 5, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+
+def test_flatten_reaches_into_lists(pod):
+    bare = {"metadata": {"name": "bare"}, "spec": {"containers": []}}
+    frame = flatten([pod("a"), bare], POD_COLUMNS)
+    assert list(frame.columns) == list(POD_COLUMNS)
+    assert frame["Name"].tolist() == ["a", "bare"]
+    assert frame["Image"][0] == "busybox"
+    assert frame.loc[1, ["Image", "Status", "GPU Limit"]].isna().all()
+
+
+def test_format_durations():
+    durations = pd.Series(
+        [pd.Timedelta(days=1, hours=2, minutes=3, seconds=4), pd.NaT]
+    )
+    assert format_durations(durations).tolist() == ["1d 2h 3m 4s", "N/A"]
+
+
+def test_pod_table_is_typed(pod):
+    frame = pod_table([pod("a", gpus=2), pod("b", phase="Pending")], NOW)
+    assert frame.columns.get_loc("Age") == (
+        frame.columns.get_loc("Creation Time") + 1
+    )
+    assert frame["Age"].tolist() == ["1d 3h 4m 5s"] * 2
+    assert frame["CPU Request"].tolist() == [0.5, 0.5]
+    assert frame["Memory Request"][0] == 1.5 * 2**30 / 1e9
+    assert frame["GPU Limit"].tolist() == [2.0, 1.0]
+    assert str(frame["Creation Time"].dt.tz) == "UTC"
+
+
+def test_job_table_is_typed(job):
+    finished = job("a")
+    finished["status"].update({"failed": 1, "succeeded": 1})
+    frame = job_table([finished, job("b")], NOW)
+    assert frame["Completions"].tolist() == [1, 1]
+    assert frame["Failed"].tolist() == [1, pd.NA]
+    assert frame["Failed"].dtype == "Int64"
+    assert frame["CPU Request"].isna().all()
+
+
+def test_rich_table(pod):
+    frame = pod_table([pod(f"pod-{i}") for i in range(5)], NOW)
+    table = rich_table(frame, ["Name", "GPU Limit", "Node"], max_rows=3)
+    assert [column.header for column in table.columns] == [
+        "Name",
+        "GPU Limit",
+        "Node",
+    ]
+    assert table.row_count == 3
+    assert table.caption == "2 more rows not shown"
+
+    console = Console(width=120, record=True)
+    frame.loc[0, "Node"] = None
+    console.print(rich_table(frame, ["Name", "Node"]))
+    output = console.export_text()
+    assert "pod-4" in output and "N/A" in output